@@ -0,0 +1,22 @@
+# Configuración de gunicorn (se carga sola desde este directorio).
+#
+# Métricas de Prometheus con varios workers: cada proceso escribe las suyas en
+# PROMETHEUS_MULTIPROC_DIR y /metrics las suma (ver tienda/instrumentacion.py).
+# La variable debe existir antes de que los workers importen prometheus_client.
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'tienda_prometheus'))
+
+
+def on_starting(server):
+    # Los archivos de una ejecución anterior sumarían contadores viejos
+    directorio = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -3,7 +3,12 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.http import urlencode
 from django import forms
-from .models import Categoria, Producto, Insumo, Pedido, ImagenReferencia
+from django.db.models import Count
+from django.contrib import messages
+from .models import ESTADOS_EN_CURSO, Categoria, Producto, Insumo, InsumoProducto, MovimientoStock, Pedido, PedidoEvento, ImagenReferencia
+from .imagenes import url_miniatura
+from .stock import STOCK_BAJO, AjusteRechazado, StockInsuficiente, ajustar_stock, bajo_stock
+from .transiciones import permitida, transicionar
 
 # ============================================
 # FORMULARIO PERSONALIZADO PARA PEDIDOS
@@ -17,6 +22,25 @@ class PedidoAdminForm(forms.ModelForm):
             'notas_internas': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def _validar_transicion(self, campo):
+        # Mismas reglas que las acciones en lote (tienda/transiciones.py)
+        nuevo = self.cleaned_data[campo]
+        if self.instance._state.adding:
+            return nuevo
+        anterior = self.instance._estados_originales.get(campo, nuevo)
+        if anterior != nuevo and not permitida(campo, anterior, nuevo):
+            estados = dict(Pedido._meta.get_field(campo).choices)
+            raise forms.ValidationError(
+                f'No se puede pasar de "{estados.get(anterior, anterior)}" a "{estados.get(nuevo, nuevo)}".'
+            )
+        return nuevo
+
+    def clean_estado_pedido(self):
+        return self._validar_transicion('estado_pedido')
+
+    def clean_estado_pago(self):
+        return self._validar_transicion('estado_pago')
+
 # ============================================
 # CATEGORÍA
 # ============================================
@@ -29,8 +53,12 @@ class CategoriaAdmin(admin.ModelAdmin):
         return obj.descripcion[:50] + '...' if len(obj.descripcion) > 50 else obj.descripcion
     descripcion_corta.short_description = 'Descripción'
     
+    def get_queryset(self, request):
+        # El conteo sale en la misma consulta del listado (no uno por fila)
+        return super().get_queryset(request).annotate(num_productos=Count('producto'))
+
     def cantidad_productos(self, obj):
-        count = obj.producto_set.count()
+        count = obj.num_productos
         url = (
             reverse('admin:tienda_producto_changelist')
             + '?'
@@ -38,6 +66,23 @@ class CategoriaAdmin(admin.ModelAdmin):
         )
         return format_html('<a href="{}">{}</a>', url, count)
     cantidad_productos.short_description = 'Productos'
+    cantidad_productos.admin_order_field = 'num_productos'
+
+# ============================================
+# INSUMOS DEL PRODUCTO INLINE
+# ============================================
+class InsumoProductoInline(admin.TabularInline):
+    model = InsumoProducto
+    extra = 1
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        campo = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'insumo':
+            # Las opciones se leen una vez por petición y las comparten todas las filas
+            if not hasattr(request, '_opciones_insumo'):
+                request._opciones_insumo = [opcion for opcion in campo.choices]
+            campo.choices = request._opciones_insumo
+        return campo
 
 # ============================================
 # PRODUCTO
@@ -48,16 +93,34 @@ class ProductoAdmin(admin.ModelAdmin):
     list_filter = ['categoria', 'activo']
     search_fields = ['nombre', 'descripcion']
     list_editable = ['activo', 'precio_base']
+    inlines = [InsumoProductoInline]
     
     def imagen_preview(self, obj):
         if obj.imagen_1:
-            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', obj.imagen_1.url)
+            return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', url_miniatura(obj.imagen_1))
         return "Sin imagen"
     imagen_preview.short_description = 'Imagen'
 
 # ============================================
 # INSUMO
 # ============================================
+class NivelStockFilter(admin.SimpleListFilter):
+    # Consultas por rango sobre insumo_cantidad_idx
+    title = 'nivel de stock'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return [('sin', 'Sin stock'), ('bajo', 'Bajo stock'), ('ok', 'En stock')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'sin':
+            return queryset.filter(cantidad_disponible__lte=0)
+        if self.value() == 'bajo':
+            return bajo_stock(queryset)
+        if self.value() == 'ok':
+            return queryset.filter(cantidad_disponible__gte=STOCK_BAJO)
+        return queryset
+
 @admin.register(Insumo)
 class InsumoAdmin(admin.ModelAdmin):
     # ✅ ACTUALIZADO: Agregar marca y color
@@ -72,7 +135,7 @@ class InsumoAdmin(admin.ModelAdmin):
     ]
     
     # ✅ ACTUALIZADO: Agregar marca a los filtros
-    list_filter = ['tipo', 'unidad', 'marca']
+    list_filter = [NivelStockFilter, 'tipo', 'unidad', 'marca']
     
     # ✅ ACTUALIZADO: Agregar marca y color a la búsqueda
     search_fields = ['nombre', 'tipo', 'marca', 'color']
@@ -101,12 +164,76 @@ class InsumoAdmin(admin.ModelAdmin):
     def estado_stock(self, obj):
         if obj.cantidad_disponible == 0:
             return format_html('<span style="color: red;">⏹️ Sin stock</span>')
-        elif obj.cantidad_disponible < 10:
+        elif obj.cantidad_disponible < STOCK_BAJO:
             return format_html('<span style="color: orange;">⚠️ Bajo stock</span>')
         else:
             return format_html('<span style="color: green;">✅ En stock</span>')
     estado_stock.short_description = 'Estado'
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        campo = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if db_field.name == 'cantidad_disponible':
+            # El formulario recuerda el stock que vio el usuario al abrirlo
+            campo.show_hidden_initial = True
+        return campo
+
+    def save_model(self, request, obj, form, change):
+        # El stock nunca se sobrescribe: lo editado se aplica como variación
+        # sobre el valor que vio el usuario (si otro lo cambió mientras tanto,
+        # no se pierde) y queda en el libro de movimientos
+        if not change:
+            super().save_model(request, obj, form, change)
+            if obj.cantidad_disponible:
+                MovimientoStock.objects.create(
+                    insumo=obj, cantidad=obj.cantidad_disponible, saldo=obj.cantidad_disponible,
+                    motivo='inicial', usuario=request.user
+                )
+            return
+
+        otros = [campo for campo in form.changed_data if campo != 'cantidad_disponible']
+        if otros:
+            obj.save(update_fields=otros)
+        if 'cantidad_disponible' not in form.changed_data:
+            return
+
+        try:
+            visto = int(form.data[form.add_initial_prefix('cantidad_disponible')])
+        except (KeyError, TypeError, ValueError):
+            visto = form.initial['cantidad_disponible']
+        variacion = form.cleaned_data['cantidad_disponible'] - visto
+        if not variacion:
+            return
+        try:
+            resultado = ajustar_stock(
+                [{'insumo': obj.pk, 'cantidad': variacion}], 'ajuste', usuario=request.user, nota='Admin'
+            )
+        except AjusteRechazado as e:
+            self.message_user(request, f'{obj.nombre}: {e.errores[obj.pk]}', level=messages.ERROR)
+            obj.refresh_from_db(fields=['cantidad_disponible', 'version'])
+        else:
+            obj.cantidad_disponible, obj.version = resultado[obj.pk]
+
+
+# ============================================
+# LIBRO DE MOVIMIENTOS DE STOCK (solo lectura)
+# ============================================
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'insumo', 'cantidad', 'saldo', 'motivo', 'pedido', 'usuario', 'nota']
+    list_filter = ['motivo', 'fecha']
+    search_fields = ['insumo__nombre', 'nota']
+    list_select_related = ['insumo', 'usuario', 'pedido']
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # ============================================
 # IMAGEN REFERENCIA INLINE
 # ============================================
@@ -115,9 +242,44 @@ class ImagenReferenciaInline(admin.TabularInline):
     extra = 1
     readonly_fields = ['fecha_subida']
 
+    def get_queryset(self, request):
+        # Cada fila muestra str(imagen), que incluye el pedido
+        return super().get_queryset(request).select_related('pedido')
+
+# ============================================
+# HISTORIAL DE ESTADOS (solo lectura)
+# ============================================
+class PedidoEventoInline(admin.TabularInline):
+    model = PedidoEvento
+    extra = 0
+    fields = ['fecha', 'campo', 'estado_anterior', 'estado_nuevo', 'usuario', 'nota']
+    readonly_fields = fields
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('usuario')
+
 # ============================================
 # PEDIDO - VERSIÓN SIN UUID
 # ============================================
+class EnCursoFilter(admin.SimpleListFilter):
+    # "En curso" usa el índice parcial pedido_en_curso_idx
+    title = 'en curso'
+    parameter_name = 'en_curso'
+
+    def lookups(self, request, model_admin):
+        return [('si', 'En curso'), ('no', 'Cerrados')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'si':
+            return queryset.filter(estado_pedido__in=ESTADOS_EN_CURSO)
+        if self.value() == 'no':
+            return queryset.exclude(estado_pedido__in=ESTADOS_EN_CURSO)
+        return queryset
+
 @admin.register(Pedido)
 class PedidoAdmin(admin.ModelAdmin):
     form = PedidoAdminForm
@@ -133,6 +295,7 @@ class PedidoAdmin(admin.ModelAdmin):
     ]
     
     list_filter = [
+        EnCursoFilter,
         'estado_pedido', 
         'estado_pago', 
         'plataforma',
@@ -153,7 +316,9 @@ class PedidoAdmin(admin.ModelAdmin):
     ]
     
     list_editable = ['estado_pedido', 'estado_pago']
-    inlines = [ImagenReferenciaInline]
+    # Sin el "(N en total)" junto a los filtros: sería un COUNT de toda la tabla en cada página
+    show_full_result_count = False
+    inlines = [ImagenReferenciaInline, PedidoEventoInline]
     
     fieldsets = (
         ('Información del Cliente', {
@@ -181,22 +346,58 @@ class PedidoAdmin(admin.ModelAdmin):
         return str(obj.token_seguimiento) if obj.token_seguimiento else ''
     token_corto.short_description = 'Token'
 
-    # ✅ ACCIONES SIMPLES (del primer código, adaptadas)
+    def get_changelist_form(self, request, **kwargs):
+        # La lista editable valida los cambios de estado igual que el formulario
+        kwargs.setdefault('form', PedidoAdminForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        # Para registrar quién cambió el estado en el historial
+        obj._usuario_cambio = request.user
+        try:
+            super().save_model(request, obj, form, change)
+        except StockInsuficiente as e:
+            # El pedido se guarda con el resto de los cambios pero sin pasar de estado
+            nombres = dict(Insumo.objects.filter(pk__in=e.faltantes).values_list('pk', 'nombre'))
+            detalle = ', '.join(f'{nombres[pk]} (faltan {cantidad})' for pk, cantidad in e.faltantes.items())
+            self.message_user(request, f'Pedido #{obj.pk}: no hay insumos suficientes: {detalle}', level=messages.ERROR)
+            obj.estado_pedido = obj._estados_originales['estado_pedido']
+            super().save_model(request, obj, form, change)
+
+    # ✅ ACCIONES: validan el cambio de estado y lo registran en el historial
     actions = ['marcar_como_aprobado', 'marcar_como_en_proceso', 'marcar_pago_como_pagado']
     
+    def _transicionar(self, request, queryset, campo, destino, verbo):
+        resultado = transicionar(queryset, campo, destino, usuario=request.user)
+        self.message_user(request, f'{len(resultado)} pedidos {verbo}.')
+        if resultado.rechazados:
+            estados = dict(Pedido._meta.get_field(campo).choices)
+            detalle = ', '.join(f'#{pk} ({estados.get(origen, origen)})' for pk, origen in list(resultado.rechazados.items())[:20])
+            self.message_user(
+                request,
+                f'{len(resultado.rechazados)} pedidos no se pueden pasar a "{estados[destino]}" desde su estado actual: {detalle}',
+                level=messages.WARNING
+            )
+        if resultado.sin_stock:
+            insumos = {pk for faltantes in resultado.sin_stock.values() for pk in faltantes}
+            nombres = ', '.join(Insumo.objects.filter(pk__in=insumos).order_by('nombre').values_list('nombre', flat=True))
+            detalle = ', '.join(f'#{pk}' for pk in list(resultado.sin_stock)[:20])
+            self.message_user(
+                request,
+                f'{len(resultado.sin_stock)} pedidos no tienen insumos suficientes ({nombres}): {detalle}',
+                level=messages.WARNING
+            )
+
     def marcar_como_aprobado(self, request, queryset):
-        updated = queryset.update(estado_pedido='aprobado')
-        self.message_user(request, f'{updated} pedidos aprobados.')
+        self._transicionar(request, queryset, 'estado_pedido', 'aprobado', 'aprobados')
     marcar_como_aprobado.short_description = "Marcar como Aprobado"
     
     def marcar_como_en_proceso(self, request, queryset):
-        updated = queryset.update(estado_pedido='en_proceso')
-        self.message_user(request, f'{updated} pedidos en proceso.')
+        self._transicionar(request, queryset, 'estado_pedido', 'en_proceso', 'en proceso')
     marcar_como_en_proceso.short_description = "Marcar como En Proceso"
     
     def marcar_pago_como_pagado(self, request, queryset):
-        updated = queryset.update(estado_pago='pagado')
-        self.message_user(request, f'{updated} pedidos marcados como pagados.')
+        self._transicionar(request, queryset, 'estado_pago', 'pagado', 'marcados como pagados')
     marcar_pago_como_pagado.short_description = "Marcar pago como Pagado"
 
 # ============================================
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class TiendaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tienda'
+
+    def ready(self):
+        # Registrar las señales (índice de búsqueda, etc.)
+        from . import signals  # noqa: F401
+
+        from django.conf import settings
+        if getattr(settings, 'METRICAS_PLANTILLAS', True):
+            from .instrumentacion import instrumentar_plantillas
+            instrumentar_plantillas()
@@ -0,0 +1,267 @@
+"""
+Motor de búsqueda del catálogo.
+
+Mantiene una tabla índice aparte de ``tienda_producto``:
+
+- SQLite: tabla virtual FTS5 (ranking con bm25).
+- PostgreSQL: columna ``tsvector`` con índice GIN (ranking con ts_rank_cd).
+
+El texto se normaliza en Python antes de indexarlo (minúsculas, sin tildes y
+con una raíz simple para español), así "polera", "Poleras" y "pólera"
+terminan en el mismo término en ambos motores. Si la base de datos no soporta
+ninguno de los dos, se vuelve al filtro ``icontains`` de siempre.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+TABLA_INDICE = 'tienda_producto_fts'
+
+# Cantidad máxima de resultados que devuelve el índice por consulta
+MAX_RESULTADOS = 500
+
+PALABRAS_VACIAS = {
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'para', 'por', 'su', 'sus', 'un', 'una', 'y', 'o',
+}
+
+_disponible = None
+
+
+# ============================================
+# NORMALIZACIÓN DE TEXTO
+# ============================================
+
+def plegar(texto):
+    """Pasa el texto a minúsculas y le quita tildes y diéresis"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def raiz(palabra):
+    """Raíz muy simple para español: quita plurales y la vocal de género"""
+    if len(palabra) > 4 and palabra.endswith('ces'):
+        palabra = palabra[:-3] + 'z'
+    elif len(palabra) > 4 and palabra.endswith('es') and palabra[-3] not in 'aeiou':
+        palabra = palabra[:-2]
+    elif len(palabra) > 3 and palabra.endswith('s'):
+        palabra = palabra[:-1]
+
+    if len(palabra) > 4 and palabra[-1] in 'aeo':
+        palabra = palabra[:-1]
+    return palabra
+
+
+def terminos(texto):
+    """Lista de términos indexables de un texto"""
+    palabras = re.findall(r'[a-z0-9]+', plegar(texto))
+    return [raiz(p) for p in palabras if p not in PALABRAS_VACIAS]
+
+
+def documento(texto):
+    return ' '.join(terminos(texto))
+
+
+# ============================================
+# DISPONIBILIDAD DEL ÍNDICE
+# ============================================
+
+def crear_indice(conexion):
+    """Crea la tabla índice según el motor. Devuelve False si no se puede"""
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_INDICE} "
+                    f"USING fts5(nombre, descripcion, tokenize='unicode61 remove_diacritics 2')"
+                )
+            except Exception:
+                # SQLite compilado sin FTS5
+                return False
+            return True
+
+        if conexion.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLA_INDICE} ("
+                f"producto_id bigint PRIMARY KEY REFERENCES tienda_producto(id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"documento tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABLA_INDICE}_documento "
+                f"ON {TABLA_INDICE} USING GIN (documento)"
+            )
+            return True
+
+    return False
+
+
+def eliminar_indice(conexion):
+    if conexion.vendor in ('sqlite', 'postgresql'):
+        with conexion.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLA_INDICE}")
+
+
+def indice_disponible():
+    """Indica si existe la tabla índice en la base de datos actual"""
+    global _disponible
+    if _disponible is None:
+        if connection.vendor in ('sqlite', 'postgresql'):
+            _disponible = TABLA_INDICE in connection.introspection.table_names()
+        else:
+            _disponible = False
+    return _disponible
+
+
+# ============================================
+# ACTUALIZACIÓN DEL ÍNDICE
+# ============================================
+
+def indexar_filas(filas, conexion=None):
+    """
+    Indexa filas ``(id, nombre, descripcion)``. Se usa para la carga inicial,
+    la reconstrucción completa y desde las señales de Producto.
+    """
+    conexion = conexion or connection
+    filas = [(pk, documento(nombre), documento(descripcion)) for pk, nombre, descripcion in filas]
+    if not filas:
+        return
+
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            cursor.executemany(
+                f"DELETE FROM {TABLA_INDICE} WHERE rowid = %s",
+                [(pk,) for pk, _, _ in filas]
+            )
+            cursor.executemany(
+                f"INSERT INTO {TABLA_INDICE} (rowid, nombre, descripcion) VALUES (%s, %s, %s)",
+                filas
+            )
+        elif conexion.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {TABLA_INDICE} (producto_id, documento) VALUES ("
+                f"%s, setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'B')) "
+                f"ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento",
+                filas
+            )
+
+
+def desindexar(ids, conexion=None):
+    conexion = conexion or connection
+    ids = [(pk,) for pk in ids]
+    if not ids:
+        return
+
+    columna = 'rowid' if conexion.vendor == 'sqlite' else 'producto_id'
+    with conexion.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLA_INDICE} WHERE {columna} = %s", ids)
+
+
+def indexar_producto(producto):
+    """Actualiza el índice para un producto recién guardado"""
+    if not indice_disponible():
+        return
+    if producto.activo:
+        indexar_filas([(producto.pk, producto.nombre, producto.descripcion)])
+    else:
+        desindexar([producto.pk])
+
+
+def reconstruir_indice(queryset=None, lote=2000):
+    """Vacía el índice y lo vuelve a llenar con los productos activos"""
+    from .models import Producto
+
+    if not indice_disponible():
+        return 0
+
+    if queryset is None:
+        queryset = Producto.objects.filter(activo=True)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_INDICE}")
+
+    total = 0
+    filas = []
+    for fila in queryset.values_list('id', 'nombre', 'descripcion').iterator(chunk_size=lote):
+        filas.append(fila)
+        if len(filas) >= lote:
+            indexar_filas(filas)
+            total += len(filas)
+            filas = []
+    indexar_filas(filas)
+    return total + len(filas)
+
+
+# ============================================
+# CONSULTAS
+# ============================================
+
+def _filtro_categoria(columna, categoria_id):
+    """JOIN y condición para quedarse con los productos de una categoría"""
+    from .models import Producto
+
+    if categoria_id is None:
+        return '', '', []
+    tabla = connection.ops.quote_name(Producto._meta.db_table)
+    return (
+        f"JOIN {tabla} ON {tabla}.id = {TABLA_INDICE}.{columna} ",
+        f"AND {tabla}.categoria_id = %s ",
+        [categoria_id],
+    )
+
+
+def buscar_ids(busqueda, limite=MAX_RESULTADOS, categoria_id=None):
+    """
+    Devuelve los ids de productos que calzan con la búsqueda, ordenados por
+    relevancia. Con ``categoria_id`` el filtro se aplica en la misma consulta,
+    antes del límite. Devuelve None si no hay índice disponible.
+    """
+    if not indice_disponible():
+        return None
+
+    lista = terminos(busqueda)
+    if not lista:
+        return []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            union, condicion, parametros = _filtro_categoria('rowid', categoria_id)
+            consulta = ' '.join(f'{t}*' for t in lista)
+            cursor.execute(
+                f"SELECT {TABLA_INDICE}.rowid FROM {TABLA_INDICE} {union}"
+                f"WHERE {TABLA_INDICE} MATCH %s {condicion}"
+                f"ORDER BY bm25({TABLA_INDICE}, 10.0, 1.0), {TABLA_INDICE}.rowid LIMIT %s",
+                [consulta, *parametros, limite]
+            )
+        else:
+            union, condicion, parametros = _filtro_categoria('producto_id', categoria_id)
+            consulta = ' & '.join(f'{t}:*' for t in lista)
+            cursor.execute(
+                f"SELECT {TABLA_INDICE}.producto_id FROM {TABLA_INDICE} {union}"
+                f"WHERE documento @@ to_tsquery('simple', %s) {condicion}"
+                f"ORDER BY ts_rank_cd(documento, to_tsquery('simple', %s)) DESC, {TABLA_INDICE}.producto_id "
+                f"LIMIT %s",
+                [consulta, *parametros, consulta, limite]
+            )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def buscar_productos(queryset, busqueda):
+    """
+    Filtra un queryset de Producto por la búsqueda y devuelve una lista
+    ordenada por relevancia.
+    """
+    ids = buscar_ids(busqueda)
+    if ids is None:
+        return list(queryset.filter(
+            Q(nombre__icontains=busqueda) |
+            Q(descripcion__icontains=busqueda)
+        ))
+
+    # Ordenar en Python: un CASE con cientos de WHEN cuesta más que la consulta
+    posiciones = {pk: posicion for posicion, pk in enumerate(ids)}
+    productos = queryset.filter(pk__in=ids)
+    return sorted(productos, key=lambda producto: posiciones[producto.pk])
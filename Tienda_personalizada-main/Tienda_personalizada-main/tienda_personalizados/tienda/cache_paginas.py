@@ -0,0 +1,158 @@
+"""
+Caché de páginas completas para la tienda.
+
+Las vistas públicas (inicio, catálogo, detalle) se guardan ya renderizadas,
+con clave según la ruta y los parámetros ``categoria``/``q``/``page`` (más
+``orden``/``cursor`` de la paginación). Cada vista marca su respuesta con
+claves sustitutas en la cabecera ``Surrogate-Key`` (por ejemplo
+``producto:3 categoria:1``). Cada clave sustituta tiene un contador de
+versión en el caché y la página guarda la versión de cada una de las suyas;
+purgar incrementa el contador, así que las páginas guardadas con la versión
+anterior dejan de servirse. Al editar un producto o una categoría solo se
+invalidan las páginas afectadas, sin listas de páginas compartidas que dos
+renders a la vez puedan pisarse.
+
+Una página que se renderizó mientras se purgaba algo no se guarda: pudo
+leer datos de antes del cambio (ver ``_CLAVE_PURGAS``).
+
+Funciona con cualquier backend de caché de Django (memoria local, archivos,
+Redis, ...).
+"""
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PARAMETROS_CLAVE = ('categoria', 'q', 'page', 'orden', 'cursor')
+CABECERA = 'Surrogate-Key'
+
+# Contador de purgas (de cualquier etiqueta). Si cambia mientras se renderiza
+# una página, la página no se guarda
+_CLAVE_PURGAS = 'tienda:purgas'
+
+
+def _cache():
+    return caches[getattr(settings, 'CACHE_PAGINAS_ALIAS', 'default')]
+
+
+def _duracion():
+    return getattr(settings, 'CACHE_PAGINAS_SEGUNDOS', 600)
+
+
+def clave_pagina(request):
+    parametros = [(p, request.GET.get(p)) for p in PARAMETROS_CLAVE if request.GET.get(p)]
+    ruta = request.path + '?' + urlencode(parametros)
+    return 'tienda:pagina:' + hashlib.md5(ruta.encode()).hexdigest()
+
+
+def _clave_etiqueta(etiqueta):
+    return 'tienda:sk:' + etiqueta
+
+
+def etiquetar(response, *etiquetas):
+    """Agrega claves sustitutas a la respuesta"""
+    actuales = response.get(CABECERA, '').split()
+    response[CABECERA] = ' '.join(dict.fromkeys(actuales + [str(e) for e in etiquetas]))
+    return response
+
+
+def _se_puede_cachear(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Los mensajes pendientes se muestran en la página: no se debe servir una
+    # copia sin ellos ni guardar una copia con ellos.
+    return len(messages.get_messages(request)) == 0
+
+
+def _contador(cache, clave):
+    """
+    Valor actual del contador, creándolo si no existe. Empieza en la hora en
+    nanosegundos: si el caché lo descarta y se vuelve a crear, no coincide con
+    el que guardaron las páginas viejas.
+    """
+    valor = cache.get(clave)
+    if valor is None:
+        cache.add(clave, time.time_ns(), None)
+        valor = cache.get(clave)
+    return valor
+
+
+def _versiones(cache, etiquetas):
+    """``{clave de la etiqueta: versión}`` de las etiquetas"""
+    claves = [_clave_etiqueta(etiqueta) for etiqueta in etiquetas]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            versiones[clave] = _contador(cache, clave)
+    return versiones
+
+
+def _vigente(cache, guardada):
+    """True si ninguna etiqueta de la página se purgó desde que se guardó"""
+    versiones = guardada['versiones']
+    return cache.get_many(list(versiones)) == versiones
+
+
+def _guardar(clave, response, purgas):
+    cache = _cache()
+    if cache.get(_CLAVE_PURGAS) != purgas:
+        # Se purgó algo durante el render: la página pudo leer datos viejos
+        return
+    cache.set(clave, {
+        'contenido': response.content,
+        'estado': response.status_code,
+        'cabeceras': dict(response.items()),
+        'versiones': _versiones(cache, response.get(CABECERA, '').split()),
+    }, _duracion())
+
+
+def _incrementar(cache, clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # No existía: las páginas que la usaban ya no coinciden con ninguna versión
+        pass
+
+
+def purgar(*etiquetas):
+    """Invalida todas las páginas marcadas con alguna de las etiquetas"""
+    cache = _cache()
+    _incrementar(cache, _CLAVE_PURGAS)
+    for etiqueta in dict.fromkeys(str(e) for e in etiquetas):
+        _incrementar(cache, _clave_etiqueta(etiqueta))
+
+
+def cache_pagina(vista):
+    """Decorador para vistas públicas que se pueden servir desde el caché"""
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if not _se_puede_cachear(request):
+            return vista(request, *args, **kwargs)
+
+        cache = _cache()
+        clave = clave_pagina(request)
+        guardada = cache.get(clave)
+        if guardada is not None and _vigente(cache, guardada):
+            response = HttpResponse(guardada['contenido'], status=guardada['estado'])
+            for nombre, valor in guardada['cabeceras'].items():
+                response[nombre] = valor
+            response['X-Cache'] = 'HIT'
+            return response
+
+        purgas = _contador(cache, _CLAVE_PURGAS)
+        response = vista(request, *args, **kwargs)
+        if (response.status_code == 200 and not response.streaming
+                and not response.cookies and CABECERA in response):
+            _guardar(clave, response, purgas)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return envoltura
@@ -0,0 +1,256 @@
+"""
+Exportación de pedidos filtrados a CSV o XLSX.
+
+Los pedidos se leen con ``values_list(...).iterator(chunk_size=...)``, así
+que la memoria no crece con la cantidad de pedidos. El CSV se envía a medida
+que se escribe (``StreamingHttpResponse``): el primer byte sale enseguida.
+
+El XLSX no se puede enviar antes de cerrarlo: se arma completo con XlsxWriter
+en modo ``constant_memory`` sobre un archivo temporal y recién entonces se
+envía por trozos, así que el tiempo hasta el primer byte crece con las filas.
+Por eso se limita a ``XLSX_MAXIMO_FILAS`` pedidos (``XlsxDemasiadoGrande``);
+para más hay que exportar a CSV. Si el límite se sube por encima del máximo
+de filas de Excel, se sigue en una hoja nueva. Con ``gzip`` la salida se
+comprime al vuelo.
+
+Los textos que vienen del formulario público (nombre, descripción, ...) se
+escriben en el CSV con un apóstrofo delante si empiezan como una fórmula,
+para que Excel no los ejecute al abrir el archivo. Los números y teléfonos
+(``+56 9 1234 5678``, ``-15``) se dejan como están: sin letras ni otros
+símbolos no pueden llamar a ninguna función.
+"""
+import csv
+import re
+import tempfile
+import zlib
+
+from django.conf import settings
+
+from .filters import PedidoApiFilter
+
+FORMATOS = ('csv', 'xlsx')
+
+TAMANO_TROZO = 2000
+
+# Filas de CSV por cada envío
+FILAS_POR_ENVIO = 500
+
+# Bytes que se leen del XLSX temporal por cada envío
+TAMANO_ENVIO = 64 * 1024
+
+# Filas de datos por hoja: Excel admite 1.048.576 filas contando el encabezado
+# (XlsxWriter ignora en silencio las que pasan del límite)
+FILAS_POR_HOJA = 1048576 - 1
+
+# Comienzos con los que Excel interpreta una celda de CSV como fórmula
+INICIOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+# Números y teléfonos: empiezan con + o - pero no son una fórmula peligrosa
+NUMERO_O_TELEFONO = re.compile(r'[+-][\d\s().-]*\d[\d\s().-]*')
+
+# (campo para values_list, encabezado)
+COLUMNAS = (
+    ('id', 'ID'),
+    ('fecha_creacion', 'Fecha de creación'),
+    ('nombre_cliente', 'Cliente'),
+    ('email', 'Email'),
+    ('telefono', 'Teléfono'),
+    ('red_social', 'Red social'),
+    ('plataforma', 'Plataforma'),
+    ('producto_referencia__nombre', 'Producto'),
+    ('descripcion_diseno', 'Descripción del diseño'),
+    ('fecha_requerida', 'Fecha requerida'),
+    ('estado_pedido', 'Estado del pedido'),
+    ('estado_pago', 'Estado del pago'),
+    ('presupuesto_estimado', 'Presupuesto estimado'),
+    ('presupuesto_aprobado', 'Presupuesto aprobado'),
+    ('token_seguimiento', 'Token de seguimiento'),
+)
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class XlsxNoDisponible(Exception):
+    pass
+
+
+class XlsxDemasiadoGrande(Exception):
+    pass
+
+
+def maximo_filas_xlsx():
+    return getattr(settings, 'XLSX_MAXIMO_FILAS', 100000)
+
+
+def filtrar_pedidos(parametros):
+    """
+    Pedidos que cumplen los filtros de ``/api/pedidos/filtrar/``
+    (``PedidoApiFilter``). Devuelve ``(queryset, errores)``.
+    """
+    from .models import Pedido
+
+    filtro = PedidoApiFilter(parametros, queryset=Pedido.objects.all())
+    if not filtro.is_valid():
+        return None, filtro.errors
+    return filtro.qs.order_by('id'), None
+
+
+def filas(pedidos):
+    """Tuplas de valores en el orden de ``COLUMNAS``, por trozos"""
+    campos = [campo for campo, _ in COLUMNAS]
+    return pedidos.values_list(*campos).iterator(chunk_size=TAMANO_TROZO)
+
+
+def encabezados():
+    return [titulo for _, titulo in COLUMNAS]
+
+
+# ============================================
+# FORMATOS
+# ============================================
+
+class _Eco:
+    """Pseudo archivo para ``csv.writer``: devuelve lo escrito en vez de guardarlo"""
+
+    def write(self, valor):
+        return valor
+
+
+def neutralizar_formula(valor):
+    """Antepone un apóstrofo a los textos que Excel tomaría como fórmula"""
+    if isinstance(valor, str) and valor.startswith(INICIOS_FORMULA) and not NUMERO_O_TELEFONO.fullmatch(valor):
+        return "'" + valor
+    return valor
+
+
+def _columnas_de_texto():
+    from .models import Pedido
+
+    return [
+        posicion for posicion, (campo, _) in enumerate(COLUMNAS)
+        if '__' in campo or Pedido._meta.get_field(campo).get_internal_type() in ('CharField', 'TextField', 'EmailField')
+    ]
+
+
+def generar_csv(pedidos):
+    escritor = csv.writer(_Eco())
+    texto = _columnas_de_texto()
+    # BOM para que Excel reconozca el UTF-8
+    bloque = ['\ufeff' + escritor.writerow(encabezados())]
+    for fila in filas(pedidos):
+        fila = list(fila)
+        for posicion in texto:
+            fila[posicion] = neutralizar_formula(fila[posicion])
+        bloque.append(escritor.writerow(fila))
+        # Se envían varias filas juntas para no escribir a la red línea por línea
+        if len(bloque) >= FILAS_POR_ENVIO:
+            yield ''.join(bloque)
+            bloque = []
+    yield ''.join(bloque)
+
+
+def _escritores_xlsx(hoja, formato_fecha):
+    """Un escritor por columna, según el tipo del campo (evita adivinar el tipo en cada celda)"""
+    from django.utils import timezone
+
+    from .models import Pedido
+
+    def fecha_hora(fila, columna, valor):
+        # Excel no admite zonas horarias: se exporta la hora local de la tienda
+        hoja.write_datetime(fila, columna, timezone.localtime(valor).replace(tzinfo=None), formato_fecha)
+
+    def fecha(fila, columna, valor):
+        hoja.write_datetime(fila, columna, valor, formato_fecha)
+
+    def numero(fila, columna, valor):
+        hoja.write_number(fila, columna, float(valor))
+
+    escritores = []
+    for campo, _ in COLUMNAS:
+        tipo = Pedido._meta.get_field(campo.split('__')[0])
+        if '__' in campo:
+            escritores.append(hoja.write_string)
+        elif tipo.get_internal_type() == 'DateTimeField':
+            escritores.append(fecha_hora)
+        elif tipo.get_internal_type() == 'DateField':
+            escritores.append(fecha)
+        elif tipo.get_internal_type() in ('DecimalField', 'AutoField', 'BigAutoField', 'IntegerField'):
+            escritores.append(numero)
+        else:
+            escritores.append(hoja.write_string)
+    return escritores
+
+
+def generar_xlsx(pedidos):
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise XlsxNoDisponible("Instale XlsxWriter para exportar a XLSX.")
+    # El conteo se corta en el límite: no recorre toda la tabla
+    maximo = maximo_filas_xlsx()
+    if pedidos[:maximo + 1].count() > maximo:
+        raise XlsxDemasiadoGrande(
+            f"El XLSX admite hasta {maximo} pedidos; use formato=csv o filtre por fechas."
+        )
+
+    def enviar():
+        with tempfile.TemporaryFile() as archivo:
+            # constant_memory escribe cada fila al disco apenas se completa
+            libro = xlsxwriter.Workbook(archivo, {'constant_memory': True})
+            formato_fecha = libro.add_format({'num_format': 'yyyy-mm-dd hh:mm'})
+            hojas = 0
+            numero = FILAS_POR_HOJA
+            for fila in filas(pedidos):
+                if numero == FILAS_POR_HOJA:
+                    hojas += 1
+                    hoja = libro.add_worksheet('Pedidos' if hojas == 1 else f'Pedidos {hojas}')
+                    escritores = _escritores_xlsx(hoja, formato_fecha)
+                    hoja.write_row(0, 0, encabezados())
+                    numero = 0
+                numero += 1
+                for columna, valor in enumerate(fila):
+                    if valor is not None and valor != '':
+                        escritores[columna](numero, columna, valor)
+            if not hojas:
+                libro.add_worksheet('Pedidos').write_row(0, 0, encabezados())
+            libro.close()
+
+            archivo.seek(0)
+            while trozo := archivo.read(TAMANO_ENVIO):
+                yield trozo
+
+    return enviar()
+
+
+def comprimir(trozos):
+    """Comprime con gzip a medida que llegan los trozos"""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for trozo in trozos:
+        if isinstance(trozo, str):
+            trozo = trozo.encode('utf-8')
+        datos = compresor.compress(trozo)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def exportar(pedidos, formato='csv', gzip=False):
+    """
+    Devuelve ``(trozos, tipo_contenido, nombre_archivo)`` para armar la
+    respuesta. Lanza ``XlsxNoDisponible`` si falta XlsxWriter y
+    ``XlsxDemasiadoGrande`` si hay más de ``XLSX_MAXIMO_FILAS`` pedidos.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    trozos = generar_xlsx(pedidos) if formato == 'xlsx' else generar_csv(pedidos)
+    nombre = f'pedidos.{formato}'
+    tipo = TIPOS_CONTENIDO[formato]
+    if gzip:
+        trozos = comprimir(trozos)
+        nombre += '.gz'
+        tipo = 'application/gzip'
+    return trozos, tipo, nombre
@@ -1,17 +1,29 @@
+import datetime
+
 import django_filters
+from django.utils import timezone
 from .models import Pedido, Producto
 from django import forms
 
+
+def inicio_del_dia(fecha):
+    """Primer instante de ``fecha`` en la zona horaria de la tienda"""
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min), timezone.get_default_timezone())
+
+
 class PedidoFilter(django_filters.FilterSet):
+    # Rango semiabierto [fecha_inicio, fecha_fin + 1 día): incluye el día
+    # final completo y compara la columna directamente, sin funciones que
+    # impidan usar su índice
     fecha_inicio = django_filters.DateFilter(
         field_name='fecha_creacion',
-        lookup_expr='gte',
+        method='filtrar_desde',
         label='Fecha Inicio',
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
     )
     fecha_fin = django_filters.DateFilter(
         field_name='fecha_creacion',
-        lookup_expr='lte',
+        method='filtrar_hasta',
         label='Fecha Fin',
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
     )
@@ -31,4 +43,38 @@ class PedidoFilter(django_filters.FilterSet):
 
     class meta:
         model = Pedido
-        fields = ['fecha_inicio', 'fecha_fin', 'estado', 'plataforma']
\ No newline at end of file
+        fields = ['fecha_inicio', 'fecha_fin', 'estado', 'plataforma']
+
+    def filtrar_desde(self, queryset, name, value):
+        return queryset.filter(**{f'{name}__gte': inicio_del_dia(value)})
+
+    def filtrar_hasta(self, queryset, name, value):
+        return queryset.filter(**{f'{name}__lt': inicio_del_dia(value + datetime.timedelta(days=1))})
+
+
+class ListaChoiceField(forms.MultipleChoiceField):
+    """Acepta el parámetro repetido (``?estado_pedido=a&estado_pedido=b``) o separado por comas"""
+
+    def to_python(self, value):
+        valores = super().to_python(value)
+        return [parte.strip() for valor in valores for parte in valor.split(',') if parte.strip()]
+
+
+class ListaFilter(django_filters.MultipleChoiceFilter):
+    field_class = ListaChoiceField
+
+    def filter(self, qs, value):
+        # Un solo IN en vez de un OR por valor
+        if not value:
+            return qs
+        return qs.filter(**{f'{self.field_name}__in': value})
+
+
+class PedidoApiFilter(PedidoFilter):
+    """Filtros de /api/pedidos/filtrar/ y de la exportación"""
+
+    estado_pedido = ListaFilter(choices=Pedido.ESTADOS_PEDIDO)
+    plataforma = ListaFilter(choices=Pedido.PLATAFORMAS)
+    estado_pago = ListaFilter(choices=Pedido.ESTADOS_PAGO)
+    # Pedidos de un cliente (pedido_email_idx): el email exacto, como lo escribió
+    email = django_filters.CharFilter(field_name='email')
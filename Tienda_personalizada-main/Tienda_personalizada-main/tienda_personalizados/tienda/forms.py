@@ -1,10 +1,31 @@
 from django import forms
-from .models import Pedido, ImagenReferencia
+from django.core.exceptions import ValidationError
+from django.core.validators import FileExtensionValidator
+from .models import Pedido
+from . import idempotencia, procesamiento
+
+# Las imágenes se validan y procesan en segundo plano (ver procesamiento.py);
+# aquí solo se revisa la extensión y el tamaño para no bloquear la petición.
+EXTENSIONES_IMAGEN = ['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp']
+TAMANO_MAXIMO_IMAGEN = 15 * 1024 * 1024
+
+
+def validar_tamano_imagen(archivo):
+    if archivo.size > TAMANO_MAXIMO_IMAGEN:
+        raise ValidationError("La imagen no puede pesar más de 15 MB.")
+
+
+class CampoImagenReferencia(forms.FileField):
+    default_validators = [FileExtensionValidator(EXTENSIONES_IMAGEN), validar_tamano_imagen]
+    widget = forms.ClearableFileInput(attrs={'accept': 'image/*'})
+
 
 class SolicitudPedidoForm(forms.ModelForm):
-    imagen_referencia_1 = forms.ImageField(required=False, label="Imagen de referencia 1")
-    imagen_referencia_2 = forms.ImageField(required=False, label="Imagen de referencia 2")
-    imagen_referencia_3 = forms.ImageField(required=False, label="Imagen de referencia 3")
+    imagen_referencia_1 = CampoImagenReferencia(required=False, label="Imagen de referencia 1")
+    imagen_referencia_2 = CampoImagenReferencia(required=False, label="Imagen de referencia 2")
+    imagen_referencia_3 = CampoImagenReferencia(required=False, label="Imagen de referencia 3")
+    # Se genera al mostrar el formulario: si el envío se repite, no se crea otro pedido
+    clave_envio = forms.CharField(required=False, widget=forms.HiddenInput, initial=idempotencia.nueva_clave)
     
     class Meta:
         model = Pedido
@@ -31,20 +52,16 @@ class SolicitudPedidoForm(forms.ModelForm):
         # ✅ Estados automáticos: Solicitado y Pendiente
         self.instance.estado_pedido = 'solicitado'
         self.instance.estado_pago = 'pendiente'
-        self.instance.presupuesto_estimado = self.instance.calcular_presupuesto()
         
         pedido = super().save(commit=commit)
         
-        # Guardar imágenes de referencia
+        # Imágenes de referencia: quedan en espera y se procesan en segundo plano
         if commit:
-            for i in range(1, 4):
-                imagen_field = f'imagen_referencia_{i}'
-                imagen = self.cleaned_data.get(imagen_field)
-                if imagen:
-                    ImagenReferencia.objects.create(
-                        pedido=pedido,
-                        imagen=imagen,
-                        descripcion=f"Imagen de referencia {i} enviada por el cliente"
-                    )
+            archivos = [
+                (i, self.cleaned_data[f'imagen_referencia_{i}'])
+                for i in range(1, 4)
+                if self.cleaned_data.get(f'imagen_referencia_{i}')
+            ]
+            procesamiento.poner_en_espera(pedido, archivos)
         
         return pedido
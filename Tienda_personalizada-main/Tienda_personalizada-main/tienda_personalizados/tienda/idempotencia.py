@@ -0,0 +1,182 @@
+"""
+Creación idempotente de pedidos.
+
+Cada envío lleva una clave: la cabecera ``Idempotency-Key`` en la API y un
+campo oculto (``clave_envio``) generado al mostrar el formulario. La primera
+vez la clave se marca *en curso* insertando una fila en ``ClaveIdempotencia``
+(la restricción única sobre ámbito y clave decide quién llega primero, en
+cualquier worker) y, si el pedido se crea, se guarda lo necesario para
+repetir la respuesta por ``IDEMPOTENCIA_SEGUNDOS``. Un reintento con la
+misma clave recibe esa misma respuesta sin volver a crear el pedido; uno
+que llega mientras el primero sigue en curso recibe 409. Si el envío no
+crea nada (formulario inválido, error) la clave se libera para poder
+corregir y reenviar.
+
+La marca en curso solo se reemplaza pasado ``IDEMPOTENCIA_EN_CURSO_SEGUNDOS``,
+que debe ser mayor que el tiempo máximo de una petición (el ``--timeout`` de
+gunicorn o del proxy): a esa altura el worker que la tomó ya terminó o fue
+terminado, así que un envío lento nunca se pisa con su reintento.
+
+Las filas vencidas se borran con ``manage.py purgar_idempotencia``.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import secrets
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+
+CABECERA = 'HTTP_IDEMPOTENCY_KEY'
+CAMPO_FORMULARIO = 'clave_envio'
+LARGO_MAXIMO_CLAVE = 255
+
+
+class EnCurso(Exception):
+    """Otro envío con la misma clave todavía no terminó"""
+
+
+class ClaveReutilizada(Exception):
+    """La clave ya se usó con otros datos"""
+
+
+def nueva_clave():
+    return secrets.token_urlsafe(16)
+
+
+def clave_valida(clave):
+    return bool(clave) and len(clave) <= LARGO_MAXIMO_CLAVE and clave.isprintable()
+
+
+def huella(datos):
+    """Resumen de los datos enviados, para detectar una clave usada con otro contenido"""
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _segundos_en_curso():
+    return getattr(settings, 'IDEMPOTENCIA_EN_CURSO_SEGUNDOS', 60 * 10)
+
+
+def _clave_guardada(clave):
+    # Hash: las claves del cliente miden hasta 255 caracteres y la columna 64
+    return hashlib.sha256(clave.encode()).hexdigest()
+
+
+def iniciar(ambito, clave, huella=''):
+    """
+    Marca la clave como en curso y devuelve None, o devuelve el registro
+    guardado si el envío ya se completó. Lanza ``EnCurso`` o ``ClaveReutilizada``.
+    """
+    from .models import ClaveIdempotencia
+
+    clave = _clave_guardada(clave)
+    ahora = timezone.now()
+    for _ in range(2):
+        # Una marca vencida (registro viejo, o envío cuyo worker ya no existe) no cuenta
+        ClaveIdempotencia.objects.filter(ambito=ambito, clave=clave, expira__lte=ahora).delete()
+        try:
+            with transaction.atomic():
+                ClaveIdempotencia.objects.create(
+                    ambito=ambito, clave=clave, huella=huella,
+                    expira=ahora + datetime.timedelta(seconds=_segundos_en_curso()),
+                )
+            return None
+        except IntegrityError:
+            guardado = ClaveIdempotencia.objects.filter(ambito=ambito, clave=clave).values('huella', 'registro').first()
+        if guardado is not None:
+            break
+        # Se liberó entre el INSERT y la lectura: se intenta una vez más
+    else:
+        raise EnCurso()
+
+    if guardado['registro'] is None:
+        raise EnCurso()
+    if guardado['huella'] != huella:
+        raise ClaveReutilizada()
+    return guardado['registro']
+
+
+def completar(ambito, clave, registro, huella=''):
+    from .models import ClaveIdempotencia
+
+    ClaveIdempotencia.objects.filter(ambito=ambito, clave=_clave_guardada(clave)).update(
+        huella=huella, registro=registro,
+        expira=timezone.now() + datetime.timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_SEGUNDOS', 60 * 60 * 24)),
+    )
+
+
+def cancelar(ambito, clave):
+    from .models import ClaveIdempotencia
+
+    ClaveIdempotencia.objects.filter(ambito=ambito, clave=_clave_guardada(clave)).delete()
+
+
+def purgar_vencidas():
+    """Borra las claves vencidas y devuelve cuántas eran (ver el comando purgar_idempotencia)"""
+    from .models import ClaveIdempotencia
+
+    borradas, _ = ClaveIdempotencia.objects.filter(expira__lte=timezone.now()).delete()
+    return borradas
+
+
+# ============================================
+# FORMULARIO DE SOLICITUD
+# ============================================
+
+def recordar_pedido(request, pedido_id, token):
+    """Datos de sesión que muestra la página de pedido exitoso"""
+    request.session['ultimo_pedido_id'] = pedido_id
+    request.session['token_seguimiento'] = str(token)
+
+
+def pedido_creado(request, pedido):
+    """
+    Lo llaman las vistas al crear el pedido: lo recuerda en la sesión y lo
+    marca en la petición, que es lo que ``formulario_idempotente`` guarda
+    como resultado del envío.
+    """
+    request.pedido_creado = pedido
+    recordar_pedido(request, pedido.id, pedido.token_seguimiento)
+
+
+def formulario_idempotente(vista):
+    """
+    Para las vistas de solicitud de pedido: un POST repetido con la misma
+    ``clave_envio`` vuelve a la página de éxito del pedido ya creado.
+    """
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.POST.get(CAMPO_FORMULARIO) if request.method == 'POST' else None
+        if not clave_valida(clave):
+            return vista(request, *args, **kwargs)
+
+        try:
+            registro = iniciar('formulario', clave)
+        except EnCurso:
+            return HttpResponse('Tu pedido se está enviando, espera un momento.', status=409)
+        if registro is not None:
+            recordar_pedido(request, registro['pedido_id'], registro['token_seguimiento'])
+            return redirect(registro['url'])
+
+        completado = False
+        try:
+            respuesta = vista(request, *args, **kwargs)
+            # Solo cuenta el pedido que creó esta petición, no uno anterior de la sesión
+            pedido = getattr(request, 'pedido_creado', None)
+            if respuesta.status_code == 302 and pedido is not None:
+                completar('formulario', clave, {
+                    'pedido_id': pedido.id,
+                    'token_seguimiento': str(pedido.token_seguimiento),
+                    'url': respuesta['Location'],
+                })
+                completado = True
+            return respuesta
+        finally:
+            if not completado:
+                cancelar('formulario', clave)
+
+    return envoltura
@@ -0,0 +1,178 @@
+"""
+Derivados de las imágenes de productos.
+
+Al subir una imagen se generan versiones de ancho fijo en WebP, AVIF (si
+Pillow lo soporta) y JPEG, sin metadatos (EXIF, GPS, perfil de cámara). Los
+derivados tienen un nombre predecible a partir del original:
+
+    productos/polera.jpg  ->  derivados/productos/polera_400w.webp
+
+así las plantillas arman el ``srcset`` sin consultar la base de datos.
+"""
+import os
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+# Anchos generados: 100 (vista previa del admin en pantallas 2x), tarjetas de
+# 200px del catálogo en 1x/2x y el detalle del producto.
+ANCHOS = (100, 200, 400, 800)
+
+CARPETA = 'derivados'
+
+CAMPOS_PRODUCTO = ('imagen_1', 'imagen_2', 'imagen_3')
+
+_OPCIONES = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+TIPOS_MIME = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+def formatos_disponibles():
+    """Formatos a generar, del más liviano al de respaldo"""
+    formatos = []
+    for formato in ('avif', 'webp'):
+        try:
+            if features.check(formato):
+                formatos.append(formato)
+        except ValueError:
+            # Versión de Pillow que no conoce el formato
+            pass
+    formatos.append('jpeg')
+    return formatos
+
+
+def nombre_derivado(nombre, ancho, formato):
+    base, _ = os.path.splitext(nombre)
+    extension = 'jpg' if formato == 'jpeg' else formato
+    return f'{CARPETA}/{base}_{ancho}w.{extension}'
+
+
+def _anchos_para(ancho_original):
+    anchos = [ancho for ancho in ANCHOS if ancho <= ancho_original]
+    # Una imagen más chica que todos los anchos se guarda al menos una vez
+    return anchos or [ANCHOS[0]]
+
+
+def generar_derivados(archivo, storage=default_storage):
+    """
+    Genera todos los derivados de un ``FieldFile`` y los guarda en
+    ``storage``. Devuelve los nombres generados.
+    """
+    nombre = archivo.name
+    with archivo.storage.open(nombre, 'rb') as original:
+        imagen = Image.open(original)
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.load()
+
+    tiene_transparencia = imagen.mode in ('RGBA', 'LA') or 'transparency' in imagen.info
+    imagen = imagen.convert('RGBA' if tiene_transparencia else 'RGB')
+
+    generados = []
+    for ancho in _anchos_para(imagen.width):
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        reducida = imagen.resize((ancho, alto), Image.LANCZOS) if ancho < imagen.width else imagen
+
+        for formato in formatos_disponibles():
+            copia = reducida
+            if formato == 'jpeg' and copia.mode == 'RGBA':
+                fondo = Image.new('RGB', copia.size, (255, 255, 255))
+                fondo.paste(copia, mask=copia.getchannel('A'))
+                copia = fondo
+
+            # Al no pasar exif= ni icc_profile=, Pillow no copia metadatos
+            buffer = BytesIO()
+            copia.save(buffer, format=formato.upper(), **_OPCIONES[formato])
+
+            destino = nombre_derivado(nombre, ancho, formato)
+            if storage.exists(destino):
+                storage.delete(destino)
+            generados.append(storage.save(destino, ContentFile(buffer.getvalue())))
+
+    _disponibles.pop(nombre, None)
+    return generados
+
+
+def eliminar_derivados(nombre, storage=default_storage):
+    """Borra los derivados de un original que ya no existe"""
+    for ancho in ANCHOS:
+        for formato in TIPOS_MIME:
+            destino = nombre_derivado(nombre, ancho, formato)
+            if storage.exists(destino):
+                storage.delete(destino)
+    _disponibles.pop(nombre, None)
+
+
+# ============================================
+# LECTURA DESDE LAS PLANTILLAS
+# ============================================
+
+# nombre original -> ({formato: [(ancho, url), ...]}, vence). Las imágenes con
+# derivados se recuerdan sin vencimiento; las que no tienen (subidas antiguas,
+# conversiones fallidas) por DERIVADOS_AUSENTES_SEGUNDOS, para no preguntar al
+# storage en cada render (en un storage remoto, una ida y vuelta por consulta)
+# y aun así detectar los backfills sin reiniciar.
+_disponibles = {}
+_MAX_RECORDADOS = 5000
+
+
+def _recordar(nombre, resultado):
+    if len(_disponibles) >= _MAX_RECORDADOS:
+        _disponibles.clear()
+    vence = None if resultado else time.monotonic() + getattr(settings, 'DERIVADOS_AUSENTES_SEGUNDOS', 60)
+    _disponibles[nombre] = (resultado, vence)
+    return resultado
+
+
+def derivados(archivo, storage=default_storage):
+    """
+    Devuelve ``{formato: [(ancho, url), ...]}`` con los derivados existentes
+    de un ``FieldFile``, o un diccionario vacío si aún no se han generado.
+    """
+    if not archivo:
+        return {}
+
+    nombre = archivo.name
+    if nombre in _disponibles:
+        resultado, vence = _disponibles[nombre]
+        if vence is None or time.monotonic() < vence:
+            return resultado
+
+    # El ancho más chico en JPEG siempre se genera: si no está, no hay derivados
+    if not storage.exists(nombre_derivado(nombre, ANCHOS[0], 'jpeg')):
+        return _recordar(nombre, {})
+
+    resultado = {}
+    for formato in formatos_disponibles():
+        existentes = [
+            (ancho, storage.url(nombre_derivado(nombre, ancho, formato)))
+            for ancho in ANCHOS
+            if storage.exists(nombre_derivado(nombre, ancho, formato))
+        ]
+        if existentes:
+            resultado[formato] = existentes
+    return _recordar(nombre, resultado)
+
+
+def srcset(archivo, formato='webp'):
+    return ', '.join(f'{url} {ancho}w' for ancho, url in derivados(archivo).get(formato, []))
+
+
+def url_miniatura(archivo, ancho_minimo=100):
+    """URL del derivado más chico que cubra ``ancho_minimo``, o del original"""
+    for formato in ('webp', 'jpeg'):
+        for ancho, url in derivados(archivo).get(formato, []):
+            if ancho >= ancho_minimo:
+                return url
+    return archivo.url if archivo else ''
@@ -0,0 +1,311 @@
+"""
+Importación masiva de pedidos desde CSV o JSONL.
+
+Pensada para los pedidos que llegan por Facebook, Instagram o WhatsApp: el
+archivo se lee fila por fila (sin cargarlo entero en memoria), cada fila se
+valida con los mismos campos del modelo y los pedidos válidos se insertan
+en lotes con ``bulk_create``. Los tokens de seguimiento se generan por lote
+(comprobando choques con una sola consulta) y el presupuesto estimado se
+calcula con la tabla de precios, sin consultas por fila. El resumen diario
+se actualiza con una escritura por día/estado/plataforma/producto del lote.
+
+Las filas con errores se informan con su número de línea y no detienen la
+importación; también las que la base rechaza al insertar (por ejemplo un
+producto eliminado durante la importación): ese lote se reintenta fila por
+fila. La codificación se comprueba antes de insertar nada: un archivo que no
+está en UTF-8 se rechaza entero.
+"""
+import codecs
+import csv
+import json
+import secrets
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import presupuestos, resumen, seguimiento
+
+FORMATOS = ('csv', 'jsonl')
+
+# Columnas aceptadas; el resto se ignora
+CAMPOS = (
+    'nombre_cliente', 'email', 'telefono', 'red_social', 'producto_referencia',
+    'descripcion_diseno', 'fecha_requerida', 'plataforma', 'estado_pedido',
+    'estado_pago', 'presupuesto_aprobado', 'notas_internas', 'fecha_creacion',
+)
+
+TAMANO_LOTE = 2000
+
+# Máximo de errores que se guardan con detalle (el total se cuenta igual)
+MAX_ERRORES = 1000
+
+# Bytes que se leen por vez al comprobar la codificación
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = 0
+        self.total_errores = 0
+        self.errores = []
+
+    def agregar_error(self, linea, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append({'linea': linea, 'error': mensaje})
+
+    def como_dict(self):
+        return {'creados': self.creados, 'total_errores': self.total_errores, 'errores': self.errores}
+
+
+def detectar_formato(nombre):
+    nombre = (nombre or '').lower()
+    if nombre.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+# ============================================
+# LECTURA
+# ============================================
+
+def verificar_codificacion(archivo):
+    """
+    Recorre el archivo por bloques y lanza ``ValidationError`` si no está en
+    UTF-8; al terminar lo deja al principio. Se llama antes de insertar el
+    primer lote para no dejar una importación a medias.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')()
+    leidos = 0
+    try:
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+            decodificador.decode(bloque)
+            leidos += len(bloque)
+        decodificador.decode(b'', final=True)
+    except UnicodeDecodeError as e:
+        raise ValidationError(
+            f"El archivo debe estar en UTF-8 (byte inválido cerca de la posición {leidos + e.start})"
+        )
+    finally:
+        archivo.seek(0)
+
+
+def leer_filas(archivo, formato):
+    """
+    Recorre un archivo binario (o un ``UploadedFile``) y entrega
+    ``(linea, datos)``; si la línea no se puede leer, ``datos`` es un
+    ``ValidationError``.
+    """
+    # Tanto los archivos abiertos en binario como los UploadedFile (que leen
+    # por trozos) se recorren línea por línea
+    lineas = codecs.iterdecode(archivo, 'utf-8-sig')
+
+    if formato == 'csv':
+        lector = csv.DictReader(lineas)
+        for datos in lector:
+            yield lector.line_num, datos
+        return
+
+    for numero, linea in enumerate(lineas, start=1):
+        if not linea.strip():
+            continue
+        try:
+            datos = json.loads(linea)
+        except ValueError as e:
+            yield numero, ValidationError(f"JSON inválido: {e}")
+            continue
+        if not isinstance(datos, dict):
+            yield numero, ValidationError("Cada línea debe ser un objeto JSON")
+            continue
+        yield numero, datos
+
+
+# ============================================
+# VALIDACIÓN
+# ============================================
+
+def _campos_modelo():
+    from .models import Pedido
+    return {nombre: Pedido._meta.get_field(nombre) for nombre in CAMPOS}
+
+
+def construir_pedido(datos, campos, valores_por_defecto, precios):
+    """
+    Valida una fila y devuelve un ``Pedido`` sin guardar. ``precios`` es la
+    tabla ``{producto_id: precio_base}`` (se lee una vez por importación).
+    """
+    from .models import Pedido
+
+    valores = dict(valores_por_defecto)
+    valores.update({
+        nombre: valor for nombre, valor in datos.items()
+        if nombre in campos and valor not in (None, '')
+    })
+
+    limpios = {}
+    errores = {}
+    producto_id = valores.pop('producto_referencia', None)
+    for nombre, campo in campos.items():
+        if nombre == 'producto_referencia':
+            continue
+        if nombre not in valores and campo.blank:
+            # Los valores por defecto del modelo ya son válidos
+            limpios[nombre] = campo.get_default()
+            continue
+        try:
+            limpios[nombre] = campo.clean(valores.get(nombre, campo.get_default()), None)
+        except ValidationError as e:
+            errores[nombre] = e.messages
+        except (TypeError, ValueError):
+            # Valores de JSON con otro tipo, por ejemplo una fecha numérica
+            errores[nombre] = [f"Valor inválido: {valores.get(nombre)!r}"]
+
+    if producto_id is not None:
+        try:
+            producto_id = int(producto_id)
+        except (TypeError, ValueError):
+            errores['producto_referencia'] = ["Debe ser el id de un producto"]
+        else:
+            if producto_id not in precios:
+                errores['producto_referencia'] = [f"No existe el producto {producto_id}"]
+
+    if errores:
+        raise ValidationError({nombre: mensajes for nombre, mensajes in errores.items()})
+
+    fecha = limpios.get('fecha_creacion')
+    if fecha is not None and timezone.is_naive(fecha):
+        limpios['fecha_creacion'] = timezone.make_aware(fecha)
+
+    pedido = Pedido(producto_referencia_id=producto_id, **limpios)
+    pedido.presupuesto_estimado = presupuestos.cotizar(precios.get(producto_id), pedido.descripcion_diseno)
+    return pedido
+
+
+def _mensaje(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(f"{campo}: {' '.join(mensajes)}" for campo, mensajes in error.message_dict.items())
+    return ' '.join(error.messages)
+
+
+# ============================================
+# INSERCIÓN
+# ============================================
+
+def _nuevo_token():
+    return secrets.token_urlsafe(10)[:10]
+
+
+def asignar_tokens(pedidos):
+    """Asigna tokens únicos a un lote, con una consulta por ronda de choques"""
+    from .models import Pedido
+
+    pendientes = list(pedidos)
+    usados = set()
+    while pendientes:
+        for pedido in pendientes:
+            token = _nuevo_token()
+            while token in usados:
+                token = _nuevo_token()
+            usados.add(token)
+            pedido.token_seguimiento = token
+
+        tokens = [pedido.token_seguimiento for pedido in pendientes]
+        existentes = set(Pedido.objects.filter(token_seguimiento__in=tokens).values_list('token_seguimiento', flat=True))
+        pendientes = [pedido for pedido in pendientes if pedido.token_seguimiento in existentes]
+
+
+def _choque_de_token(error):
+    # Otro proceso usó el mismo token entre la consulta y la inserción
+    return 'token_seguimiento' in str(error)
+
+
+def _guardar(pedidos):
+    """
+    Inserta los pedidos con ``bulk_create`` y los suma al resumen diario,
+    con tokens nuevos si otro proceso usó alguno al mismo tiempo. Lanza
+    ``IntegrityError`` si la base rechaza los pedidos por otro motivo.
+    """
+    from .models import Pedido
+
+    for intento in range(3):
+        asignar_tokens(pedidos)
+        try:
+            with transaction.atomic():
+                Pedido.objects.bulk_create(pedidos, batch_size=TAMANO_LOTE)
+                diferencias = resumen.Diferencias()
+                for pedido in pedidos:
+                    diferencias.sumar(pedido._valores_resumen())
+                diferencias.aplicar()
+        except IntegrityError as e:
+            for pedido in pedidos:
+                pedido.pk = None
+                pedido._state.adding = True
+            if not _choque_de_token(e) or intento == 2:
+                raise
+            continue
+        seguimiento.olvidar_tokens_invalidos(*(pedido.token_seguimiento for pedido in pedidos))
+        return
+
+
+def _insertar(lote, resultado):
+    """
+    Inserta el lote (``[(linea, pedido), ...]``) y devuelve cuántos creó. Si
+    la base lo rechaza, se reintenta fila por fila y las filas rechazadas se
+    informan como errores de su línea.
+    """
+    try:
+        _guardar([pedido for _, pedido in lote])
+        return len(lote)
+    except IntegrityError:
+        pass
+
+    creados = 0
+    for linea, pedido in lote:
+        try:
+            _guardar([pedido])
+        except IntegrityError as e:
+            resultado.agregar_error(linea, f"La base de datos rechazó la fila: {e}")
+        else:
+            creados += 1
+    return creados
+
+
+def importar_pedidos(archivo, formato='csv', valores_por_defecto=None, lote=TAMANO_LOTE):
+    """
+    Importa los pedidos de ``archivo`` (binario) y devuelve un
+    ``ResultadoImportacion`` con los creados y los errores por línea.
+    ``valores_por_defecto`` completa las columnas que falten, por ejemplo
+    ``{'plataforma': 'instagram'}``.
+
+    Lanza ``ValidationError`` si el archivo no está en UTF-8.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    verificar_codificacion(archivo)
+
+    campos = _campos_modelo()
+    precios = presupuestos.tabla_precios()
+    valores_por_defecto = valores_por_defecto or {}
+    resultado = ResultadoImportacion()
+    pendientes = []
+
+    for linea, datos in leer_filas(archivo, formato):
+        try:
+            if isinstance(datos, ValidationError):
+                raise datos
+            pendientes.append((linea, construir_pedido(datos, campos, valores_por_defecto, precios)))
+        except ValidationError as e:
+            resultado.agregar_error(linea, _mensaje(e))
+            continue
+        except (TypeError, ValueError) as e:
+            resultado.agregar_error(linea, str(e))
+            continue
+
+        if len(pendientes) >= lote:
+            resultado.creados += _insertar(pendientes, resultado)
+            pendientes = []
+
+    if pendientes:
+        resultado.creados += _insertar(pendientes, resultado)
+    return resultado
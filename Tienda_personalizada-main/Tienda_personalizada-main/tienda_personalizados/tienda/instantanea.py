@@ -0,0 +1,156 @@
+"""
+Instantánea del catálogo en memoria.
+
+Cada worker guarda en memoria los productos activos y las categorías, junto
+con la versión del catálogo con la que se construyó. La versión vive en la
+base (``VersionCatalogo``), así que la comparten todos los workers y
+servidores, y las señales de Producto/Categoria la incrementan. Cada worker
+la vuelve a leer como mucho cada ``CATALOGO_VERSION_SEGUNDOS``; cuando ve
+una versión distinta reconstruye su instantánea. Mientras tanto, inicio y
+catálogo se sirven sin consultas SQL.
+"""
+import secrets
+import threading
+import time
+from collections import defaultdict
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import F
+
+from . import busqueda
+
+_instantanea = None
+_candado = threading.Lock()
+
+# ``(versión, momento de la lectura)`` de la última consulta a la base
+_version = None
+
+
+class InstantaneaCatalogo:
+    """Productos activos y categorías de una versión del catálogo"""
+
+    def __init__(self, version, productos, categorias):
+        self.version = version
+        self.productos = tuple(productos)
+        self.categorias = tuple(categorias)
+        self.por_id = {producto.pk: producto for producto in self.productos}
+
+        por_categoria = defaultdict(list)
+        for producto in self.productos:
+            por_categoria[producto.categoria_id].append(producto)
+        self.por_categoria = {pk: tuple(lista) for pk, lista in por_categoria.items()}
+        self._ordenados = {}
+
+    def destacados(self, cantidad=6):
+        return list(self.productos[:cantidad])
+
+    def filtrar(self, categoria_id=None, orden=('id',)):
+        """
+        Productos activos, opcionalmente de una sola categoría, ordenados de
+        forma ascendente por los campos de ``orden`` (por defecto, por id).
+        """
+        if not categoria_id:
+            productos = self.productos
+        else:
+            try:
+                categoria_id = int(categoria_id)
+            except (TypeError, ValueError):
+                return []
+            productos = self.por_categoria.get(categoria_id, ())
+
+        orden = tuple(orden)
+        if orden == ('id',):
+            return list(productos)
+
+        # Los otros órdenes se calculan una sola vez por instantánea
+        clave = (categoria_id or None, orden)
+        if clave not in self._ordenados:
+            self._ordenados[clave] = sorted(productos, key=attrgetter(*orden))
+        return list(self._ordenados[clave])
+
+    def buscar(self, texto, productos, categoria_id=None):
+        """
+        Filtra ``productos`` (los de ``categoria_id``, si se indica) por la
+        búsqueda, ordenados por relevancia
+        """
+        if categoria_id:
+            try:
+                categoria_id = int(categoria_id)
+            except (TypeError, ValueError):
+                return []
+        ids = busqueda.buscar_ids(texto, categoria_id=categoria_id or None)
+        if ids is None:
+            texto = busqueda.plegar(texto)
+            return [
+                p for p in productos
+                if texto in busqueda.plegar(p.nombre) or texto in busqueda.plegar(p.descripcion)
+            ]
+
+        incluidos = {producto.pk for producto in productos}
+        return [self.por_id[pk] for pk in ids if pk in incluidos]
+
+
+def _leer_version():
+    from .models import VersionCatalogo
+
+    valor = VersionCatalogo.objects.filter(pk=1).values_list('valor', flat=True).first()
+    if valor is None:
+        # Valor inicial al azar: con una base nueva (o restaurada) ningún
+        # worker confunde su instantánea vieja con la versión nueva.
+        valor = VersionCatalogo.objects.get_or_create(pk=1, defaults={'valor': secrets.randbits(48)})[0].valor
+    return valor
+
+
+def version_catalogo():
+    """Versión vigente del catálogo, consultada como mucho cada ``CATALOGO_VERSION_SEGUNDOS``"""
+    global _version
+
+    actual = _version
+    if actual is not None and time.monotonic() - actual[1] < getattr(settings, 'CATALOGO_VERSION_SEGUNDOS', 5):
+        return actual[0]
+    valor = _leer_version()
+    _version = (valor, time.monotonic())
+    return valor
+
+
+def olvidar_version():
+    """La próxima llamada a ``version_catalogo`` consulta la base"""
+    global _version
+    _version = None
+
+
+def invalidar_catalogo():
+    """Incrementa la versión del catálogo para que los workers lo reconstruyan"""
+    from .models import VersionCatalogo
+
+    global _version
+
+    if not VersionCatalogo.objects.filter(pk=1).update(valor=F('valor') + 1):
+        _leer_version()
+        VersionCatalogo.objects.filter(pk=1).update(valor=F('valor') + 1)
+    # Este worker lo ve enseguida; los demás, en su próxima lectura
+    _version = (_leer_version(), time.monotonic())
+
+
+def construir_instantanea(version):
+    from .models import Categoria, Producto
+
+    productos = Producto.objects.filter(activo=True).select_related('categoria').order_by('pk')
+    categorias = Categoria.objects.order_by('pk')
+    return InstantaneaCatalogo(version, productos, categorias)
+
+
+def obtener_instantanea():
+    """Devuelve la instantánea vigente, reconstruyéndola si cambió la versión"""
+    global _instantanea
+
+    version = version_catalogo()
+    actual = _instantanea
+    if actual is not None and actual.version == version:
+        return actual
+
+    with _candado:
+        if _instantanea is None or _instantanea.version != version:
+            _instantanea = construir_instantanea(version)
+        return _instantanea
@@ -0,0 +1,173 @@
+"""
+Métricas de Prometheus por ruta: latencia, consultas SQL, tiempo en la base
+y tiempo de render de las plantillas.
+
+``MetricasMiddleware`` mide cada petición e instala un ``execute_wrapper``
+en las conexiones a la base mientras dura la vista. Las consultas se
+agrupan por *forma* (el SQL con sus parámetros como ``%s`` y las listas de
+``IN`` colapsadas): si una misma forma se repite ``METRICAS_N_MAS_UNO_UMBRAL``
+veces o más en una petición, se cuenta como un posible N+1 y se registra en
+el log con la vista y el SQL.
+
+Las rutas se identifican por el nombre de la URL (``tienda:catalogo``,
+``pedido-list``...), así que la cantidad de series no depende de los
+parámetros. Las respuestas por streaming se miden hasta que empiezan a
+enviarse.
+
+Con varios workers de gunicorn cada proceso escribe sus métricas en
+``PROMETHEUS_MULTIPROC_DIR`` (ver gunicorn.conf.py) y ``/metrics`` las suma
+con ``MultiProcessCollector``.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter as Conteo
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+logger = logging.getLogger(__name__)
+
+SIN_RUTA = '<sin_ruta>'
+
+LATENCIA = Histogram(
+    'tienda_peticion_segundos', 'Duración de las peticiones', ['vista', 'metodo'],
+)
+CONSULTAS = Histogram(
+    'tienda_peticion_consultas', 'Consultas SQL por petición', ['vista'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+TIEMPO_SQL = Histogram(
+    'tienda_peticion_sql_segundos', 'Tiempo en la base de datos por petición', ['vista'],
+)
+PLANTILLAS = Histogram(
+    'tienda_plantilla_segundos', 'Tiempo de render de las plantillas', ['plantilla'],
+)
+N_MAS_UNO = Counter(
+    'tienda_n_mas_uno', 'Peticiones con una misma consulta repetida muchas veces', ['vista'],
+)
+
+# ``IN (%s, %s, ...)`` y ``VALUES (...), (...)`` de largo variable cuentan como una sola forma
+_LISTAS = re.compile(r'\((?:%s, )+%s\)')
+_FILAS = re.compile(r'(\((?:%s|NULL|DEFAULT)(?:, (?:%s|NULL|DEFAULT))*\))(?:, \1)+')
+
+
+def forma(sql):
+    return _FILAS.sub(r'\1', _LISTAS.sub('(%s)', sql))
+
+
+def _umbral_n_mas_uno():
+    return getattr(settings, 'METRICAS_N_MAS_UNO_UMBRAL', 10)
+
+
+def nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return SIN_RUTA
+    return coincidencia.view_name or coincidencia.route or SIN_RUTA
+
+
+class _Recolector:
+    """``execute_wrapper``: cuenta y cronometra las consultas de una petición"""
+
+    def __init__(self):
+        self.formas = Conteo()
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.formas[forma(sql)] += 1
+
+    @property
+    def cantidad(self):
+        return sum(self.formas.values())
+
+    def repetidas(self, umbral):
+        return [(sql, veces) for sql, veces in self.formas.most_common() if veces >= umbral]
+
+
+class MetricasMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recolector = _Recolector()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(recolector))
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        vista = nombre_vista(request)
+        LATENCIA.labels(vista, request.method).observe(duracion)
+        CONSULTAS.labels(vista).observe(recolector.cantidad)
+        TIEMPO_SQL.labels(vista).observe(recolector.segundos)
+
+        repetidas = recolector.repetidas(_umbral_n_mas_uno())
+        if repetidas:
+            N_MAS_UNO.labels(vista).inc()
+            sql, veces = repetidas[0]
+            logger.warning("Posible N+1 en %s (%s): %d veces %s", vista, request.path, veces, sql[:300])
+        return response
+
+
+# ============================================
+# PLANTILLAS
+# ============================================
+
+_local = threading.local()
+
+
+def instrumentar_plantillas():
+    """
+    Mide ``Template.render`` de Django. Los ``{% include %}`` y
+    ``{% extends %}`` se renderizan dentro de otra plantilla: solo se mide la
+    de más afuera, para no contar dos veces el mismo tiempo.
+    """
+    from django.template.base import Template
+
+    if getattr(Template.render, 'instrumentado', False):
+        return
+    render_original = Template.render
+
+    def render(self, context):
+        if getattr(_local, 'renderizando', False):
+            return render_original(self, context)
+        _local.renderizando = True
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context)
+        finally:
+            _local.renderizando = False
+            PLANTILLAS.labels(self.origin.template_name or '<cadena>').observe(time.perf_counter() - inicio)
+
+    render.instrumentado = True
+    Template.render = render
+
+
+# ============================================
+# EXPORTACIÓN
+# ============================================
+
+def registro():
+    """Con ``PROMETHEUS_MULTIPROC_DIR`` suma las métricas de todos los workers"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registro_multiproceso = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro_multiproceso)
+        return registro_multiproceso
+    return REGISTRY
+
+
+def exportar():
+    """``(contenido, tipo_contenido)`` en el formato de texto de Prometheus"""
+    return generate_latest(registro()), CONTENT_TYPE_LATEST
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from tienda import busqueda
+from tienda.models import Categoria, Producto
+
+PALABRAS = [
+    'polera', 'poleron', 'taza', 'gorro', 'llavero', 'cojin', 'botella', 'lapiz',
+    'algodon', 'sublimada', 'estampada', 'bordada', 'personalizada', 'negra', 'blanca',
+    'azul', 'roja', 'diseño', 'logo', 'nombre', 'foto', 'regalo', 'cumpleaños',
+    'empresa', 'equipo', 'mascota', 'ceramica', 'satin', 'vinilo', 'manga', 'corta',
+]
+
+CONSULTAS = ['polera', 'poleras negras', 'taza ceramica', 'diseño', 'gorro bordado', 'regalo foto']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la latencia de la búsqueda del catálogo con icontains y con el "
+        "índice de texto completo. Los datos de prueba se descartan al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._ejecutar(options['productos'], options['repeticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _ejecutar(self, cantidad, repeticiones):
+        if not busqueda.indice_disponible():
+            self.stderr.write("No hay índice de búsqueda; ejecuta las migraciones primero.")
+            return
+
+        azar = random.Random(42)
+        # Vocabulario amplio: pocas palabras comunes y muchas poco frecuentes
+        vocabulario = PALABRAS + [
+            ''.join(azar.choices('abcdefghijklmnopqrstuvwxyz', k=7)) for _ in range(20000)
+        ]
+        categoria = Categoria.objects.create(nombre='Benchmark')
+
+        self.stdout.write(f"Creando {cantidad} productos...")
+        lote = []
+        for i in range(cantidad):
+            lote.append(Producto(
+                nombre=' '.join(azar.choices(vocabulario, k=3)).capitalize(),
+                descripcion=' '.join(azar.choices(vocabulario, k=25)),
+                categoria=categoria,
+                precio_base=azar.randint(3000, 30000),
+            ))
+            if len(lote) == 5000:
+                Producto.objects.bulk_create(lote)
+                lote = []
+        Producto.objects.bulk_create(lote)
+        busqueda.reconstruir_indice()
+
+        activos = Producto.objects.filter(activo=True)
+        self.stdout.write(f"{'consulta':<20}{'icontains ms':>15}{'indice ms':>15}{'resultados':>12}")
+        for consulta in CONSULTAS:
+            lenta = self._medir(repeticiones, lambda: list(activos.filter(
+                Q(nombre__icontains=consulta) | Q(descripcion__icontains=consulta)
+            )))
+            rapida = self._medir(repeticiones, lambda: busqueda.buscar_productos(activos, consulta))
+            resultados = len(busqueda.buscar_ids(consulta))
+            self.stdout.write(f"{consulta:<20}{lenta:>15.2f}{rapida:>15.2f}{resultados:>12}")
+
+    def _medir(self, repeticiones, funcion):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
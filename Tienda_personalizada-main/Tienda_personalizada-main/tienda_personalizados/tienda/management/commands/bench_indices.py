@@ -0,0 +1,135 @@
+import datetime
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.utils import timezone
+
+from tienda.filters import PedidoApiFilter
+from tienda.models import ESTADOS_EN_CURSO, Pedido
+
+# Índices de Pedido anteriores a la migración 0015: se mantienen en la medición "antes"
+ANTERIORES = {'pedido_fecha_id_idx'}
+
+# Mismo orden y tamaño de página que el listado del admin y la API
+ORDEN = ('-fecha_creacion', '-id')
+LIMITE = 100
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el plan (EXPLAIN) y el tiempo de las consultas de pedidos del admin y de la API "
+        "con los índices de Pedido y sin ellos. Los índices se quitan dentro de una transacción "
+        "que se deshace al terminar; mientras tanto la tabla queda bloqueada, así que úsese en una "
+        "base de pruebas (por ejemplo con generar_tienda_falsa --pedidos 1000000)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument(
+            '--sin', action='append', default=None,
+            help="Índice que se quita para medir el antes (repetible; por defecto los de la migración 0015)",
+        )
+        parser.add_argument(
+            '--analizar', action='store_true',
+            help="Ejecuta ANALYZE antes de medir (recomendado después de cargar datos en PostgreSQL)",
+        )
+
+    def handle(self, *args, **options):
+        if not Pedido.objects.exists():
+            raise CommandError("No hay pedidos: ejecuta generar_tienda_falsa primero.")
+        indices = options['sin'] or [indice.name for indice in Pedido._meta.indexes if indice.name not in ANTERIORES]
+        desconocidos = set(indices) - {indice.name for indice in Pedido._meta.indexes}
+        if desconocidos:
+            raise CommandError(f"Pedido no tiene estos índices: {', '.join(sorted(desconocidos))}")
+
+        if options['analizar']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        consultas = self._consultas()
+        despues = {nombre: self._medir(consulta, options['repeticiones'], 'despues') for nombre, consulta in consultas.items()}
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for nombre in indices:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(nombre)}')
+                antes = {nombre: self._medir(consulta, options['repeticiones'], 'antes') for nombre, consulta in consultas.items()}
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{Pedido.objects.count()} pedidos en {connection.vendor}; sin {', '.join(indices)} para el antes\n")
+        self.stdout.write(f"{'consulta':<24}{'antes ms':>12}{'después ms':>12}{'mejora':>10}")
+        for nombre in consultas:
+            ms_antes, plan_antes = antes[nombre]
+            ms_despues, plan_despues = despues[nombre]
+            mejora = f"{ms_antes / ms_despues:.0f}x" if ms_despues else ''
+            self.stdout.write(f"{nombre:<24}{ms_antes:>12.1f}{ms_despues:>12.1f}{mejora:>10}")
+        for nombre in consultas:
+            self.stdout.write(f"\n{nombre}")
+            self.stdout.write(f"  antes:   {antes[nombre][1]}")
+            self.stdout.write(f"  después: {despues[nombre][1]}")
+
+    def _consultas(self):
+        """
+        Lo que consultan los filtros del admin (list_filter: el conteo y la
+        primera página) y /api/pedidos/filtrar/ (la primera página)
+        """
+        hace_un_mes = (timezone.localdate() - datetime.timedelta(days=30)).isoformat()
+        email = Pedido.objects.order_by('-id').values_list('email', flat=True).first()
+
+        def admin(consulta):
+            return lambda: (consulta.count(), list(consulta.order_by(*ORDEN)[:LIMITE]))
+
+        def api(**parametros):
+            filtro = PedidoApiFilter(QueryDict(urlencode(parametros)), queryset=Pedido.objects.all())
+            if not filtro.is_valid():
+                raise CommandError(f"Filtro inválido {parametros}: {filtro.errors}")
+            return lambda: list(filtro.qs.order_by(*ORDEN)[:LIMITE])
+
+        return {
+            'admin_listado': admin(Pedido.objects.all()),
+            'admin_finalizados': admin(Pedido.objects.filter(estado_pedido='finalizado')),
+            'admin_en_curso': admin(Pedido.objects.filter(estado_pedido__in=ESTADOS_EN_CURSO)),
+            'admin_pago_parcial': admin(Pedido.objects.filter(estado_pago='parcial')),
+            'admin_presencial': admin(Pedido.objects.filter(plataforma='presencial')),
+            'api_en_proceso_mes': api(estado_pedido='en_proceso', fecha_inicio=hace_un_mes),
+            'api_finalizados': api(estado_pedido='finalizado'),
+            'api_whatsapp_pendiente': api(plataforma='whatsapp', estado_pago='pendiente'),
+            'api_varios_estados': api(estado_pedido='solicitado,aprobado'),
+            'api_cliente': api(email=email),
+        }
+
+    def _medir(self, consulta, repeticiones, etiqueta):
+        """``(mediana en ms, planes de sus consultas en una línea)``"""
+        ejecutadas = []
+
+        def guardar(execute, sql, params, many, context):
+            ejecutadas.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(guardar):
+            consulta()
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            consulta()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos), ' ; '.join(self._plan(sql, params, etiqueta) for sql, params in ejecutadas)
+
+    def _plan(self, sql, params, etiqueta):
+        # El comentario cambia el texto de la consulta: sqlite3 guarda las
+        # sentencias preparadas y un EXPLAIN reutilizado mostraría el plan de
+        # antes de quitar los índices
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} -- {etiqueta}', params)
+            lineas = [str(fila[-1]) if connection.vendor == 'sqlite' else str(fila[0]) for fila in cursor.fetchall()]
+        return ' | '.join(linea.strip() for linea in lineas)
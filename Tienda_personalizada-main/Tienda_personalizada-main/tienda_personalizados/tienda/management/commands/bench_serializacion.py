@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from tienda.models import Pedido
+from tienda.renderers import RenderizadorJSONRapido
+from tienda.serializers import PedidoSerializer, SerializadorRapido
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el tiempo de serializar y renderizar una respuesta de pedidos con "
+        "PedidoSerializer y con SerializadorRapido. Los datos de prueba se descartan al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._ejecutar(options['filas'], options['repeticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _ejecutar(self, cantidad, repeticiones):
+        azar = random.Random(42)
+        self.stdout.write(f"Creando {cantidad} pedidos...")
+        Pedido.objects.bulk_create([
+            Pedido(
+                nombre_cliente=f'Cliente {i}', email=f'cliente{i}@example.com',
+                descripcion_diseno='Logo bordado en el pecho, talla M',
+                plataforma=azar.choice(['instagram', 'whatsapp', 'sitio_web']),
+                token_seguimiento=f'b{i:09d}',
+                presupuesto_estimado=Decimal(azar.randint(5000, 30000)),
+            )
+            for i in range(cantidad)
+        ], batch_size=500)
+        pedidos = Pedido.objects.order_by('-fecha_creacion', '-id')[:cantidad]
+
+        def drf():
+            return JSONRenderer().render(PedidoSerializer(pedidos, many=True).data)
+
+        def rapido(renderizador):
+            serializador = SerializadorRapido(PedidoSerializer())
+            return renderizador.render(serializador.serializar(serializador.consulta(pedidos)))
+
+        if drf() != rapido(RenderizadorJSONRapido()):
+            self.stderr.write("¡Las respuestas no son idénticas!")
+            return
+
+        resultados = [
+            ('PedidoSerializer + JSONRenderer', self._medir(repeticiones, drf)),
+            ('SerializadorRapido + JSONRenderer', self._medir(repeticiones, lambda: rapido(JSONRenderer()))),
+            ('SerializadorRapido + orjson', self._medir(repeticiones, lambda: rapido(RenderizadorJSONRapido()))),
+        ]
+        base = resultados[0][1]
+        self.stdout.write(f"{'camino':<36}{'ms':>10}{'filas/s':>12}{'x':>8}")
+        for nombre, ms in resultados:
+            self.stdout.write(f"{nombre:<36}{ms:>10.1f}{cantidad / ms * 1000:>12.0f}{base / ms:>8.1f}")
+
+    def _medir(self, repeticiones, funcion):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
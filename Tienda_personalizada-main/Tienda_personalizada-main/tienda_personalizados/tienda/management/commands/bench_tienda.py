@@ -0,0 +1,227 @@
+import datetime
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from tienda.models import Insumo, Pedido, Producto
+
+
+# Usuario de prueba y correo de los pedidos que envía la medición (se borran al terminar)
+USUARIO = 'bench_tienda'
+CORREO = 'bench@example.com'
+
+
+def percentil(valores, p):
+    """Percentil ``p`` (0-100) por rango más cercano"""
+    ordenados = sorted(valores)
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)) - 1, 0)]
+
+
+class _Contador:
+    """``execute_wrapper`` que solo cuenta consultas (sin guardar el SQL como CaptureQueriesContext)"""
+
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide latencia (p50/p95) y consultas por petición de las páginas y la API de la tienda "
+        "sobre los datos actuales (por ejemplo los de generar_tienda_falsa) y guarda los resultados "
+        "en JSON. Cada petición se confirma como en producción (corren sus tareas on_commit) y al "
+        "terminar se borran los pedidos enviados y el usuario de prueba; úsese en una base de pruebas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--calentamiento', type=int, default=3)
+        parser.add_argument('--salida', default=None, help="Archivo JSON (por defecto bench-tienda-<fecha>.json)")
+        parser.add_argument('--comparar', default=None, help="JSON de una ejecución anterior para mostrar la diferencia")
+        parser.add_argument('--escenario', action='append', default=None, help="Solo estos escenarios (repetible)")
+        parser.add_argument(
+            '--cache-paginas', action='store_true',
+            help="Deja activo el caché de páginas (por defecto se mide el render de cada petición)",
+        )
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not Pedido.objects.exists() or not Producto.objects.exists():
+            raise CommandError("No hay datos: ejecuta generar_tienda_falsa primero.")
+
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar']) as archivo:
+                anterior = json.load(archivo)
+
+        self.azar = random.Random(options['semilla'])
+        # El cliente de pruebas de Django usa el host 'testserver'
+        ajustes = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['cache_paginas']:
+            ajustes.update({
+                'CACHES': {**settings.CACHES, 'bench_sin_cache': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                'CACHE_PAGINAS_ALIAS': 'bench_sin_cache',
+            })
+
+        ultimo_pedido = Pedido.objects.order_by('-pk').values_list('pk', flat=True).first()
+        try:
+            with override_settings(**ajustes):
+                resultados = self._ejecutar(options)
+        finally:
+            self._limpiar(ultimo_pedido)
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'commit': self._commit(),
+            'entorno': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'base_de_datos': connection.vendor,
+                'cache_paginas': options['cache_paginas'],
+                'repeticiones': options['repeticiones'],
+            },
+            'volumen': {
+                'pedidos': Pedido.objects.count(),
+                'productos': Producto.objects.count(),
+                'insumos': Insumo.objects.count(),
+            },
+            'escenarios': resultados,
+        }
+        salida = options['salida'] or f"bench-tienda-{timezone.localtime().strftime('%Y%m%d-%H%M%S')}.json"
+        with open(salida, 'w') as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+
+        self._mostrar(resultados, anterior)
+        self.stdout.write(self.style.SUCCESS(f"Resultados en {salida}"))
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    # ============================================
+    # ESCENARIOS
+    # ============================================
+
+    def _escenarios(self):
+        """``{nombre: función que devuelve (método, url, datos)}``, con datos elegidos al azar en cada llamada"""
+        tokens = list(Pedido.objects.order_by('?').values_list('token_seguimiento', flat=True)[:500])
+        pedidos = list(Pedido.objects.order_by('?').values_list('pk', flat=True)[:500])
+        productos = list(Producto.objects.filter(activo=True).order_by('?').values_list('pk', flat=True)[:500])
+        palabras = ['polera', 'taza bordada', 'regalo', 'gorro negro', 'logo empresa', 'ceramica']
+        hoy = timezone.localdate()
+        hace_un_mes = (hoy - datetime.timedelta(days=30)).isoformat()
+
+        def pedido_nuevo():
+            return 'post', reverse('tienda:solicitar_pedido'), {
+                'nombre_cliente': 'Cliente bench', 'email': CORREO,
+                'descripcion_diseno': 'Logo en el pecho', 'producto_referencia': self.azar.choice(productos or ['']),
+            }
+
+        return {
+            'catalogo': lambda: ('get', reverse('tienda:catalogo'), {}),
+            'catalogo_busqueda': lambda: ('get', reverse('tienda:catalogo'), {'q': self.azar.choice(palabras)}),
+            'detalle_producto': lambda: ('get', reverse('tienda:detalle_producto', args=[self.azar.choice(productos)]), {}),
+            'seguimiento_pedido': lambda: ('get', reverse('tienda:seguimiento_pedido', args=[self.azar.choice(tokens)]), {}),
+            'solicitar_pedido': pedido_nuevo,
+            'reporte': lambda: ('get', reverse('tienda:reporte'), {'fecha_inicio': hace_un_mes}),
+            'api_insumos': lambda: ('get', reverse('insumo-list'), {}),
+            'api_insumos_bajo_stock': lambda: ('get', reverse('insumo-bajo-stock'), {}),
+            'api_pedido': lambda: ('get', reverse('pedido-detail', args=[self.azar.choice(pedidos)]), {}),
+            'api_filtro_pedidos': lambda: ('get', reverse('api-filtro-pedidos'), {
+                'fecha_inicio': hace_un_mes, 'estado_pedido': 'solicitado,aprobado', 'tamano': 100,
+            }),
+            'api_reporte_pedidos': lambda: ('get', reverse('api-reporte-pedidos'), {'fecha_inicio': hace_un_mes}),
+            'api_metricas_pedidos': lambda: ('get', reverse('api-metricas-pedidos'), {'periodo': 'semana'}),
+        }
+
+    def _ejecutar(self, options):
+        # Sin transacción alrededor: si hubiera una, las tareas on_commit de
+        # las peticiones (purgas de caché, cotizaciones...) no correrían nunca
+        User.objects.filter(username=USUARIO).delete()
+        usuario = User.objects.create_superuser(USUARIO, CORREO, None)
+        anonimo = Client()
+        admin = Client()
+        admin.force_login(usuario)
+        try:
+            return self._medir_escenarios(options, anonimo, admin)
+        finally:
+            anonimo.logout()
+            admin.logout()
+
+    def _medir_escenarios(self, options, anonimo, admin):
+        # Las páginas públicas se miden como visitante; el reporte y la API, con sesión
+        publicos = {'catalogo', 'catalogo_busqueda', 'detalle_producto', 'seguimiento_pedido', 'solicitar_pedido'}
+
+        escenarios = self._escenarios()
+        if options['escenario']:
+            desconocidos = set(options['escenario']) - set(escenarios)
+            if desconocidos:
+                raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+            escenarios = {nombre: escenarios[nombre] for nombre in options['escenario']}
+
+        resultados = {}
+        for nombre, peticion in escenarios.items():
+            cliente = anonimo if nombre in publicos else admin
+            for _ in range(options['calentamiento']):
+                self._pedir(cliente, *peticion())
+            tiempos, consultas, estados = [], [], set()
+            for _ in range(options['repeticiones']):
+                milisegundos, cantidad, estado = self._pedir(cliente, *peticion())
+                tiempos.append(milisegundos)
+                consultas.append(cantidad)
+                estados.add(estado)
+            resultados[nombre] = {
+                'p50_ms': round(statistics.median(tiempos), 2),
+                'p95_ms': round(percentil(tiempos, 95), 2),
+                'max_ms': round(max(tiempos), 2),
+                'consultas_p50': statistics.median(consultas),
+                'consultas_max': max(consultas),
+                'estados_http': sorted(estados),
+            }
+        return resultados
+
+    def _limpiar(self, ultimo_pedido):
+        """Borra los pedidos que envió la medición (con sus señales, que descuentan el resumen) y el usuario"""
+        with transaction.atomic():
+            Pedido.objects.filter(pk__gt=ultimo_pedido or 0, email=CORREO).delete()
+            User.objects.filter(username=USUARIO).delete()
+
+    def _pedir(self, cliente, metodo, url, datos):
+        contador = _Contador()
+        with connections['default'].execute_wrapper(contador):
+            inicio = time.perf_counter()
+            respuesta = getattr(cliente, metodo)(url, datos)
+            milisegundos = (time.perf_counter() - inicio) * 1000
+        return milisegundos, contador.consultas, respuesta.status_code
+
+    def _mostrar(self, resultados, anterior):
+        previos = (anterior or {}).get('escenarios', {})
+        self.stdout.write(f"{'escenario':<26}{'p50 ms':>10}{'p95 ms':>10}{'consultas':>11}{'Δ p50':>10}")
+        for nombre, datos in resultados.items():
+            delta = ''
+            if nombre in previos and previos[nombre]['p50_ms']:
+                delta = f"{(datos['p50_ms'] / previos[nombre]['p50_ms'] - 1) * 100:+.0f}%"
+            self.stdout.write(
+                f"{nombre:<26}{datos['p50_ms']:>10.1f}{datos['p95_ms']:>10.1f}{datos['consultas_p50']:>11}{delta:>10}"
+            )
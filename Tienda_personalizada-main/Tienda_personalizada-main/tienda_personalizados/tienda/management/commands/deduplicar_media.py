@@ -0,0 +1,124 @@
+import os
+import shutil
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from tienda import imagenes
+from tienda.storage import (
+    almacenamiento_por_contenido, campos_por_contenido, es_nombre_por_contenido,
+    hash_contenido, nombre_por_contenido, recontar_referencias,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Renombra los archivos subidos antes del almacenamiento por contenido "
+        "al hash de su contenido, deja una sola copia de cada uno y recalcula "
+        "las referencias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular', action='store_true',
+            help="Solo muestra lo que se haría, sin tocar archivos ni la base de datos"
+        )
+        parser.add_argument(
+            '--borrar-huerfanos', action='store_true',
+            help="Borra también los archivos que ningún registro usa y no son copias de otro"
+        )
+
+    def handle(self, *args, **options):
+        storage = almacenamiento_por_contenido
+        simular = options['simular']
+        renombres = {}   # nombre anterior -> nombre por contenido
+        actualizados = 0
+
+        # 1. Registros que apuntan a nombres antiguos
+        for modelo, campo in campos_por_contenido():
+            filas = modelo._default_manager.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+            for pk, nombre in filas.values_list('pk', campo).iterator():
+                if es_nombre_por_contenido(nombre):
+                    continue
+                if nombre not in renombres:
+                    if not storage.exists(nombre):
+                        self.stderr.write(f"{modelo.__name__} {pk}: no existe {nombre}")
+                        continue
+                    renombres[nombre] = self._nombre_final(storage, nombre, simular)
+                if not simular:
+                    modelo._default_manager.filter(pk=pk).update(**{campo: renombres[nombre]})
+                actualizados += 1
+
+        # 2. Archivos en disco que ningún registro usa
+        carpetas = {os.path.dirname(nombre) for nombre in renombres} | {'productos', 'referencias'}
+        huerfanos = []
+        for carpeta in sorted(carpetas):
+            if not storage.exists(carpeta):
+                continue
+            for archivo in storage.listdir(carpeta)[1]:
+                nombre = f'{carpeta}/{archivo}'
+                if nombre in renombres:
+                    continue
+                with storage.open(nombre, 'rb') as f:
+                    final = nombre_por_contenido(nombre, hash_contenido(File(f)))
+                if final in renombres.values() or storage.exists(final):
+                    renombres[nombre] = final
+                else:
+                    huerfanos.append(nombre)
+
+        # 3. Borrar los nombres antiguos (ya copiados) y sus derivados
+        liberados = 0
+        for anterior, final in renombres.items():
+            if anterior == final:
+                continue
+            liberados += storage.size(anterior)
+            self.stdout.write(f"{anterior} -> {final}")
+            if not simular:
+                os.remove(storage.path(anterior))
+                imagenes.eliminar_derivados(anterior)
+
+        for nombre in huerfanos:
+            self.stdout.write(f"sin uso: {nombre}")
+            if options['borrar_huerfanos']:
+                liberados += storage.size(nombre)
+                if not simular:
+                    os.remove(storage.path(nombre))
+
+        if simular:
+            self.stdout.write(self.style.WARNING(
+                f"Simulación: {actualizados} registros, {len(set(renombres.values()))} archivos únicos, "
+                f"{liberados / 1024:.0f} KB se liberarían."
+            ))
+            return
+
+        # 4. Referencias y derivados con los nombres nuevos
+        conteo = recontar_referencias(storage)
+        for modelo, campo in campos_por_contenido():
+            if campo not in imagenes.CAMPOS_PRODUCTO:
+                continue
+            for objeto in modelo._default_manager.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True}).only(campo):
+                archivo = getattr(objeto, campo)
+                if archivo.name in renombres.values() and not imagenes.derivados(archivo):
+                    try:
+                        imagenes.generar_derivados(archivo)
+                    except Exception as e:
+                        self.stderr.write(f"{archivo.name}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{actualizados} registros actualizados, {len(conteo)} archivos únicos, "
+            f"{liberados / 1024:.0f} KB liberados."
+        ))
+
+    def _nombre_final(self, storage, nombre, simular):
+        """Deja una copia del archivo con su nombre por contenido (si no existe ya)"""
+        with storage.open(nombre, 'rb') as f:
+            final = nombre_por_contenido(nombre, hash_contenido(File(f)))
+        if not simular and not storage.exists(final):
+            destino = storage.path(final)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            try:
+                # Enlace duro: no ocupa espacio extra mientras conviven ambos nombres
+                os.link(storage.path(nombre), destino)
+            except OSError:
+                shutil.copy2(storage.path(nombre), destino)
+        return final
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from tienda import imagenes
+from tienda.models import Producto
+
+
+class Command(BaseCommand):
+    help = "Genera los derivados (anchos fijos, WebP/AVIF/JPEG) de las imágenes de productos existentes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forzar', action='store_true',
+            help="Regenera también las imágenes que ya tienen derivados"
+        )
+
+    def handle(self, *args, **options):
+        generadas = omitidas = fallidas = 0
+
+        for producto in Producto.objects.only(*imagenes.CAMPOS_PRODUCTO).iterator():
+            for campo in imagenes.CAMPOS_PRODUCTO:
+                archivo = getattr(producto, campo)
+                if not archivo:
+                    continue
+                if imagenes.derivados(archivo) and not options['forzar']:
+                    omitidas += 1
+                    continue
+                try:
+                    imagenes.generar_derivados(archivo)
+                    generadas += 1
+                except Exception as e:
+                    fallidas += 1
+                    self.stderr.write(f"{archivo.name}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{generadas} imágenes procesadas, {omitidas} ya tenían derivados, {fallidas} con error."
+        ))
@@ -0,0 +1,202 @@
+import datetime
+import hashlib
+import random
+import secrets
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from tienda import busqueda, resumen
+from tienda.models import (
+    ArchivoAlmacenado, Categoria, ImagenReferencia, Insumo, InsumoProducto, MovimientoStock, Pedido, Producto,
+)
+
+PALABRAS = [
+    'polera', 'poleron', 'taza', 'gorro', 'llavero', 'cojin', 'botella', 'lapiz', 'bolso', 'chapita',
+    'algodon', 'sublimada', 'estampada', 'bordada', 'personalizada', 'negra', 'blanca', 'azul', 'roja',
+    'diseño', 'logo', 'nombre', 'foto', 'regalo', 'cumpleaños', 'empresa', 'equipo', 'mascota',
+    'ceramica', 'satin', 'vinilo', 'manga', 'corta', 'larga', 'infantil', 'oversize', 'termica',
+]
+NOMBRES = ['Ana', 'Benjamín', 'Camila', 'Diego', 'Fernanda', 'Gabriel', 'Isidora', 'Joaquín', 'Martina', 'Tomás']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda']
+TIPOS_INSUMO = ['Tela', 'Tinta', 'Vinilo', 'Hilo', 'Cerámica', 'Papel transfer', 'Embalaje']
+
+# Distribución de estados de un pedido según su antigüedad: los antiguos ya terminaron
+ESTADOS_ANTIGUOS = (['finalizado'] * 70 + ['entregado'] * 10 + ['cancelado'] * 20)
+ESTADOS_RECIENTES = (
+    ['solicitado'] * 30 + ['aprobado'] * 20 + ['en_proceso'] * 20 + ['realizado'] * 10
+    + ['entregado'] * 10 + ['cancelado'] * 10
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena la base con una tienda sintética de volumen de producción (por defecto 1M de pedidos "
+        "y 100k productos) usando bulk_create, para medir con bench_tienda. Agrega datos: úsese "
+        "en una base de pruebas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pedidos', type=int, default=1_000_000)
+        parser.add_argument('--productos', type=int, default=100_000)
+        parser.add_argument('--categorias', type=int, default=40)
+        parser.add_argument('--insumos', type=int, default=2_000)
+        parser.add_argument('--dias', type=int, default=730, help="Antigüedad del pedido más viejo")
+        parser.add_argument(
+            '--imagenes', type=float, default=0.3,
+            help="Fracción de pedidos con imágenes de referencia (solo los registros, sin archivos)",
+        )
+        parser.add_argument('--lote', type=int, default=5_000)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.azar = random.Random(options['semilla'])
+        self.lote = options['lote']
+        inicio = time.perf_counter()
+
+        categorias = self._categorias(options['categorias'])
+        imagenes = self._archivos(max(options['productos'] // 10, 1))
+        productos = self._productos(options['productos'], categorias, imagenes)
+        insumos = self._insumos(options['insumos'])
+        self._recetas(productos, insumos)
+        self._pedidos(options['pedidos'], productos, imagenes, options['dias'], options['imagenes'])
+
+        self.stdout.write("Reconstruyendo el resumen diario y el índice de búsqueda...")
+        resumen.reconstruir()
+        if busqueda.indice_disponible():
+            busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f"Tienda generada en {time.perf_counter() - inicio:.0f} s."))
+
+    def _por_lotes(self, modelo, objetos, total, descripcion):
+        """``bulk_create`` por lotes, en una transacción por lote"""
+        creados = 0
+        lote = []
+        for objeto in objetos:
+            lote.append(objeto)
+            if len(lote) == self.lote:
+                with transaction.atomic():
+                    modelo.objects.bulk_create(lote)
+                creados += len(lote)
+                lote = []
+                if creados % (self.lote * 20) == 0:
+                    self.stdout.write(f"  {descripcion}: {creados}/{total}")
+        if lote:
+            with transaction.atomic():
+                modelo.objects.bulk_create(lote)
+
+    def _texto(self, palabras):
+        return ' '.join(self.azar.choices(PALABRAS, k=palabras))
+
+    def _categorias(self, cantidad):
+        Categoria.objects.bulk_create([
+            Categoria(nombre=f'{self._texto(1).capitalize()} {i}', descripcion=self._texto(8)) for i in range(cantidad)
+        ])
+        return list(Categoria.objects.order_by('-id').values_list('id', flat=True)[:cantidad])
+
+    def _archivos(self, cantidad):
+        """Nombres por contenido (tienda/storage.py) sin archivo real detrás"""
+        nombres = [f'productos/{hashlib.sha256(str(i).encode()).hexdigest()}.jpg' for i in range(cantidad)]
+        ArchivoAlmacenado.objects.bulk_create(
+            [ArchivoAlmacenado(nombre=nombre, tamano=self.azar.randint(40_000, 900_000)) for nombre in nombres],
+            ignore_conflicts=True,
+        )
+        return nombres
+
+    def _productos(self, cantidad, categorias, imagenes):
+        self.stdout.write(f"Creando {cantidad} productos...")
+        ultimo = Producto.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        self._por_lotes(Producto, (
+            Producto(
+                nombre=self._texto(3).capitalize(),
+                descripcion=self._texto(30),
+                categoria_id=self.azar.choice(categorias),
+                precio_base=Decimal(self.azar.randrange(3_000, 40_000, 100)),
+                activo=self.azar.random() < 0.9,
+                imagen_1=self.azar.choice(imagenes),
+                imagen_2=self.azar.choice(imagenes) if self.azar.random() < 0.5 else None,
+            )
+            for _ in range(cantidad)
+        ), cantidad, 'productos')
+        return list(Producto.objects.filter(id__gt=ultimo).values_list('id', flat=True))
+
+    def _insumos(self, cantidad):
+        self.stdout.write(f"Creando {cantidad} insumos...")
+        ultimo = Insumo.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        Insumo.objects.bulk_create([
+            Insumo(
+                nombre=f'{self.azar.choice(TIPOS_INSUMO)} {i}', tipo=self.azar.choice(TIPOS_INSUMO),
+                # Algunos con poco stock, para el listado de bajo stock
+                cantidad_disponible=self.azar.choice([0, 3, 8]) if self.azar.random() < 0.05 else self.azar.randint(10, 5_000),
+                unidad=self.azar.choice(Insumo.TIPOS_UNIDAD)[0],
+            )
+            for i in range(cantidad)
+        ], batch_size=self.lote)
+        insumos = list(Insumo.objects.filter(id__gt=ultimo).values_list('id', 'cantidad_disponible'))
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(insumo_id=pk, cantidad=cantidad, saldo=cantidad, motivo='inicial')
+            for pk, cantidad in insumos if cantidad
+        ], batch_size=self.lote)
+        return [pk for pk, _ in insumos]
+
+    def _recetas(self, productos, insumos):
+        if not insumos:
+            return
+        self._por_lotes(InsumoProducto, (
+            InsumoProducto(producto_id=producto, insumo_id=insumo, cantidad=self.azar.randint(1, 3))
+            for producto in productos
+            for insumo in self.azar.sample(insumos, min(len(insumos), self.azar.randint(1, 3)))
+        ), len(productos) * 2, 'insumos de productos')
+
+    def _pedidos(self, cantidad, productos, imagenes, dias, fraccion_imagenes):
+        self.stdout.write(f"Creando {cantidad} pedidos...")
+        ahora = timezone.now()
+        plataformas = [clave for clave, _ in Pedido.PLATAFORMAS]
+        pagos = [clave for clave, _ in Pedido.ESTADOS_PAGO]
+        ultimo = Pedido.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        def generar():
+            for i in range(cantidad):
+                # Más pedidos recientes que antiguos
+                antiguedad = datetime.timedelta(days=dias * self.azar.random() ** 1.5, seconds=self.azar.randint(0, 86_399))
+                fecha = ahora - antiguedad
+                estado = self.azar.choice(ESTADOS_RECIENTES if antiguedad.days < 30 else ESTADOS_ANTIGUOS)
+                estimado = Decimal(self.azar.randrange(5_000, 60_000, 500))
+                nombre = f'{self.azar.choice(NOMBRES)} {self.azar.choice(APELLIDOS)}'
+                yield Pedido(
+                    nombre_cliente=nombre,
+                    email=f'cliente{ultimo + i}@example.com',
+                    telefono=f'+569{self.azar.randint(10_000_000, 99_999_999)}',
+                    plataforma=self.azar.choice(plataformas),
+                    producto_referencia_id=self.azar.choice(productos) if productos and self.azar.random() < 0.8 else None,
+                    descripcion_diseno=self._texto(self.azar.randint(5, 40)),
+                    fecha_requerida=(fecha + datetime.timedelta(days=self.azar.randint(7, 45))).date(),
+                    estado_pedido=estado,
+                    estado_pago='pagado' if estado in ('entregado', 'finalizado') else self.azar.choice(pagos),
+                    # Como Pedido.save; no sale de la semilla para poder ejecutar el comando varias veces
+                    token_seguimiento=secrets.token_urlsafe(10)[:10],
+                    fecha_creacion=fecha,
+                    presupuesto_estimado=estimado,
+                    presupuesto_aprobado=estimado if estado not in ('solicitado', 'cancelado') else None,
+                )
+
+        self._por_lotes(Pedido, generar(), cantidad, 'pedidos')
+
+        if fraccion_imagenes > 0 and imagenes:
+            self.stdout.write("Creando imágenes de referencia...")
+            self._por_lotes(ImagenReferencia, (
+                ImagenReferencia(pedido_id=pk, imagen=self.azar.choice(imagenes).replace('productos/', 'referencias/'))
+                for pk in self._ids_desde(Pedido, ultimo) if self.azar.random() < fraccion_imagenes
+                for _ in range(self.azar.randint(1, 3))
+            ), int(cantidad * fraccion_imagenes * 2), 'imágenes de referencia')
+
+    def _ids_desde(self, modelo, ultimo):
+        """Ids mayores que ``ultimo``, leídos por tramos (sin un cursor abierto mientras se escribe)"""
+        while True:
+            ids = list(modelo.objects.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:self.lote])
+            if not ids:
+                return
+            yield from ids
+            ultimo = ids[-1]
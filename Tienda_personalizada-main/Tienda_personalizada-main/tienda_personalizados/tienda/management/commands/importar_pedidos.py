@@ -0,0 +1,40 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda import importacion
+from tienda.models import Pedido
+
+
+class Command(BaseCommand):
+    help = "Importa pedidos desde un archivo CSV o JSONL (una fila u objeto por pedido)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=importacion.FORMATOS,
+                            help="Por defecto se deduce de la extensión")
+        parser.add_argument('--plataforma', choices=[valor for valor, _ in Pedido.PLATAFORMAS],
+                            help="Plataforma para las filas que no la indiquen")
+        parser.add_argument('--lote', type=int, default=importacion.TAMANO_LOTE)
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or importacion.detectar_formato(options['archivo'])
+        valores = {'plataforma': options['plataforma']} if options['plataforma'] else {}
+
+        inicio = time.perf_counter()
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = importacion.importar_pedidos(archivo, formato, valores, lote=options['lote'])
+        except (OSError, ValidationError) as e:
+            raise CommandError(e)
+
+        for error in resultado.errores:
+            self.stderr.write(f"línea {error['linea']}: {error['error']}")
+        if resultado.total_errores > len(resultado.errores):
+            self.stderr.write(f"... y {resultado.total_errores - len(resultado.errores)} errores más")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.creados} pedidos importados, {resultado.total_errores} filas con error "
+            f"({time.perf_counter() - inicio:.1f}s)."
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from tienda import procesamiento
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa las imágenes de referencia que quedaron en el área de espera "
+        "(por ejemplo, si se reinició el servidor antes de terminar)"
+    )
+
+    def handle(self, *args, **options):
+        total = 0
+        for pedido_id in procesamiento.pedidos_en_espera():
+            procesadas = procesamiento.procesar_pedido(pedido_id)
+            self.stdout.write(f"Pedido {pedido_id}: {procesadas} imágenes procesadas")
+            total += procesadas
+        self.stdout.write(self.style.SUCCESS(f"{total} imágenes procesadas en total."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tienda import idempotencia
+
+
+class Command(BaseCommand):
+    help = "Borra las claves de idempotencia vencidas (conviene programarlo, por ejemplo una vez por hora)"
+
+    def handle(self, *args, **options):
+        borradas = idempotencia.purgar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f"{borradas} claves de idempotencia vencidas borradas."))
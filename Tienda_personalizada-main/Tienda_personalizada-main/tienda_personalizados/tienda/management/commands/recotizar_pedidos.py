@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda import presupuestos
+from tienda.models import Pedido
+
+
+class Command(BaseCommand):
+    help = "Recalcula el presupuesto estimado de los pedidos en borrador (por ejemplo, tras cambiar precios)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--producto', type=int, action='append', default=[],
+            help="Solo los pedidos de este producto (se puede repetir)"
+        )
+        parser.add_argument(
+            '--todos', action='store_true',
+            help="Incluye los pedidos que ya no están en borrador"
+        )
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pedidos = Pedido.objects.all()
+        if not options['todos']:
+            pedidos = pedidos.filter(estado_pedido__in=presupuestos.ESTADOS_BORRADOR)
+        if options['producto']:
+            pedidos = pedidos.filter(producto_referencia_id__in=options['producto'])
+
+        inicio = time.perf_counter()
+        actualizados = presupuestos.cotizar_pedidos(pedidos, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{actualizados} pedidos recotizados en {time.perf_counter() - inicio:.2f}s."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda import busqueda
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda del catálogo con los productos activos"
+
+    def handle(self, *args, **options):
+        if not busqueda.indice_disponible():
+            raise CommandError(
+                "No existe el índice de búsqueda en esta base de datos. "
+                "Ejecuta 'python manage.py migrate' primero."
+            )
+
+        total = busqueda.reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f"{total} productos indexados."))
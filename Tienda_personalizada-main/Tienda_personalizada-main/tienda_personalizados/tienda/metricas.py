@@ -0,0 +1,102 @@
+"""
+Métricas de pedidos por periodo (día, semana o mes).
+
+Se calculan sobre el resumen diario (``PedidoResumenDiario``), cuyo índice
+empieza por ``fecha``: un rango de años son unas pocas filas por día, que
+la base agrupa con ``TruncWeek``/``TruncMonth``. Los rangos se amplían al
+inicio y fin de sus periodos para que cada periodo esté completo.
+
+Un periodo está *cerrado* cuando ya terminó: no recibe pedidos nuevos, pero
+sus conteos por estado aún cambian si un pedido antiguo cambia de estado, por
+eso la API lo guarda en caché por un tiempo (``METRICAS_CACHE_CERRADOS_SEGUNDOS``)
+y no para siempre.
+"""
+import datetime
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+PERIODOS = ('dia', 'semana', 'mes')
+DIMENSIONES = ('plataforma', 'estado_pedido')
+
+# Periodos que se muestran cuando no se indica fecha de inicio
+PERIODOS_POR_DEFECTO = {'dia': 30, 'semana': 12, 'mes': 12}
+
+
+def inicio_periodo(fecha, periodo):
+    if periodo == 'semana':
+        return fecha - datetime.timedelta(days=fecha.weekday())
+    if periodo == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def siguiente_periodo(inicio, periodo):
+    if periodo == 'semana':
+        return inicio + datetime.timedelta(weeks=1)
+    if periodo == 'mes':
+        return (inicio + datetime.timedelta(days=32)).replace(day=1)
+    return inicio + datetime.timedelta(days=1)
+
+
+def rango(periodo, desde=None, hasta=None):
+    """``(desde, hasta)`` inclusive, ampliado a periodos completos"""
+    hasta = hasta or timezone.localdate()
+    if desde is None:
+        desde = inicio_periodo(hasta, periodo)
+        for _ in range(PERIODOS_POR_DEFECTO[periodo] - 1):
+            desde = inicio_periodo(desde - datetime.timedelta(days=1), periodo)
+    desde = inicio_periodo(desde, periodo)
+    hasta = siguiente_periodo(inicio_periodo(hasta, periodo), periodo) - datetime.timedelta(days=1)
+    return desde, hasta
+
+
+def _truncar(periodo):
+    if periodo == 'semana':
+        return TruncWeek('fecha')
+    if periodo == 'mes':
+        return TruncMonth('fecha')
+    return F('fecha')
+
+
+def series(filas, periodo='dia', por=None, desde=None, hasta=None):
+    """
+    Cantidad de pedidos y valor aprobado por periodo (y por ``plataforma`` o
+    ``estado_pedido`` si se indica ``por``) para un queryset del resumen
+    diario. Los periodos sin pedidos no aparecen.
+    """
+    if periodo not in PERIODOS:
+        raise ValueError(f"Periodo desconocido: {periodo}")
+    if por is not None and por not in DIMENSIONES:
+        raise ValueError(f"Dimensión desconocida: {por}")
+
+    desde, hasta = rango(periodo, desde, hasta)
+    hoy = timezone.localdate()
+    grupos = ['inicio', por] if por else ['inicio']
+
+    consulta = (
+        filas.filter(fecha__range=(desde, hasta))
+        .annotate(inicio=_truncar(periodo))
+        .values(*grupos)
+        .annotate(
+            cantidad=Sum('cantidad'),
+            total_aprobado=Sum('total_aprobado', filter=Q(estado_pedido='aprobado')),
+        )
+        .filter(cantidad__gt=0)
+        .order_by(*grupos)
+    )
+
+    resultados = []
+    for fila in consulta:
+        fila['total_aprobado'] = fila['total_aprobado'] or 0
+        fila['cerrado'] = siguiente_periodo(fila['inicio'], periodo) <= hoy
+        resultados.append(fila)
+    return {
+        'periodo': periodo,
+        'por': por,
+        'desde': desde,
+        'hasta': hasta,
+        'cerrado': hasta < hoy,
+        'resultados': resultados,
+    }
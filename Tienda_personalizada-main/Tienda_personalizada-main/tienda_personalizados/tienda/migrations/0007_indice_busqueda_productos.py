@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def crear_indice(apps, schema_editor):
+    from tienda import busqueda
+
+    if not busqueda.crear_indice(schema_editor.connection):
+        return
+
+    Producto = apps.get_model('tienda', 'Producto')
+    filas = Producto.objects.filter(activo=True).values_list('id', 'nombre', 'descripcion')
+    busqueda.indexar_filas(list(filas), conexion=schema_editor.connection)
+
+
+def eliminar_indice(apps, schema_editor):
+    from tienda import busqueda
+
+    busqueda.eliminar_indice(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tienda", "0006_alter_producto_imagen_1_alter_producto_imagen_2_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
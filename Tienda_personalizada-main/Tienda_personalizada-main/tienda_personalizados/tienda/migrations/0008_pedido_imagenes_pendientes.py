@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_indice_busqueda_productos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='imagenes_pendientes',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
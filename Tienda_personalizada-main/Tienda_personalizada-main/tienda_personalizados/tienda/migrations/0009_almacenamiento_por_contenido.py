@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-17 01:22
+
+import tienda.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0008_pedido_imagenes_pendientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoAlmacenado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('referencias', models.PositiveIntegerField(default=1)),
+                ('tamano', models.PositiveBigIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archivo almacenado',
+                'verbose_name_plural': 'Archivos almacenados',
+            },
+        ),
+        migrations.AlterField(
+            model_name='imagenreferencia',
+            name='imagen',
+            field=models.ImageField(storage=tienda.storage.AlmacenamientoPorContenido(), upload_to='referencias/'),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen_1',
+            field=models.ImageField(blank=True, null=True, storage=tienda.storage.AlmacenamientoPorContenido(), upload_to='productos/'),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen_2',
+            field=models.ImageField(blank=True, null=True, storage=tienda.storage.AlmacenamientoPorContenido(), upload_to='productos/'),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen_3',
+            field=models.ImageField(blank=True, null=True, storage=tienda.storage.AlmacenamientoPorContenido(), upload_to='productos/'),
+        ),
+    ]
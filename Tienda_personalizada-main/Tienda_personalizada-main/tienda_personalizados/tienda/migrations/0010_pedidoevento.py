@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 01:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_almacenamiento_por_contenido'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.CharField(choices=[('estado_pedido', 'Estado del pedido'), ('estado_pago', 'Estado del pago')], max_length=20)),
+                ('estado_anterior', models.CharField(blank=True, default='', max_length=20)),
+                ('estado_nuevo', models.CharField(max_length=20)),
+                ('nota', models.CharField(blank=True, default='', max_length=200)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='tienda.pedido')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Evento de pedido',
+                'verbose_name_plural': 'Eventos de pedidos',
+                'ordering': ['fecha', 'id'],
+                'indexes': [models.Index(fields=['pedido', 'fecha'], name='evento_pedido_fecha_idx'), models.Index(fields=['fecha'], name='evento_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-17 01:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def poblar_resumen(apps, schema_editor):
+    Pedido = apps.get_model('tienda', 'Pedido')
+    PedidoResumenDiario = apps.get_model('tienda', 'PedidoResumenDiario')
+
+    filas = (
+        Pedido.objects.annotate(dia=TruncDate('fecha_creacion', tzinfo=timezone.get_default_timezone()))
+        .order_by()
+        .values('dia', 'estado_pedido', 'plataforma', 'producto_referencia_id')
+        .annotate(cantidad=Count('id'), total=Sum('presupuesto_aprobado'))
+    )
+    PedidoResumenDiario.objects.bulk_create([
+        PedidoResumenDiario(
+            fecha=fila['dia'], estado_pedido=fila['estado_pedido'], plataforma=fila['plataforma'],
+            producto_id=fila['producto_referencia_id'], cantidad=fila['cantidad'],
+            total_aprobado=fila['total'] or 0,
+        )
+        for fila in filas.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_pedidoevento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado_pedido', models.CharField(choices=[('solicitado', 'Solicitado'), ('aprobado', 'Aprobado'), ('en_proceso', 'En proceso'), ('realizado', 'Realizado'), ('entregado', 'Entregado'), ('finalizado', 'Finalizado'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('plataforma', models.CharField(choices=[('facebook', 'Facebook'), ('instagram', 'Instagram'), ('whatsapp', 'WhatsApp'), ('sitio_web', 'Sitio Web'), ('presencial', 'Presencial'), ('otro', 'Otro')], max_length=20)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('total_aprobado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de pedidos',
+                'verbose_name_plural': 'Resumen diario de pedidos',
+                'indexes': [models.Index(fields=['fecha', 'estado_pedido', 'plataforma', 'producto'], name='resumen_clave_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_pedidoresumendiario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-17 01:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0012_pedido_fecha_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insumo',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(help_text='Positiva si entra stock, negativa si sale')),
+                ('saldo', models.IntegerField(help_text='Stock disponible después del movimiento')),
+                ('motivo', models.CharField(choices=[('inicial', 'Stock inicial'), ('reposicion', 'Reposición'), ('consumo', 'Consumo'), ('ajuste', 'Ajuste')], default='ajuste', max_length=20)),
+                ('nota', models.CharField(blank=True, default='', max_length=200)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='tienda.insumo')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['fecha', 'id'],
+                'indexes': [models.Index(fields=['insumo', 'fecha'], name='movimiento_insumo_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-17 01:57
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0013_movimientostock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InsumoProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+            ],
+            options={
+                'verbose_name': 'Insumo del producto',
+                'verbose_name_plural': 'Insumos del producto',
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientostock',
+            name='pedido',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='tienda.pedido'),
+        ),
+        migrations.AlterField(
+            model_name='movimientostock',
+            name='motivo',
+            field=models.CharField(choices=[('inicial', 'Stock inicial'), ('reposicion', 'Reposición'), ('consumo', 'Consumo'), ('ajuste', 'Ajuste'), ('reserva', 'Reserva para pedido'), ('liberacion', 'Devolución de reserva')], default='ajuste', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='insumo',
+            index=models.Index(fields=['cantidad_disponible'], name='insumo_cantidad_idx'),
+        ),
+        migrations.AddField(
+            model_name='insumoproducto',
+            name='insumo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='productos', to='tienda.insumo'),
+        ),
+        migrations.AddField(
+            model_name='insumoproducto',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='insumos', to='tienda.producto'),
+        ),
+        migrations.AddConstraint(
+            model_name='insumoproducto',
+            constraint=models.UniqueConstraint(fields=('producto', 'insumo'), name='insumo_producto_unico'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0014_reservas_insumos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado_pedido', 'fecha_creacion', 'id'], name='pedido_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado_pago', 'fecha_creacion', 'id'], name='pedido_pago_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['plataforma', 'fecha_creacion', 'id'], name='pedido_plataforma_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado_pedido__in', ['solicitado', 'aprobado', 'en_proceso', 'realizado'])), fields=['fecha_creacion', 'id'], name='pedido_en_curso_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['email'], name='pedido_email_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 02:35
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0015_indices_pedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(max_length=20)),
+                ('clave', models.CharField(max_length=64)),
+                ('huella', models.CharField(blank=True, default='', max_length=64)),
+                ('registro', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('expira', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Clave de idempotencia',
+                'verbose_name_plural': 'Claves de idempotencia',
+                'indexes': [models.Index(fields=['expira'], name='idempotencia_expira_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ambito', 'clave'), name='idempotencia_ambito_clave_unica')],
+            },
+        ),
+    ]
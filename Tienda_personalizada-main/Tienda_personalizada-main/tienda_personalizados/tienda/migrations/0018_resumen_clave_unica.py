@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 02:49
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unir_duplicados(apps, schema_editor):
+    # Pedidos concurrentes pudieron crear dos filas para la misma clave: se
+    # suman en la primera y se borran las demás
+    PedidoResumenDiario = apps.get_model('tienda', 'PedidoResumenDiario')
+
+    duplicadas = (
+        PedidoResumenDiario.objects.order_by()
+        .values('fecha', 'estado_pedido', 'plataforma', 'producto_id')
+        .annotate(filas=Count('id'), primera=Min('id'), cantidad=Sum('cantidad'), total=Sum('total_aprobado'))
+        .filter(filas__gt=1)
+    )
+    for clave in list(duplicadas):
+        iguales = PedidoResumenDiario.objects.filter(
+            fecha=clave['fecha'], estado_pedido=clave['estado_pedido'], plataforma=clave['plataforma'],
+            producto_id=clave['producto_id'],
+        )
+        iguales.filter(pk=clave['primera']).update(cantidad=clave['cantidad'], total_aprobado=clave['total'])
+        iguales.exclude(pk=clave['primera']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0017_version_catalogo'),
+    ]
+
+    operations = [
+        migrations.RunPython(unir_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pedidoresumendiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('producto__isnull', False)), fields=('fecha', 'estado_pedido', 'plataforma', 'producto'), name='resumen_clave_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='pedidoresumendiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('producto__isnull', True)), fields=('fecha', 'estado_pedido', 'plataforma'), name='resumen_clave_sin_producto_unica'),
+        ),
+    ]
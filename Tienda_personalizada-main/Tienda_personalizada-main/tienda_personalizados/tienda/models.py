@@ -1,9 +1,15 @@
 # models.py - VERSIÓN FINAL SIN UUID
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
-from django.db.models import F
+from django.core.validators import MinValueValidator
+from django.db.models import F, Q
 import secrets  # Para generar tokens simples
 
+from . import stock
+from .storage import almacenamiento_por_contenido
+
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True)
@@ -21,9 +27,9 @@ class Producto(models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
     precio_base = models.DecimalField(max_digits=10, decimal_places=2)
     activo = models.BooleanField(default=True)
-    imagen_1 = models.ImageField(upload_to='productos/', blank=True, null=True)
-    imagen_2 = models.ImageField(upload_to='productos/', blank=True, null=True)
-    imagen_3 = models.ImageField(upload_to='productos/', blank=True, null=True)
+    imagen_1 = models.ImageField(upload_to='productos/', storage=almacenamiento_por_contenido, blank=True, null=True)
+    imagen_2 = models.ImageField(upload_to='productos/', storage=almacenamiento_por_contenido, blank=True, null=True)
+    imagen_3 = models.ImageField(upload_to='productos/', storage=almacenamiento_por_contenido, blank=True, null=True)
     
     class Meta:
         verbose_name = "Producto"
@@ -59,13 +65,39 @@ class Insumo(models.Model):
         verbose_name="Color"
     )
     
+    # Sube con cada movimiento de stock (control optimista, ver tienda/stock.py)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name = "Insumo"
         verbose_name_plural = "Insumos"
+        indexes = [
+            # Listado de bajo stock (stock.bajo_stock)
+            models.Index(fields=['cantidad_disponible'], name='insumo_cantidad_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} ({self.cantidad_disponible} {self.unidad})"
 
+class InsumoProducto(models.Model):
+    """Insumos que consume cada pedido de un producto (lista de materiales)"""
+    producto = models.ForeignKey(Producto, related_name='insumos', on_delete=models.CASCADE)
+    insumo = models.ForeignKey(Insumo, related_name='productos', on_delete=models.PROTECT)
+    cantidad = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    
+    class Meta:
+        verbose_name = "Insumo del producto"
+        verbose_name_plural = "Insumos del producto"
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'insumo'], name='insumo_producto_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.producto_id}: {self.cantidad} x {self.insumo_id}"
+
+# Pedidos que el taller todavía tiene que trabajar (índice parcial pedido_en_curso_idx)
+ESTADOS_EN_CURSO = ['solicitado', 'aprobado', 'en_proceso', 'realizado']
+
 class Pedido(models.Model):
     ESTADOS_PEDIDO = [
         ('solicitado', 'Solicitado'),
@@ -132,42 +164,105 @@ class Pedido(models.Model):
         verbose_name="Presupuesto estimado"
     )
     
+    # Imágenes de referencia subidas que aún se están procesando
+    imagenes_pendientes = models.PositiveSmallIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Rangos de fecha y paginación por cursor (-fecha_creacion, -id) de la API
+            models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_id_idx'),
+            # Filtros del admin y de la API por un valor, con el mismo orden que el
+            # listado: se leen solo las filas de ese valor, ya ordenadas
+            models.Index(fields=['estado_pedido', 'fecha_creacion', 'id'], name='pedido_estado_fecha_idx'),
+            models.Index(fields=['estado_pago', 'fecha_creacion', 'id'], name='pedido_pago_fecha_idx'),
+            models.Index(fields=['plataforma', 'fecha_creacion', 'id'], name='pedido_plataforma_fecha_idx'),
+            # Solo los pedidos en curso, una fracción pequeña de la tabla (filtro "En curso" del admin)
+            models.Index(
+                fields=['fecha_creacion', 'id'], name='pedido_en_curso_idx',
+                condition=Q(estado_pedido__in=ESTADOS_EN_CURSO),
+            ),
+            # Pedidos de un cliente
+            models.Index(fields=['email'], name='pedido_email_idx'),
+        ]
     
     def __str__(self):
         return f"Pedido #{self.id} - {self.nombre_cliente}"
     
     def get_absolute_url(self):
         from django.urls import reverse
-        return reverse('seguimiento_pedido', kwargs={'token': self.token_seguimiento})
+        return reverse('tienda:seguimiento_pedido', kwargs={'token': self.token_seguimiento})
     
-    def calcular_presupuesto(self):
-        """Calcula presupuesto automáticamente basado en producto y complejidad"""
-        if self.producto_referencia:
-            self.producto_referencia.refresh_from_db()
-            base = float(self.producto_referencia.precio_base)
-        else:
-            base = 7000
-        
-        palabras = len(self.descripcion_diseno.split())
+    # Campos de los que depende el presupuesto estimado (además de las
+    # imágenes, que recotizan desde sus propias señales)
+    CAMPOS_PRESUPUESTO = ('producto_referencia_id', 'descripcion_diseno')
 
-        complejidad_factor = (palabras// 30) * 0.1
+    # Campos cuyos cambios quedan en el historial (PedidoEvento)
+    CAMPOS_ESTADO = ('estado_pedido', 'estado_pago')
 
-        complejidad = min(complejidad_factor, 0.5)
-        
-        # Contar imágenes de referencia
-        try:
-            imagenes = self.imagenes_referencia.count()
-        except:
-            imagenes = 0
-        
-        factor_imagenes = min(imagenes * 0.05, 0.2)
-        
-        total = base * (1 + complejidad + factor_imagenes)
-        return int(round(total))
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        pedido = super().from_db(db, field_names, values)
+        pedido._entradas_presupuesto = pedido._valores_presupuesto()
+        pedido._estados_originales = pedido._valores_estado()
+        pedido._resumen_original = pedido._valores_resumen()
+        return pedido
+
+    # Campos que definen el aporte del pedido a PedidoResumenDiario
+    CAMPOS_RESUMEN = ('fecha_creacion', 'estado_pedido', 'plataforma', 'producto_referencia_id', 'presupuesto_aprobado')
+
+    def _valores_resumen(self):
+        """Valores actuales para el resumen diario, o None si alguno no está cargado"""
+        if any(campo not in self.__dict__ for campo in self.CAMPOS_RESUMEN):
+            return None
+        return {campo: self.__dict__[campo] for campo in self.CAMPOS_RESUMEN}
+
+    def _valores_estado(self):
+        return {campo: self.__dict__[campo] for campo in self.CAMPOS_ESTADO if campo in self.__dict__}
+
+    def cambios_de_estado(self):
+        """``[(campo, anterior, nuevo), ...]`` respecto de lo cargado de la BD"""
+        anteriores = getattr(self, '_estados_originales', {})
+        return [
+            (campo, anteriores[campo], valor)
+            for campo, valor in self._valores_estado().items()
+            if campo in anteriores and anteriores[campo] != valor
+        ]
+
+    def _valores_presupuesto(self):
+        # Solo los campos cargados: los diferidos no se consultan
+        return {campo: self.__dict__[campo] for campo in self.CAMPOS_PRESUPUESTO if campo in self.__dict__}
+
+    def presupuesto_desactualizado(self):
+        """True si cambió algún dato del que depende el presupuesto estimado"""
+        if self._state.adding or self.__dict__.get('presupuesto_estimado', 0) is None:
+            return True
+        anteriores = getattr(self, '_entradas_presupuesto', None)
+        if anteriores is None:
+            return True
+        return any(
+            campo not in anteriores or anteriores[campo] != valor
+            for campo, valor in self._valores_presupuesto().items()
+        )
+
+    def _releer_estados(self):
+        """
+        Toma como estados originales los de la fila en la BD, bloqueándola
+        hasta el fin de la transacción (se llama dentro de ``transaccion_de_reserva``)
+        """
+        actuales = Pedido.objects.select_for_update().filter(pk=self.pk).order_by().values(*self.CAMPOS_ESTADO).first()
+        if actuales is None:
+            return
+        self._estados_originales = actuales
+        if getattr(self, '_resumen_original', None) is not None:
+            self._resumen_original = {**self._resumen_original, 'estado_pedido': actuales['estado_pedido']}
+
+    def calcular_presupuesto(self):
+        """Calcula presupuesto automáticamente basado en producto y complejidad"""
+        from .presupuestos import presupuesto_para
+        return presupuesto_para(self)
     
     def save(self, *args, **kwargs):
         # ✅ Asegurar token de seguimiento SIN UUID
@@ -175,14 +270,44 @@ class Pedido(models.Model):
             # Generar token simple de 10 caracteres (ej: "AbC123DeFg")
             self.token_seguimiento = secrets.token_urlsafe(10)[:10]
         
-        # Calcular presupuesto estimado si no existe
-        self.presupuesto_estimado = self.calcular_presupuesto()
+        # Recalcular el presupuesto estimado solo si cambiaron sus datos
+        if self.presupuesto_desactualizado():
+            self.presupuesto_estimado = self.calcular_presupuesto()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'presupuesto_estimado'}
         
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or 'estado_pedido' not in self.__dict__ or (
+            update_fields is not None and 'estado_pedido' not in update_fields
+        ):
+            # El historial se escribe en la señal post_save (tienda/signals.py)
+            self._cambios_estado = [] if self._state.adding else self.cambios_de_estado()
+            super().save(*args, **kwargs)
+        else:
+            with stock.transaccion_de_reserva():
+                # Otra copia del pedido pudo cambiar el estado desde que se
+                # cargó esta: la reserva se decide con el de la fila bloqueada
+                self._releer_estados()
+                self._cambios_estado = self.cambios_de_estado()
+                movimiento = next((
+                    stock.movimiento_por_cambio(anterior, nuevo)
+                    for campo, anterior, nuevo in self._cambios_estado if campo == 'estado_pedido'
+                ), None)
+                usuario = getattr(self, '_usuario_cambio', None)
+                if movimiento == 'reserva':
+                    faltantes = stock.reservar([(self.pk, self.producto_referencia_id)], usuario=usuario)
+                    if faltantes:
+                        raise stock.StockInsuficiente(faltantes[self.pk])
+                elif movimiento == 'liberacion':
+                    stock.liberar([self.pk], usuario=usuario)
+                super().save(*args, **kwargs)
+        self._entradas_presupuesto = self._valores_presupuesto()
+        self._estados_originales = self._valores_estado()
+        self._resumen_original = self._valores_resumen()
 
 class ImagenReferencia(models.Model):
     pedido = models.ForeignKey(Pedido, related_name='imagenes_referencia', on_delete=models.CASCADE)
-    imagen = models.ImageField(upload_to='referencias/')
+    imagen = models.ImageField(upload_to='referencias/', storage=almacenamiento_por_contenido)
     descripcion = models.CharField(max_length=200, blank=True)
     fecha_subida = models.DateTimeField(auto_now_add=True)
     
@@ -193,3 +318,178 @@ class ImagenReferencia(models.Model):
     def __str__(self):
         return f"Imagen para {self.pedido}"
 
+class PedidoEvento(models.Model):
+    """Historial de cambios de estado de un pedido (solo se agregan filas)"""
+    CAMPOS = [
+        ('estado_pedido', 'Estado del pedido'),
+        ('estado_pago', 'Estado del pago'),
+    ]
+
+    pedido = models.ForeignKey(Pedido, related_name='eventos', on_delete=models.CASCADE)
+    campo = models.CharField(max_length=20, choices=CAMPOS)
+    estado_anterior = models.CharField(max_length=20, blank=True, default="")
+    estado_nuevo = models.CharField(max_length=20)
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    nota = models.CharField(max_length=200, blank=True, default="")
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Evento de pedido"
+        verbose_name_plural = "Eventos de pedidos"
+        ordering = ['fecha', 'id']
+        indexes = [
+            # Línea de tiempo de un pedido y actividad reciente de la tienda
+            models.Index(fields=['pedido', 'fecha'], name='evento_pedido_fecha_idx'),
+            models.Index(fields=['fecha'], name='evento_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pedido_id}: {self.estado_anterior} -> {self.estado_nuevo}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("El historial de pedidos no se puede modificar.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("El historial de pedidos no se puede modificar.")
+
+class MovimientoStock(models.Model):
+    """Libro de movimientos de stock de los insumos (solo se agregan filas)"""
+    MOTIVOS_AJUSTE = [
+        ('inicial', 'Stock inicial'),
+        ('reposicion', 'Reposición'),
+        ('consumo', 'Consumo'),
+        ('ajuste', 'Ajuste'),
+    ]
+    # Los registra el cambio de estado de un pedido, no un ajuste manual
+    MOTIVOS_PEDIDO = [
+        ('reserva', 'Reserva para pedido'),
+        ('liberacion', 'Devolución de reserva'),
+    ]
+    MOTIVOS = MOTIVOS_AJUSTE + MOTIVOS_PEDIDO
+
+    insumo = models.ForeignKey(Insumo, related_name='movimientos', on_delete=models.CASCADE)
+    cantidad = models.IntegerField(help_text="Positiva si entra stock, negativa si sale")
+    saldo = models.IntegerField(help_text="Stock disponible después del movimiento")
+    motivo = models.CharField(max_length=20, choices=MOTIVOS, default='ajuste')
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    nota = models.CharField(max_length=200, blank=True, default="")
+    pedido = models.ForeignKey(
+        Pedido, null=True, blank=True, on_delete=models.SET_NULL, related_name='movimientos_stock'
+    )
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+        ordering = ['fecha', 'id']
+        indexes = [
+            models.Index(fields=['insumo', 'fecha'], name='movimiento_insumo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.insumo_id}: {self.cantidad:+d} ({self.motivo})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Los movimientos de stock no se pueden modificar.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Los movimientos de stock no se pueden modificar.")
+
+class PedidoResumenDiario(models.Model):
+    """
+    Pedidos por día, estado, plataforma y producto (ver tienda/resumen.py).
+    Se mantiene al guardar/eliminar pedidos y alimenta el reporte.
+    """
+    fecha = models.DateField()
+    estado_pedido = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO)
+    plataforma = models.CharField(max_length=20, choices=Pedido.PLATAFORMAS)
+    # Sin restricción de clave foránea: al eliminar un producto se
+    # reconstruyen sus días (sus pedidos quedan sin producto)
+    producto = models.ForeignKey(
+        Producto, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    cantidad = models.IntegerField(default=0)
+    total_aprobado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen diario de pedidos"
+        verbose_name_plural = "Resumen diario de pedidos"
+        indexes = [
+            models.Index(fields=['fecha', 'estado_pedido', 'plataforma', 'producto'], name='resumen_clave_idx'),
+        ]
+        # Una fila por clave. NULL no choca con NULL en un índice único, así
+        # que las filas sin producto tienen su propia restricción parcial
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'estado_pedido', 'plataforma', 'producto'],
+                condition=models.Q(producto__isnull=False), name='resumen_clave_unica',
+            ),
+            models.UniqueConstraint(
+                fields=['fecha', 'estado_pedido', 'plataforma'],
+                condition=models.Q(producto__isnull=True), name='resumen_clave_sin_producto_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.estado_pedido} {self.plataforma}: {self.cantidad}"
+
+class ArchivoAlmacenado(models.Model):
+    """Archivo guardado por contenido y cuántos registros lo usan"""
+    nombre = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=1)
+    tamano = models.PositiveBigIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archivo almacenado"
+        verbose_name_plural = "Archivos almacenados"
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias})"
+
+class ClaveIdempotencia(models.Model):
+    """
+    Envío de un pedido con su clave de idempotencia (ver tienda/idempotencia.py).
+    Sin ``registro`` el envío sigue en curso.
+    """
+    ambito = models.CharField(max_length=20)
+    # sha256 de la clave del cliente, que puede medir hasta 255 caracteres
+    clave = models.CharField(max_length=64)
+    huella = models.CharField(max_length=64, blank=True, default="")
+    registro = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expira = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Clave de idempotencia"
+        verbose_name_plural = "Claves de idempotencia"
+        constraints = [
+            models.UniqueConstraint(fields=['ambito', 'clave'], name='idempotencia_ambito_clave_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['expira'], name='idempotencia_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ambito}:{self.clave[:12]}"
+
+class VersionCatalogo(models.Model):
+    """
+    Versión del catálogo, compartida por todos los workers (una sola fila;
+    ver tienda/instantanea.py). Sube con cada cambio de productos o categorías.
+    """
+    valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Versión del catálogo"
+        verbose_name_plural = "Versión del catálogo"
+
+    def __str__(self):
+        return str(self.valor)
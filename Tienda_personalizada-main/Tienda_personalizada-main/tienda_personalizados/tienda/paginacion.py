@@ -0,0 +1,178 @@
+"""
+Paginación por cursor (keyset).
+
+En vez de ``OFFSET n`` (que obliga a la base de datos a recorrer y descartar
+las ``n`` filas anteriores) cada página guarda en un cursor opaco los valores
+de orden de su último elemento, y la siguiente página pide "lo que viene
+después" de esos valores. Con un índice sobre las columnas de orden, la
+página 1000 cuesta lo mismo que la primera.
+
+El orden siempre debe terminar en una columna única (normalmente ``id``) para
+que sea estable.
+"""
+import base64
+import binascii
+import json
+from bisect import bisect_right
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class PaginaCursor:
+    def __init__(self, objetos, siguiente):
+        self.objetos = objetos
+        self.siguiente = siguiente
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+
+class PaginadorCursor:
+    """
+    ``orden`` es una tupla de campos del modelo, con ``-`` para orden
+    descendente, por ejemplo ``('precio_base', 'id')`` o
+    ``('-fecha_creacion', '-id')``.
+    """
+
+    def __init__(self, modelo, orden, tamano):
+        self.modelo = modelo
+        self.orden = tuple(orden)
+        self.tamano = tamano
+        self.campos = [campo.lstrip('-') for campo in self.orden]
+        self.descendente = [campo.startswith('-') for campo in self.orden]
+
+    # -- cursores --------------------------------------------------------
+
+    def codificar(self, objeto):
+        if isinstance(objeto, dict):
+            # Fila de .values(): basta una instancia con las columnas del orden
+            objeto = self.modelo(**{campo: objeto[campo] for campo in self.campos})
+        valores = [self.modelo._meta.get_field(campo).value_to_string(objeto) for campo in self.campos]
+        crudo = json.dumps(valores, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(crudo).decode().rstrip('=')
+
+    def decodificar(self, cursor):
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+            if not isinstance(valores, list) or len(valores) != len(self.campos):
+                raise ValueError
+            return [
+                self.modelo._meta.get_field(campo).to_python(valor)
+                for campo, valor in zip(self.campos, valores)
+            ]
+        except (ValueError, TypeError, binascii.Error, ValidationError) as e:
+            raise CursorInvalido(cursor) from e
+
+    # -- paginación ------------------------------------------------------
+
+    def _despues_de(self, valores):
+        """Q para "todo lo que viene después de ``valores``" en el orden dado"""
+        condicion = Q()
+        for i in reversed(range(len(self.campos))):
+            campo = self.campos[i]
+            lookup = 'lt' if self.descendente[i] else 'gt'
+            estricto = Q(**{f'{campo}__{lookup}': valores[i]})
+            if i == len(self.campos) - 1:
+                condicion = estricto
+            else:
+                condicion = estricto | (Q(**{campo: valores[i]}) & condicion)
+        return condicion
+
+    def _clave(self, objeto):
+        return tuple(getattr(objeto, campo) for campo in self.campos)
+
+    def paginar(self, objetos, cursor=None):
+        """
+        Devuelve una ``PaginaCursor``. ``objetos`` puede ser un queryset (también
+        de ``.values()``, con las columnas del orden) o una lista ya ordenada de
+        forma ascendente por ``orden``.
+        """
+        valores = self.decodificar(cursor) if cursor else None
+
+        if isinstance(objetos, QuerySet):
+            queryset = objetos.order_by(*self.orden)
+            if valores is not None:
+                queryset = queryset.filter(self._despues_de(valores))
+            pagina = list(queryset[:self.tamano + 1])
+        else:
+            if any(self.descendente):
+                raise ValueError("Las listas solo se paginan en orden ascendente")
+            inicio = 0
+            if valores is not None:
+                inicio = bisect_right(objetos, tuple(valores), key=self._clave)
+            pagina = objetos[inicio:inicio + self.tamano + 1]
+
+        siguiente = None
+        if len(pagina) > self.tamano:
+            pagina = pagina[:self.tamano]
+            siguiente = self.codificar(pagina[-1])
+        return PaginaCursor(pagina, siguiente)
+
+
+# ============================================
+# PAGINACIÓN PARA LA API (DRF)
+# ============================================
+
+class PaginacionCursor(BasePagination):
+    """Paginación por cursor para DRF, con respuesta ``{next, results}``"""
+
+    orden = ('-fecha_creacion', '-id')
+    tamano_pagina = 50
+    tamano_maximo = 1000
+    parametro_cursor = 'cursor'
+    parametro_tamano = 'tamano'
+
+    # Nombres anteriores del parámetro de tamaño que se siguen aceptando
+    alias_tamano = ()
+
+    def obtener_tamano(self, request):
+        valor = request.query_params.get(self.parametro_tamano)
+        for alias in self.alias_tamano:
+            if valor is None:
+                valor = request.query_params.get(alias)
+        try:
+            tamano = int(valor) if valor is not None else self.tamano_pagina
+        except ValueError:
+            tamano = self.tamano_pagina
+        return max(1, min(tamano, self.tamano_maximo))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginador = PaginadorCursor(queryset.model, self.orden, self.obtener_tamano(request))
+        try:
+            self.pagina = paginador.paginar(queryset, request.query_params.get(self.parametro_cursor))
+        except CursorInvalido:
+            raise NotFound('Cursor inválido.')
+        return self.pagina.objetos
+
+    def get_next_link(self):
+        if self.pagina.siguiente is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.parametro_cursor, self.pagina.siguiente)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class PaginacionPedidos(PaginacionCursor):
+    """/api/pedidos/filtrar/: acepta también ``limite``, el parámetro que usaba antes"""
+
+    alias_tamano = ('limite',)
@@ -0,0 +1,206 @@
+"""
+Perfilado de peticiones individuales.
+
+``PerfiladoMiddleware`` perfila una petición (la vista y el render de sus
+plantillas) solo si la pide:
+
+- un usuario del staff con ``?perfilar=1``, o
+- cualquiera con la cabecera ``X-Perfilar`` firmada (``firmar()``, válida por
+  ``PERFILADO_FIRMA_SEGUNDOS``), para perfilar desde curl o la API.
+
+Con pyinstrument instalado se usa su perfilador por muestreo y se guardan
+las pilas colapsadas (``.txt``, el formato de flamegraph.pl y speedscope);
+si no, cProfile y un ``.prof`` para pstats/snakeviz. Los archivos quedan en
+``PERFILADO_DIR`` (se conservan los ``PERFILADO_MAXIMO`` más recientes) y se
+listan en /admin/perfiles/. La respuesta perfilada lleva la cabecera
+``X-Perfil`` con el nombre del archivo.
+
+Con ``PERFILADO_ACTIVO = False`` el middleware se desactiva al iniciar; si
+está activo, una petición que no pide perfilado solo paga dos búsquedas en
+diccionarios.
+"""
+import cProfile
+import os
+import re
+import secrets
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .instrumentacion import nombre_vista
+
+CABECERA = 'HTTP_X_PERFILAR'
+PARAMETRO = 'perfilar'
+_SAL = 'tienda.perfilado'
+
+# 20261017-154500_tienda-catalogo_123ms_a1b2c3.prof
+_NOMBRE = re.compile(r'^(?P<fecha>\d{8}-\d{6})_(?P<vista>[\w.-]+)_(?P<ms>\d+)ms_[0-9a-f]+\.(?P<formato>prof|txt)$')
+
+
+def directorio():
+    return settings.PERFILADO_DIR
+
+
+def firmar():
+    """Valor para la cabecera X-Perfilar"""
+    return signing.dumps('perfilar', salt=_SAL)
+
+
+def firma_valida(valor):
+    try:
+        return signing.loads(valor, salt=_SAL, max_age=getattr(settings, 'PERFILADO_FIRMA_SEGUNDOS', 3600)) == 'perfilar'
+    except signing.BadSignature:
+        return False
+
+
+def pedido(request):
+    """True si la petición pide ser perfilada y puede hacerlo"""
+    if PARAMETRO in request.GET and request.user.is_staff:
+        return True
+    return CABECERA in request.META and firma_valida(request.META[CABECERA])
+
+
+# ============================================
+# PERFILADORES
+# ============================================
+
+class _CProfile:
+    formato = 'prof'
+
+    def __init__(self):
+        self.perfil = cProfile.Profile()
+
+    def __enter__(self):
+        self.perfil.enable()
+
+    def __exit__(self, *exc):
+        self.perfil.disable()
+
+    def guardar(self, ruta):
+        self.perfil.dump_stats(ruta)
+
+
+class _Muestreo:
+    """pyinstrument: muestrea la pila cada milisegundo en vez de medir cada llamada"""
+    formato = 'txt'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.perfil = Profiler(interval=0.001)
+
+    def __enter__(self):
+        self.perfil.start()
+
+    def __exit__(self, *exc):
+        self.perfil.stop()
+
+    def guardar(self, ruta):
+        lineas = []
+
+        def recorrer(frame, pila):
+            pila = pila + [f'{frame.function} ({frame.file_path_short}:{frame.line_no})']
+            propio = frame.time - sum(hijo.time for hijo in frame.children)
+            if propio > 0:
+                lineas.append(f"{';'.join(pila)} {round(propio * 1_000_000)}")
+            for hijo in frame.children:
+                recorrer(hijo, pila)
+
+        raiz = self.perfil.last_session.root_frame()
+        if raiz is not None:
+            recorrer(raiz, [])
+        with open(ruta, 'w') as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+
+
+def nuevo_perfilador():
+    if getattr(settings, 'PERFILADO_MUESTREO', True):
+        try:
+            return _Muestreo()
+        except ImportError:
+            pass
+    return _CProfile()
+
+
+# ============================================
+# ARCHIVOS
+# ============================================
+
+def _guardar(perfilador, vista, segundos):
+    os.makedirs(directorio(), exist_ok=True)
+    vista = re.sub(r'[^\w.-]', '-', vista)[:60]
+    nombre = (
+        f"{timezone.localtime().strftime('%Y%m%d-%H%M%S')}_{vista}_{round(segundos * 1000)}ms_"
+        f"{secrets.token_hex(3)}.{perfilador.formato}"
+    )
+    perfilador.guardar(os.path.join(directorio(), nombre))
+    _recortar()
+    return nombre
+
+
+def _recortar():
+    maximo = getattr(settings, 'PERFILADO_MAXIMO', 50)
+    for perfil in listar()[maximo:]:
+        try:
+            os.remove(os.path.join(directorio(), perfil['nombre']))
+        except FileNotFoundError:
+            pass
+
+
+def listar():
+    """Perfiles guardados, del más reciente al más antiguo"""
+    try:
+        nombres = os.listdir(directorio())
+    except FileNotFoundError:
+        return []
+    perfiles = []
+    for nombre in nombres:
+        partes = _NOMBRE.match(nombre)
+        if partes is None:
+            continue
+        perfiles.append({
+            'nombre': nombre,
+            'fecha': partes['fecha'],
+            'vista': partes['vista'],
+            'milisegundos': int(partes['ms']),
+            'formato': partes['formato'],
+            'bytes': os.path.getsize(os.path.join(directorio(), nombre)),
+        })
+    perfiles.sort(key=lambda perfil: perfil['nombre'], reverse=True)
+    return perfiles
+
+
+def ruta(nombre):
+    """Ruta del perfil ``nombre`` o None si no es un perfil guardado"""
+    if not _NOMBRE.match(nombre):
+        return None
+    ruta_completa = os.path.join(directorio(), nombre)
+    return ruta_completa if os.path.exists(ruta_completa) else None
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class PerfiladoMiddleware:
+    """Va después de AuthenticationMiddleware (usa ``request.user``)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFILADO_ACTIVO', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not pedido(request):
+            return self.get_response(request)
+
+        perfilador = nuevo_perfilador()
+        inicio = time.perf_counter()
+        # Incluye el render de las plantillas (también el de las TemplateResponse,
+        # que Django hace antes de devolver la respuesta a los middleware)
+        with perfilador:
+            response = self.get_response(request)
+        response['X-Perfil'] = _guardar(perfilador, nombre_vista(request), time.perf_counter() - inicio)
+        return response
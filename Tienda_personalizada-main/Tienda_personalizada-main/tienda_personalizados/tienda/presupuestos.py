@@ -0,0 +1,119 @@
+"""
+Motor de presupuestos estimados.
+
+El presupuesto de un pedido depende del precio base del producto de
+referencia, de la cantidad de palabras de la descripción y de cuántas
+imágenes de referencia tiene. Los precios se leen de una tabla en memoria
+(``producto_id -> precio_base``) ligada a la versión del catálogo, así que
+cotizar no consulta la base de datos mientras el catálogo no cambie.
+
+``Pedido.save`` solo recalcula cuando cambian el producto o la descripción;
+las imágenes y los cambios de precio recotizan con ``cotizar_pedidos``, que
+procesa miles de pedidos con una consulta y un ``bulk_update`` por lote.
+"""
+import threading
+
+from django.db.models import Count
+
+from .instantanea import version_catalogo
+from .seguimiento import invalidar_seguimiento
+
+# Precio base cuando el pedido no tiene producto de referencia
+BASE_SIN_PRODUCTO = 7000
+
+# Estados en que el presupuesto estimado aún se puede recalcular
+ESTADOS_BORRADOR = ('solicitado',)
+
+_tabla = None
+_candado = threading.Lock()
+
+
+def cotizar(precio_base, descripcion, imagenes=0):
+    """Presupuesto estimado a partir de sus datos (sin consultas)"""
+    base = float(precio_base) if precio_base is not None else BASE_SIN_PRODUCTO
+
+    palabras = len((descripcion or '').split())
+    complejidad = min((palabras // 30) * 0.1, 0.5)
+    factor_imagenes = min(imagenes * 0.05, 0.2)
+
+    return int(round(base * (1 + complejidad + factor_imagenes)))
+
+
+# ============================================
+# TABLA DE PRECIOS
+# ============================================
+
+def tabla_precios():
+    """``{producto_id: precio_base}`` de la versión vigente del catálogo"""
+    global _tabla
+    from .models import Producto
+
+    version = version_catalogo()
+    actual = _tabla
+    if actual is not None and actual[0] == version:
+        return actual[1]
+
+    with _candado:
+        if _tabla is None or _tabla[0] != version:
+            _tabla = (version, dict(Producto.objects.values_list('pk', 'precio_base')))
+        return _tabla[1]
+
+
+def precio_base(producto_id):
+    if producto_id is None:
+        return None
+    tabla = tabla_precios()
+    if producto_id in tabla:
+        return tabla[producto_id]
+
+    # Producto creado en la transacción actual (la versión sube al confirmar)
+    from .models import Producto
+    return Producto.objects.filter(pk=producto_id).values_list('precio_base', flat=True).first()
+
+
+# ============================================
+# PEDIDOS
+# ============================================
+
+def presupuesto_para(pedido):
+    """Presupuesto estimado de un pedido (una consulta si ya tiene imágenes guardadas)"""
+    imagenes = pedido.imagenes_referencia.count() if pedido.pk else 0
+    return cotizar(precio_base(pedido.producto_referencia_id), pedido.descripcion_diseno, imagenes)
+
+
+def cotizar_pedidos(queryset=None, lote=1000):
+    """
+    Recalcula el presupuesto estimado de muchos pedidos (por defecto, todos
+    los que siguen en borrador) y guarda solo los que cambiaron. Devuelve la
+    cantidad de pedidos actualizados.
+    """
+    from .models import Pedido
+
+    if queryset is None:
+        queryset = Pedido.objects.filter(estado_pedido__in=ESTADOS_BORRADOR)
+
+    filas = (
+        queryset.annotate(cantidad_imagenes=Count('imagenes_referencia'))
+        .values_list('pk', 'producto_referencia_id', 'descripcion_diseno',
+                     'presupuesto_estimado', 'cantidad_imagenes')
+        .order_by('pk')
+    )
+
+    actualizados = 0
+    ultimo = None
+    while True:
+        # Lotes por rango de pk: no se mantiene un cursor abierto mientras se escribe
+        bloque = list((filas if ultimo is None else filas.filter(pk__gt=ultimo))[:lote])
+        if not bloque:
+            break
+        ultimo = bloque[-1][0]
+
+        cambios = []
+        for pk, producto_id, descripcion, actual, imagenes in bloque:
+            nuevo = cotizar(precio_base(producto_id), descripcion, imagenes)
+            if actual is None or actual != nuevo:
+                cambios.append(Pedido(pk=pk, presupuesto_estimado=nuevo))
+        if cambios:
+            actualizados += Pedido.objects.bulk_update(cambios, ['presupuesto_estimado'])
+            invalidar_seguimiento(*(pedido.pk for pedido in cambios))
+    return actualizados
@@ -0,0 +1,219 @@
+"""
+Procesamiento en segundo plano de las imágenes de referencia.
+
+El formulario de pedido solo mueve los archivos subidos a un área de espera
+(``PROCESAMIENTO_STAGING_DIR/<pedido_id>/``) y guarda el pedido. Al confirmar
+la transacción se encola el pedido en un pool de hilos que, para cada
+archivo, valida que sea una imagen, corrige la orientación, la reduce a
+``IMAGEN_REFERENCIA_LADO_MAXIMO`` píxeles, elimina el EXIF y crea la
+``ImagenReferencia`` definitiva.
+
+Mientras tanto ``Pedido.imagenes_pendientes`` indica cuántas faltan y la
+página de seguimiento muestra el estado "procesando". Si el proceso se
+reinicia con archivos en espera, ``manage.py procesar_imagenes_pendientes``
+los termina de procesar.
+
+El pool y el comando pueden recorrer el mismo pedido a la vez: cada archivo
+se toma renombrándolo (``os.rename`` es atómico), así que solo uno de los
+dos lo procesa. Un archivo tomado por un proceso que murió se vuelve a tomar
+después de ``PROCESAMIENTO_ABANDONADO_SEGUNDOS``.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .seguimiento import invalidar_seguimiento
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_candado = threading.Lock()
+
+# Sufijo de los archivos en espera que un proceso ya tomó
+SUFIJO_TOMADO = '.procesando'
+
+
+def _directorio_espera(pedido_id):
+    return os.path.join(settings.PROCESAMIENTO_STAGING_DIR, str(pedido_id))
+
+
+def _obtener_executor():
+    global _executor
+    with _candado:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PROCESAMIENTO_WORKERS', 2),
+                thread_name_prefix='imagenes-referencia',
+            )
+        return _executor
+
+
+# ============================================
+# DENTRO DE LA PETICIÓN
+# ============================================
+
+def poner_en_espera(pedido, archivos):
+    """
+    Mueve los archivos subidos (``[(numero, UploadedFile), ...]``) al área de
+    espera y encola el pedido para cuando se confirme la transacción.
+    """
+    from .models import Pedido
+
+    if not archivos:
+        return
+
+    directorio = _directorio_espera(pedido.pk)
+    os.makedirs(directorio, exist_ok=True)
+
+    for numero, archivo in archivos:
+        _, extension = os.path.splitext(archivo.name)
+        destino = os.path.join(directorio, f'{numero}_{uuid.uuid4().hex}{extension.lower()}')
+        if hasattr(archivo, 'temporary_file_path'):
+            # Archivos grandes: Django ya los dejó en disco, basta moverlos
+            shutil.move(archivo.temporary_file_path(), destino)
+        else:
+            with open(destino, 'wb') as salida:
+                for trozo in archivo.chunks():
+                    salida.write(trozo)
+
+    Pedido.objects.filter(pk=pedido.pk).update(
+        imagenes_pendientes=F('imagenes_pendientes') + len(archivos)
+    )
+    pedido.imagenes_pendientes += len(archivos)
+    transaction.on_commit(lambda: encolar(pedido.pk))
+
+
+def encolar(pedido_id):
+    if getattr(settings, 'PROCESAMIENTO_SINCRONO', False):
+        procesar_pedido(pedido_id)
+    else:
+        _obtener_executor().submit(_procesar_en_hilo, pedido_id)
+
+
+def _procesar_en_hilo(pedido_id):
+    close_old_connections()
+    try:
+        procesar_pedido(pedido_id)
+    except Exception:
+        logger.exception("Error procesando las imágenes del pedido %s", pedido_id)
+    finally:
+        close_old_connections()
+
+
+# ============================================
+# EN SEGUNDO PLANO
+# ============================================
+
+def _preparar_imagen(ruta):
+    """Devuelve ``(contenido, extension)`` listo para guardar, o None si no es una imagen"""
+    try:
+        with Image.open(ruta) as imagen:
+            imagen.verify()
+        with Image.open(ruta) as imagen:
+            imagen = ImageOps.exif_transpose(imagen)
+            lado = getattr(settings, 'IMAGEN_REFERENCIA_LADO_MAXIMO', 2048)
+            imagen.thumbnail((lado, lado), Image.LANCZOS)
+
+            buffer = BytesIO()
+            if imagen.mode in ('RGBA', 'LA', 'P'):
+                imagen.convert('RGBA').save(buffer, format='PNG', optimize=True)
+                return buffer.getvalue(), 'png'
+            # Sin exif= ni icc_profile=: se descartan los metadatos (GPS, cámara...)
+            imagen.convert('RGB').save(buffer, format='JPEG', quality=85, optimize=True)
+            return buffer.getvalue(), 'jpg'
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _tomar(directorio, nombre):
+    """
+    Renombra el archivo en espera para que ningún otro proceso lo procese.
+    Devuelve la ruta nueva, o None si otro proceso lo tomó (o lo está procesando).
+    """
+    ruta = os.path.join(directorio, nombre)
+    if nombre.endswith(SUFIJO_TOMADO):
+        try:
+            tomado_hace = time.time() - os.path.getmtime(ruta)
+        except FileNotFoundError:
+            return None
+        if tomado_hace < getattr(settings, 'PROCESAMIENTO_ABANDONADO_SEGUNDOS', 600):
+            return None
+        nombre = nombre[:-len(SUFIJO_TOMADO)].rsplit('.', 1)[0]
+
+    destino = os.path.join(directorio, f'{nombre}.{uuid.uuid4().hex[:8]}{SUFIJO_TOMADO}')
+    try:
+        # La fecha del archivo marca cuándo se tomó
+        os.utime(ruta)
+        os.rename(ruta, destino)
+    except FileNotFoundError:
+        return None
+    return destino
+
+
+def procesar_pedido(pedido_id):
+    """Procesa todos los archivos en espera de un pedido"""
+    from .models import ImagenReferencia, Pedido
+
+    directorio = _directorio_espera(pedido_id)
+    try:
+        nombres = sorted(os.listdir(directorio))
+    except FileNotFoundError:
+        return 0
+
+    pedido = Pedido.objects.filter(pk=pedido_id).first()
+    procesadas = 0
+
+    for nombre in nombres:
+        ruta = _tomar(directorio, nombre)
+        if ruta is None:
+            continue
+        numero = nombre.split('_', 1)[0]
+
+        resultado = _preparar_imagen(ruta) if pedido else None
+        if resultado is None:
+            if pedido:
+                logger.warning("Archivo de referencia inválido descartado: pedido %s, %s", pedido_id, nombre)
+        else:
+            contenido, extension = resultado
+            ImagenReferencia.objects.create(
+                pedido=pedido,
+                imagen=ContentFile(contenido, name=f'referencia_{pedido_id}_{numero}.{extension}'),
+                descripcion=f"Imagen de referencia {numero} enviada por el cliente"
+            )
+            procesadas += 1
+
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        if pedido:
+            Pedido.objects.filter(pk=pedido_id, imagenes_pendientes__gt=0).update(
+                imagenes_pendientes=F('imagenes_pendientes') - 1
+            )
+            invalidar_seguimiento(pedido_id)
+
+    try:
+        os.rmdir(directorio)
+    except OSError:
+        # Otro proceso todavía tiene archivos tomados: borrará el directorio al terminar
+        pass
+    return procesadas
+
+
+def pedidos_en_espera():
+    """Ids de pedidos con archivos en el área de espera"""
+    directorio = settings.PROCESAMIENTO_STAGING_DIR
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(int(nombre) for nombre in os.listdir(directorio) if nombre.isdigit())
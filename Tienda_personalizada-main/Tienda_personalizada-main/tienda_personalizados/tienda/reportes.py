@@ -0,0 +1,92 @@
+"""
+Cifras del reporte de pedidos.
+
+Todas las cifras salen del resumen diario (``PedidoResumenDiario``) ya
+filtrado: los conteos por estado y por plataforma, el total de pedidos y el
+valor aprobado se calculan en una sola pasada con agregados condicionales
+(``Sum(..., filter=Q(...))``), y el top de productos con una segunda
+consulta agrupada. Lo usan la vista del reporte y la API
+(``/api/pedidos/reporte/``).
+"""
+from django.db.models import F, Q, Sum
+
+TOP_PRODUCTOS = 5
+
+
+def filtrar(filtro, fechas=True):
+    """
+    Aplica los filtros de PedidoFilter (fechas inclusive, estado, plataforma)
+    al resumen diario; con ``fechas=False`` el rango lo aplica quien llama.
+    """
+    from .models import PedidoResumenDiario
+
+    filas = PedidoResumenDiario.objects.all()
+    if not filtro.is_bound:
+        return filas
+    # Igual que PedidoFilter.qs: se aplican los campos que validaron
+    filtro.form.is_valid()
+    datos = filtro.form.cleaned_data
+    if fechas and datos.get('fecha_inicio'):
+        filas = filas.filter(fecha__gte=datos['fecha_inicio'])
+    if fechas and datos.get('fecha_fin'):
+        filas = filas.filter(fecha__lte=datos['fecha_fin'])
+    if datos.get('estado'):
+        filas = filas.filter(estado_pedido__in=datos['estado'])
+    if datos.get('plataforma'):
+        filas = filas.filter(plataforma=datos['plataforma'])
+    return filas
+
+
+def _agregados():
+    from .models import Pedido
+
+    agregados = {
+        'total_pedidos': Sum('cantidad'),
+        'total_aprobado': Sum('total_aprobado', filter=Q(estado_pedido='aprobado')),
+    }
+    for estado, _ in Pedido.ESTADOS_PEDIDO:
+        agregados[f'estado__{estado}'] = Sum('cantidad', filter=Q(estado_pedido=estado))
+    for plataforma, _ in Pedido.PLATAFORMAS:
+        agregados[f'plataforma__{plataforma}'] = Sum('cantidad', filter=Q(plataforma=plataforma))
+    return agregados
+
+
+def _desglose(totales, prefijo, clave):
+    """``[{clave: valor, 'conteo': n}]`` sin ceros, de mayor a menor"""
+    filas = [
+        {clave: nombre[len(prefijo):], 'conteo': conteo}
+        for nombre, conteo in totales.items()
+        if nombre.startswith(prefijo) and conteo
+    ]
+    return sorted(filas, key=lambda fila: -fila['conteo'])
+
+
+def calcular_reporte(filas):
+    """
+    Cifras del reporte para un queryset de ``PedidoResumenDiario`` (dos
+    consultas, sin importar cuántos pedidos haya).
+    """
+    totales = filas.aggregate(**_agregados())
+
+    # Se agrupa primero por el nombre: con GROUP BY producto_id primero, SQLite
+    # prefiere recorrer entero el índice de producto_id (ya ordenado) en vez
+    # de usar el de la fecha
+    agrupados = (
+        filas.filter(producto__nombre__isnull=False, cantidad__gt=0)
+        .values(producto_referencia__nombre=F('producto__nombre'), id_producto=F('producto'))
+        .annotate(conteo=Sum('cantidad'))
+        .filter(conteo__gt=0)
+        .order_by('-conteo', 'producto_referencia__nombre')[:TOP_PRODUCTOS]
+    )
+    productos = [
+        {'producto': fila['id_producto'], 'producto_referencia__nombre': fila['producto_referencia__nombre'], 'conteo': fila['conteo']}
+        for fila in agrupados
+    ]
+
+    return {
+        'total_pedidos': totales['total_pedidos'] or 0,
+        'total_aprobado': totales['total_aprobado'] or 0,
+        'por_estado': _desglose(totales, 'estado__', 'estado_pedido'),
+        'por_plataforma': _desglose(totales, 'plataforma__', 'plataforma'),
+        'productos': productos,
+    }
@@ -0,0 +1,148 @@
+"""
+Resumen diario de pedidos (``PedidoResumenDiario``).
+
+Cada fila acumula, para un día, estado, plataforma y producto, cuántos
+pedidos hay y la suma de su presupuesto aprobado. Las señales de Pedido y
+las operaciones masivas (importación, transiciones de estado) aplican la
+diferencia que produce cada cambio, así que el reporte se calcula sobre unas
+pocas filas por día en vez de recorrer toda la tabla de pedidos.
+
+Si el resumen se desincroniza (cambios hechos con SQL directo, por ejemplo),
+``manage.py reconstruir_resumen`` lo recalcula desde cero o por rango.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def zona():
+    # Siempre la zona de la tienda, aunque la petición active otra
+    return timezone.get_default_timezone()
+
+
+def clave(valores):
+    """``(fecha, estado, plataforma, producto_id)`` de un pedido"""
+    return (
+        timezone.localdate(valores['fecha_creacion'], zona()),
+        valores['estado_pedido'],
+        valores['plataforma'],
+        valores['producto_referencia_id'],
+    )
+
+
+class Diferencias:
+    """Acumula cambios por clave para aplicarlos con una escritura por clave"""
+
+    def __init__(self):
+        self._por_clave = defaultdict(lambda: [0, Decimal(0)])
+
+    def __bool__(self):
+        return any(cantidad or total for cantidad, total in self._por_clave.values())
+
+    def sumar(self, valores, signo=1):
+        delta = self._por_clave[clave(valores)]
+        delta[0] += signo
+        delta[1] += signo * Decimal(valores['presupuesto_aprobado'] or 0)
+
+    def restar(self, valores):
+        self.sumar(valores, -1)
+
+    def aplicar(self):
+        """
+        Suma cada diferencia a su fila o la crea. Si otra transacción crea la
+        misma fila entre medio, la restricción única rechaza el duplicado y
+        se vuelve a sumar sobre la fila que ganó.
+        """
+        from .models import PedidoResumenDiario
+
+        for (fecha, estado, plataforma, producto_id), (cantidad, total) in self._por_clave.items():
+            if not cantidad and not total:
+                continue
+            fila = PedidoResumenDiario.objects.filter(
+                fecha=fecha, estado_pedido=estado, plataforma=plataforma, producto_id=producto_id
+            )
+            if _sumar(fila, cantidad, total):
+                continue
+            try:
+                with transaction.atomic():
+                    PedidoResumenDiario.objects.create(
+                        fecha=fecha, estado_pedido=estado, plataforma=plataforma, producto_id=producto_id,
+                        cantidad=cantidad, total_aprobado=total,
+                    )
+            except IntegrityError:
+                _sumar(fila, cantidad, total)
+        self._por_clave.clear()
+
+
+def _sumar(fila, cantidad, total):
+    """Suma en la base, sin leer antes la fila; devuelve cuántas filas cambió"""
+    return fila.update(cantidad=F('cantidad') + cantidad, total_aprobado=F('total_aprobado') + total)
+
+
+def registrar_cambio(anterior, actual):
+    """Aplica el cambio de un pedido (``None`` si se crea o se elimina)"""
+    if anterior == actual:
+        return
+    diferencias = Diferencias()
+    if anterior is not None:
+        diferencias.restar(anterior)
+    if actual is not None:
+        diferencias.sumar(actual)
+    if diferencias:
+        diferencias.aplicar()
+
+
+# ============================================
+# RECONSTRUCCIÓN
+# ============================================
+
+def reconstruir(desde=None, hasta=None, fechas=None):
+    """
+    Recalcula el resumen desde la tabla de pedidos, completo o solo para un
+    rango (``desde``/``hasta``, inclusive) o una lista de ``fechas``.
+    Devuelve la cantidad de filas creadas.
+    """
+    from .models import Pedido, PedidoResumenDiario
+
+    resumen = PedidoResumenDiario.objects.all()
+    pedidos = Pedido.objects.annotate(dia=TruncDate('fecha_creacion', tzinfo=zona()))
+    if desde:
+        resumen = resumen.filter(fecha__gte=desde)
+        pedidos = pedidos.filter(dia__gte=desde)
+    if hasta:
+        resumen = resumen.filter(fecha__lte=hasta)
+        pedidos = pedidos.filter(dia__lte=hasta)
+    if fechas is not None:
+        fechas = list(fechas)
+        resumen = resumen.filter(fecha__in=fechas)
+        pedidos = pedidos.filter(dia__in=fechas)
+
+    filas = (
+        pedidos.order_by()
+        .values('dia', 'estado_pedido', 'plataforma', 'producto_referencia_id')
+        .annotate(cantidad=Count('id'), total=Sum('presupuesto_aprobado'))
+    )
+    with transaction.atomic():
+        resumen.delete()
+        creadas = PedidoResumenDiario.objects.bulk_create([
+            PedidoResumenDiario(
+                fecha=fila['dia'], estado_pedido=fila['estado_pedido'], plataforma=fila['plataforma'],
+                producto_id=fila['producto_referencia_id'], cantidad=fila['cantidad'],
+                total_aprobado=fila['total'] or 0,
+            )
+            for fila in filas.iterator()
+        ], batch_size=1000)
+    return len(creadas)
+
+
+def reconstruir_producto(producto_id):
+    """Tras eliminar un producto, sus pedidos quedan sin producto: se recalculan sus días"""
+    from .models import PedidoResumenDiario
+
+    fechas = set(PedidoResumenDiario.objects.filter(producto_id=producto_id).values_list('fecha', flat=True))
+    if fechas:
+        reconstruir(fechas=fechas)
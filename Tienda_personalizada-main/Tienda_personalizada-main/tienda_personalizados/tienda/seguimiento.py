@@ -0,0 +1,80 @@
+"""
+Página de seguimiento de pedidos.
+
+La página renderizada se guarda en el caché de páginas (``cache_paginas``)
+con la etiqueta ``pedido:<id>``, que se purga cada vez que cambia el pedido o
+sus imágenes de referencia (``invalidar_seguimiento``). Los tokens que no
+existen se recuerdan por un rato (``SEGUIMIENTO_TOKEN_INVALIDO_SEGUNDOS``)
+para que los bots que prueban tokens al azar no lleguen a la base de datos.
+"""
+from django.conf import settings
+from django.db.models import F
+
+from .cache_paginas import _cache, purgar
+
+# Largo máximo de token_seguimiento: los más largos ni se consultan
+LARGO_MAXIMO_TOKEN = 12
+
+
+def _clave_invalido(token):
+    return 'tienda:seguimiento:invalido:' + token
+
+
+def etiqueta(pedido_id):
+    return f'pedido:{pedido_id}'
+
+
+def token_invalido(token):
+    """True si ya se sabe que el token no existe"""
+    return len(token) > LARGO_MAXIMO_TOKEN or _cache().get(_clave_invalido(token)) is not None
+
+
+def recordar_token_invalido(token):
+    _cache().set(_clave_invalido(token), True, getattr(settings, 'SEGUIMIENTO_TOKEN_INVALIDO_SEGUNDOS', 60))
+
+
+def olvidar_tokens_invalidos(*tokens):
+    """Para los pedidos nuevos cuyo token se haya consultado antes de existir"""
+    _cache().delete_many([_clave_invalido(token) for token in tokens if token])
+
+
+def cargar_pedido(token):
+    """
+    Devuelve ``(pedido, imagenes)``: el pedido con su producto y la lista de
+    sus imágenes de referencia, en una sola consulta (LEFT JOIN). Si el token
+    no existe devuelve ``(None, [])``.
+    """
+    from .models import ImagenReferencia, Pedido
+
+    filas = list(
+        Pedido.objects.filter(token_seguimiento=token)
+        .select_related('producto_referencia')
+        .annotate(
+            ref_id=F('imagenes_referencia__id'),
+            ref_archivo=F('imagenes_referencia__imagen'),
+            ref_descripcion=F('imagenes_referencia__descripcion'),
+            ref_fecha=F('imagenes_referencia__fecha_subida'),
+        )
+        .order_by('imagenes_referencia__id')
+    )
+    if not filas:
+        return None, []
+
+    pedido = filas[0]
+    imagenes = [
+        ImagenReferencia(
+            id=fila.ref_id, pedido=pedido, imagen=fila.ref_archivo,
+            descripcion=fila.ref_descripcion, fecha_subida=fila.ref_fecha,
+        )
+        for fila in filas if fila.ref_id is not None
+    ]
+    for imagen in imagenes:
+        imagen._state.adding = False
+        imagen._state.db = pedido._state.db
+    return pedido, imagenes
+
+
+def invalidar_seguimiento(*pedido_ids):
+    """Purga la página de seguimiento de los pedidos indicados"""
+    if pedido_ids:
+        purgar(*(etiqueta(pk) for pk in pedido_ids))
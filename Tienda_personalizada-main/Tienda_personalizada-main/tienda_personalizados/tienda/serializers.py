@@ -1,12 +1,192 @@
-from rest_framework import serializers
-from .models import Insumo, Pedido
+import datetime
+import decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+from .models import Insumo, MovimientoStock, Pedido
+from .stock import StockInsuficiente
+from .transiciones import permitida
 
 class InsumoSerializer(serializers.ModelSerializer):
+    """
+    El stock solo cambia con movimientos (POST /api/insumos/ajustar/): al
+    editar un insumo ``cantidad_disponible`` es de solo lectura y al crearlo
+    queda registrada como movimiento 'inicial'.
+    """
     class Meta:
         model = Insumo
         fields = '__all__'
+        read_only_fields = ['version']
+
+    def get_extra_kwargs(self):
+        extra = super().get_extra_kwargs()
+        if self.instance is not None:
+            extra['cantidad_disponible'] = {**extra.get('cantidad_disponible', {}), 'read_only': True}
+        return extra
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        usuario = request.user if request is not None and request.user.is_authenticated else None
+        with transaction.atomic():
+            insumo = super().create(validated_data)
+            if insumo.cantidad_disponible:
+                MovimientoStock.objects.create(
+                    insumo=insumo, cantidad=insumo.cantidad_disponible, saldo=insumo.cantidad_disponible,
+                    motivo='inicial', usuario=usuario,
+                )
+        return insumo
+
+class AjusteStockSerializer(serializers.Serializer):
+    insumo = serializers.IntegerField()
+    cantidad = serializers.IntegerField()
+    # Versión que vio el cliente: si el insumo cambió desde entonces, se rechaza
+    version = serializers.IntegerField(required=False, min_value=0)
+
+    def validate_cantidad(self, value):
+        if value == 0:
+            raise serializers.ValidationError("La variación no puede ser cero.")
+        return value
+
+
+class AjustesStockSerializer(serializers.Serializer):
+    ajustes = AjusteStockSerializer(many=True, allow_empty=False, max_length=5000)
+    motivo = serializers.ChoiceField(choices=MovimientoStock.MOTIVOS_AJUSTE, default='ajuste')
+    nota = serializers.CharField(max_length=200, required=False, allow_blank=True, default='')
 
 class PedidoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pedido
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+    def __init__(self, *args, campos=None, **kwargs):
+        # ``campos``: proyección pedida por el cliente (?fields=...)
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+    def validate(self, attrs):
+        # Mismas reglas que el admin y las acciones en lote (tienda/transiciones.py)
+        if self.instance is not None:
+            errores = {}
+            for campo in Pedido.CAMPOS_ESTADO:
+                if campo not in attrs:
+                    continue
+                anterior = self.instance._estados_originales.get(campo, attrs[campo])
+                if anterior != attrs[campo] and not permitida(campo, anterior, attrs[campo]):
+                    errores[campo] = [f'No se puede pasar de "{anterior}" a "{attrs[campo]}".']
+            if errores:
+                raise serializers.ValidationError(errores)
+        return attrs
+
+    def update(self, instance, validated_data):
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            # Queda en el historial (PedidoEvento) como autor del cambio
+            instance._usuario_cambio = request.user
+        # Pasar a en_proceso reserva los insumos del producto (tienda/stock.py)
+        try:
+            return super().update(instance, validated_data)
+        except StockInsuficiente as e:
+            raise serializers.ValidationError({'estado_pedido': [
+                f"No hay stock suficiente del insumo {pk} (faltan {cantidad})." for pk, cantidad in e.faltantes.items()
+            ]})
+
+
+# ============================================
+# SERIALIZACIÓN RÁPIDA (SOLO LECTURA)
+# ============================================
+
+# Campos cuyo to_representation devuelve el mismo valor que entrega la base
+# de datos (str para textos, int para enteros, el pk para las FK)
+CAMPOS_DIRECTOS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, PrimaryKeyRelatedField,
+)
+
+
+class SerializadorRapido:
+    """
+    Serializa filas de ``.values()`` con el mismo resultado que el
+    ``ModelSerializer`` indicado, sin instanciar modelos ni recorrer la
+    maquinaria de campos de DRF por cada valor: el conversor de cada campo se
+    elige una vez por respuesta.
+
+    Solo admite campos que leen una columna del modelo; para cualquier otro
+    (campos calculados, anidados, archivos) lanza ``ValueError``.
+    """
+
+    def __init__(self, serializer):
+        self.columnas = []
+        self._campos = []
+        modelo = serializer.Meta.model
+        for nombre, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            if campo.source == '*' or '.' in campo.source or isinstance(campo, serializers.FileField):
+                raise ValueError(f"El campo {nombre} no se puede leer con .values()")
+            modelo._meta.get_field(campo.source)
+            self.columnas.append(campo.source)
+            self._campos.append((nombre, campo))
+
+    def _conversores(self):
+        zona = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [(nombre, campo.source, _conversor(campo, zona)) for nombre, campo in self._campos]
+
+    def serializar(self, filas):
+        conversores = self._conversores()
+        resultado = []
+        for fila in filas:
+            datos = {}
+            for nombre, columna, conversor in conversores:
+                valor = fila[columna]
+                datos[nombre] = valor if conversor is None or valor is None else conversor(valor)
+            resultado.append(datos)
+        return resultado
+
+    def consulta(self, queryset, *extra):
+        """``queryset.values()`` con las columnas del serializador (y las de ``extra``)"""
+        return queryset.values(*dict.fromkeys([*self.columnas, *extra]))
+
+
+def _conversor(campo, zona):
+    """
+    Función que reproduce ``campo.to_representation`` para los valores que
+    entrega la base de datos, o None si el valor ya sirve tal cual.
+    """
+    if isinstance(campo, serializers.ChoiceField):
+        return None if all(isinstance(opcion, str) for opcion in campo.choices) else campo.to_representation
+    if isinstance(campo, CAMPOS_DIRECTOS):
+        return None
+
+    if (
+        isinstance(campo, serializers.DateTimeField) and zona is not None and not hasattr(campo, 'timezone')
+        and (getattr(campo, 'format', api_settings.DATETIME_FORMAT) or '').lower() == ISO_8601
+    ):
+        def fecha_hora(valor):
+            if not isinstance(valor, datetime.datetime) or timezone.is_naive(valor):
+                return campo.to_representation(valor)
+            texto = valor.astimezone(zona).isoformat()
+            return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+        return fecha_hora
+
+    if (
+        isinstance(campo, serializers.DecimalField) and campo.decimal_places is not None
+        and getattr(campo, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        and not campo.localize and not campo.normalize_output
+    ):
+        cuanto = decimal.Decimal('.1') ** campo.decimal_places
+        contexto = decimal.getcontext().copy()
+        if campo.max_digits is not None:
+            contexto.prec = campo.max_digits
+
+        def decimal_texto(valor):
+            if not isinstance(valor, decimal.Decimal):
+                return campo.to_representation(valor)
+            return f'{valor.quantize(cuanto, rounding=campo.rounding, context=contexto):f}'
+        return decimal_texto
+
+    return campo.to_representation
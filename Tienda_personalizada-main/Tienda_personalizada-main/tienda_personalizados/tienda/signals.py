@@ -0,0 +1,186 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import busqueda, imagenes, presupuestos, resumen, seguimiento
+from .cache_paginas import purgar
+from .instantanea import invalidar_catalogo
+from .models import Categoria, ImagenReferencia, Pedido, PedidoEvento, Producto
+
+logger = logging.getLogger(__name__)
+
+
+def _purgar_al_confirmar(*etiquetas):
+    transaction.on_commit(lambda: purgar(*etiquetas))
+
+
+# ============================================
+# PRODUCTO
+# ============================================
+
+@receiver(pre_save, sender=Producto)
+def producto_por_guardar(sender, instance, **kwargs):
+    # Recordar la categoría, el precio y las imágenes anteriores (para purgar
+    # el listado anterior, recotizar y generar derivados solo de lo nuevo)
+    instance._valores_anteriores = {}
+    if instance.pk:
+        instance._valores_anteriores = Producto.objects.filter(pk=instance.pk).values(
+            'categoria_id', 'precio_base', *imagenes.CAMPOS_PRODUCTO
+        ).first() or {}
+
+
+def _etiquetas_producto(producto):
+    etiquetas = {f'producto:{producto.pk}', f'categoria:{producto.categoria_id}', 'catalogo'}
+    anterior = getattr(producto, '_valores_anteriores', {}).get('categoria_id')
+    if anterior:
+        etiquetas.add(f'categoria:{anterior}')
+    return etiquetas
+
+
+def _generar_derivados(archivos):
+    for archivo in archivos:
+        try:
+            imagenes.generar_derivados(archivo)
+        except Exception:
+            # Una imagen dañada no debe impedir guardar el producto; la
+            # plantilla usa el original mientras no haya derivados.
+            logger.exception("No se pudieron generar los derivados de %s", archivo.name)
+
+
+def _liberar_archivos(archivos):
+    """
+    Suelta la referencia de cada ``(storage, nombre)``; el almacenamiento por
+    contenido solo borra el archivo si ningún otro registro lo usa.
+    """
+    for storage, nombre in archivos:
+        storage.delete(nombre)
+        if not storage.exists(nombre):
+            imagenes.eliminar_derivados(nombre)
+
+
+def _liberar_al_confirmar(archivos):
+    if archivos:
+        transaction.on_commit(lambda: _liberar_archivos(archivos))
+
+
+def _imagenes_nuevas(producto):
+    anteriores = getattr(producto, '_valores_anteriores', {})
+    return [
+        getattr(producto, campo) for campo in imagenes.CAMPOS_PRODUCTO
+        if getattr(producto, campo) and getattr(producto, campo).name != anteriores.get(campo)
+    ]
+
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, **kwargs):
+    busqueda.indexar_producto(instance)
+    nuevas = _imagenes_nuevas(instance)
+    if nuevas:
+        transaction.on_commit(lambda: _generar_derivados(nuevas))
+    anteriores = getattr(instance, '_valores_anteriores', {})
+    _liberar_al_confirmar([
+        (getattr(instance, campo).storage, anteriores[campo])
+        for campo in imagenes.CAMPOS_PRODUCTO
+        if anteriores.get(campo) and anteriores[campo] != getattr(instance, campo).name
+    ])
+    transaction.on_commit(invalidar_catalogo)
+    _purgar_al_confirmar(*_etiquetas_producto(instance))
+
+    anterior = getattr(instance, '_valores_anteriores', {}).get('precio_base')
+    if anterior is not None and anterior != instance.precio_base:
+        # Los pedidos en borrador de este producto se recotizan con el precio nuevo
+        transaction.on_commit(lambda: presupuestos.cotizar_pedidos(
+            Pedido.objects.filter(producto_referencia_id=instance.pk, estado_pedido__in=presupuestos.ESTADOS_BORRADOR)
+        ))
+
+
+@receiver(post_delete, sender=Producto)
+def producto_eliminado(sender, instance, **kwargs):
+    # Sus pedidos quedaron sin producto (SET_NULL)
+    resumen.reconstruir_producto(instance.pk)
+    if busqueda.indice_disponible():
+        busqueda.desindexar([instance.pk])
+    _liberar_al_confirmar([
+        (getattr(instance, campo).storage, getattr(instance, campo).name)
+        for campo in imagenes.CAMPOS_PRODUCTO if getattr(instance, campo)
+    ])
+    transaction.on_commit(invalidar_catalogo)
+    _purgar_al_confirmar(*_etiquetas_producto(instance))
+
+
+# ============================================
+# PEDIDO
+# ============================================
+
+@receiver(pre_save, sender=Pedido)
+def pedido_por_guardar(sender, instance, **kwargs):
+    if not instance._state.adding and getattr(instance, '_resumen_original', None) is None:
+        # Cargado con campos diferidos: se leen los valores anteriores
+        instance._resumen_original = Pedido.objects.filter(pk=instance.pk).values(*Pedido.CAMPOS_RESUMEN).first()
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_guardado(sender, instance, created, **kwargs):
+    resumen.registrar_cambio(
+        getattr(instance, '_resumen_original', None),
+        instance._valores_resumen() or Pedido.objects.filter(pk=instance.pk).values(*Pedido.CAMPOS_RESUMEN).first()
+    )
+    if created:
+        seguimiento.olvidar_tokens_invalidos(instance.token_seguimiento)
+    cambios = getattr(instance, '_cambios_estado', [])
+    if cambios:
+        # Cambios hechos de a uno (formulario o lista editable del admin)
+        PedidoEvento.objects.bulk_create([
+            PedidoEvento(
+                pedido=instance, campo=campo, estado_anterior=anterior, estado_nuevo=nuevo,
+                usuario=getattr(instance, '_usuario_cambio', None),
+            )
+            for campo, anterior, nuevo in cambios
+        ])
+    transaction.on_commit(lambda: seguimiento.invalidar_seguimiento(instance.pk))
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_eliminado(sender, instance, **kwargs):
+    resumen.registrar_cambio(getattr(instance, '_resumen_original', None) or instance._valores_resumen(), None)
+    pk = instance.pk
+    transaction.on_commit(lambda: seguimiento.invalidar_seguimiento(pk))
+
+
+# ============================================
+# IMAGEN DE REFERENCIA
+# ============================================
+
+def _recotizar_al_confirmar(pedido_id):
+    # La cantidad de imágenes influye en el presupuesto estimado
+    transaction.on_commit(lambda: presupuestos.cotizar_pedidos(Pedido.objects.filter(pk=pedido_id)))
+
+
+@receiver(post_save, sender=ImagenReferencia)
+def imagen_referencia_guardada(sender, instance, created, **kwargs):
+    if created:
+        _recotizar_al_confirmar(instance.pedido_id)
+    pedido_id = instance.pedido_id
+    transaction.on_commit(lambda: seguimiento.invalidar_seguimiento(pedido_id))
+
+
+@receiver(post_delete, sender=ImagenReferencia)
+def imagen_referencia_eliminada(sender, instance, **kwargs):
+    if instance.imagen:
+        _liberar_al_confirmar([(instance.imagen.storage, instance.imagen.name)])
+    _recotizar_al_confirmar(instance.pedido_id)
+    pedido_id = instance.pedido_id
+    transaction.on_commit(lambda: seguimiento.invalidar_seguimiento(pedido_id))
+
+
+# ============================================
+# CATEGORÍA
+# ============================================
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def categoria_modificada(sender, instance, **kwargs):
+    transaction.on_commit(invalidar_catalogo)
+    _purgar_al_confirmar(f'categoria:{instance.pk}', 'categorias')
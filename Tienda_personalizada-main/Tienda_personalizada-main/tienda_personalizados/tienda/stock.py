@@ -0,0 +1,280 @@
+"""
+Movimientos de stock de los insumos.
+
+``ajustar_stock`` aplica muchas variaciones relativas (``+50``, ``-3``) en una
+sola transacción y en pocas sentencias:
+
+1. una consulta lee stock y versión de todos los insumos afectados;
+2. un UPDATE por grupo de insumos suma cada variación con ``F()`` y
+   ``Case``, y sube la versión. El WHERE exige la versión leída (o la que
+   indicó el cliente) y que el stock no quede negativo, así que un cambio
+   concurrente no se pisa: se detecta y se rechaza todo el ajuste;
+3. ``bulk_create`` agrega los movimientos al libro (``MovimientoStock``).
+
+Nunca se sobrescribe ``cantidad_disponible`` con un valor absoluto.
+
+Los pedidos reservan los insumos de su producto (``InsumoProducto``) al
+pasar a ``en_proceso`` y los devuelven si vuelven atrás o se cancelan
+(``reservar``/``liberar``, dentro de ``transaccion_de_reserva``).
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+
+# Insumos por UPDATE: cada uno usa 5 parámetros y SQLite admite 999 por sentencia
+INSUMOS_POR_SENTENCIA = 150
+
+# Por debajo de esta cantidad el insumo figura con bajo stock
+STOCK_BAJO = 10
+
+# Estados en los que el pedido tiene sus insumos descontados: se reservan al
+# entrar en proceso y se consumen al terminarlo
+ESTADOS_CON_RESERVA = {'en_proceso', 'realizado', 'entregado', 'finalizado'}
+
+# Serializa las reservas dentro del proceso cuando la base no bloquea filas
+_candado_reservas = threading.RLock()
+
+
+class AjusteRechazado(Exception):
+    """
+    Ningún cambio se aplicó. ``errores`` es ``{insumo_id: mensaje}``;
+    ``conflicto`` indica que la causa fue una versión desactualizada.
+    """
+
+    def __init__(self, errores, conflicto=False):
+        super().__init__(errores)
+        self.errores = errores
+        self.conflicto = conflicto
+
+
+class StockInsuficiente(Exception):
+    """``faltantes`` es ``{insumo_id: unidades que faltan}``"""
+
+    def __init__(self, faltantes):
+        super().__init__(faltantes)
+        self.faltantes = faltantes
+
+
+def _validar(ajustes, actuales):
+    """Errores de un ajuste frente al stock leído (sin escribir nada)"""
+    errores = {}
+    conflicto = False
+    for insumo_id, ajuste in ajustes.items():
+        if insumo_id not in actuales:
+            errores[insumo_id] = "No existe el insumo."
+            continue
+        cantidad, version = actuales[insumo_id]
+        if ajuste['version'] is not None and ajuste['version'] != version:
+            errores[insumo_id] = f"El insumo cambió (versión actual {version})."
+            conflicto = True
+        elif cantidad + ajuste['cantidad'] < 0:
+            errores[insumo_id] = f"Stock insuficiente: hay {cantidad}, se piden {-ajuste['cantidad']}."
+    return errores, conflicto
+
+
+def agrupar(ajustes):
+    """
+    ``[{'insumo': id, 'cantidad': n, 'version': v?}]`` -> ``{id: {...}}``,
+    sumando las variaciones repetidas de un mismo insumo.
+    """
+    agrupados = {}
+    for ajuste in ajustes:
+        actual = agrupados.setdefault(ajuste['insumo'], {'cantidad': 0, 'version': None})
+        actual['cantidad'] += ajuste['cantidad']
+        if ajuste.get('version') is not None:
+            if actual['version'] not in (None, ajuste['version']):
+                raise AjusteRechazado({ajuste['insumo']: "Versiones distintas para el mismo insumo."})
+            actual['version'] = ajuste['version']
+    return agrupados
+
+
+def _leer(ids):
+    """
+    ``{insumo_id: (cantidad_disponible, version)}``, con las filas bloqueadas
+    hasta el fin de la transacción (en orden de id, para no cruzar bloqueos)
+    """
+    from .models import Insumo
+
+    return {
+        pk: (cantidad, version)
+        for pk, cantidad, version in Insumo.objects.select_for_update()
+        .filter(pk__in=ids).order_by('pk').values_list('pk', 'cantidad_disponible', 'version')
+    }
+
+
+def _actualizar(variaciones, actuales):
+    """Suma ``{insumo_id: variacion}`` con un UPDATE por grupo de insumos"""
+    from .models import Insumo
+
+    ids = list(variaciones)
+    for inicio in range(0, len(ids), INSUMOS_POR_SENTENCIA):
+        grupo = ids[inicio:inicio + INSUMOS_POR_SENTENCIA]
+        condicion = Q()
+        casos = []
+        for pk in grupo:
+            condicion |= Q(pk=pk, version=actuales[pk][1], cantidad_disponible__gte=-variaciones[pk])
+            casos.append(When(pk=pk, then=Value(variaciones[pk])))
+        actualizados = Insumo.objects.filter(condicion).update(
+            cantidad_disponible=F('cantidad_disponible') + Case(*casos, default=Value(0)),
+            version=F('version') + 1,
+        )
+        if actualizados != len(grupo):
+            # Otro proceso cambió alguno entre la lectura y el UPDATE
+            # (en bases sin bloqueo de filas): se deshace todo
+            raise AjusteRechazado({pk: "El insumo cambió durante el ajuste." for pk in grupo}, conflicto=True)
+
+
+def ajustar_stock(ajustes, motivo='ajuste', usuario=None, nota=''):
+    """
+    Aplica las variaciones de ``ajustes`` (ver ``agrupar``) y registra los
+    movimientos. Devuelve ``{insumo_id: (cantidad_disponible, version)}`` o
+    lanza ``AjusteRechazado`` sin haber cambiado nada.
+    """
+    from .models import MovimientoStock
+
+    ajustes = agrupar(ajustes)
+    if not ajustes:
+        return {}
+
+    with transaction.atomic():
+        actuales = _leer(ajustes)
+        errores, conflicto = _validar(ajustes, actuales)
+        if errores:
+            raise AjusteRechazado(errores, conflicto)
+
+        _actualizar({pk: ajuste['cantidad'] for pk, ajuste in ajustes.items()}, actuales)
+
+        resultado = {}
+        movimientos = []
+        for pk, ajuste in ajustes.items():
+            cantidad, version = actuales[pk]
+            saldo = cantidad + ajuste['cantidad']
+            resultado[pk] = (saldo, version + 1)
+            movimientos.append(MovimientoStock(
+                insumo_id=pk, cantidad=ajuste['cantidad'], saldo=saldo,
+                motivo=motivo, usuario=usuario, nota=nota,
+            ))
+        MovimientoStock.objects.bulk_create(movimientos, batch_size=500)
+    return resultado
+
+
+# ============================================
+# RESERVAS DE LOS PEDIDOS
+# ============================================
+
+def movimiento_por_cambio(anterior, nuevo):
+    """'reserva', 'liberacion' o None según el cambio de ``estado_pedido``"""
+    if nuevo in ESTADOS_CON_RESERVA and anterior not in ESTADOS_CON_RESERVA:
+        return 'reserva'
+    if anterior in ESTADOS_CON_RESERVA and nuevo not in ESTADOS_CON_RESERVA:
+        return 'liberacion'
+    return None
+
+
+@contextmanager
+def transaccion_de_reserva():
+    """
+    Transacción para reservar o devolver insumos. En PostgreSQL alcanza con
+    el bloqueo de filas de ``_leer``. SQLite no bloquea filas, así que las
+    reservas se serializan: un candado dentro del proceso y una escritura al
+    comienzo, que toma el bloqueo de escritura de la base hasta confirmar
+    (otro proceso espera en vez de leer un stock que está por cambiar).
+    """
+    from .models import Insumo
+
+    if connection.features.has_select_for_update:
+        with transaction.atomic():
+            yield
+        return
+    with _candado_reservas, transaction.atomic():
+        Insumo.objects.filter(pk__lt=0).update(version=F('version'))
+        yield
+
+
+def _recetas(producto_ids):
+    """``{producto_id: [(insumo_id, cantidad), ...]}``"""
+    from .models import InsumoProducto
+
+    recetas = defaultdict(list)
+    for producto_id, insumo_id, cantidad in InsumoProducto.objects.filter(
+        producto_id__in=producto_ids
+    ).values_list('producto_id', 'insumo_id', 'cantidad'):
+        recetas[producto_id].append((insumo_id, cantidad))
+    return recetas
+
+
+def _mover(variaciones, actuales, movimientos):
+    from .models import MovimientoStock
+
+    _actualizar({pk: variacion for pk, variacion in variaciones.items() if variacion}, actuales)
+    MovimientoStock.objects.bulk_create(movimientos, batch_size=500)
+
+
+def reservar(pedidos, usuario=None):
+    """
+    Descuenta los insumos del producto de cada pedido de ``pedidos``
+    (``[(pedido_id, producto_id), ...]``, en ese orden de prioridad). Los
+    pedidos para los que no alcanza el stock quedan sin reservar y se
+    devuelven como ``{pedido_id: {insumo_id: faltante}}``.
+    Se llama dentro de ``transaccion_de_reserva``.
+    """
+    from .models import MovimientoStock
+
+    recetas = _recetas({producto_id for _, producto_id in pedidos if producto_id})
+    actuales = _leer(sorted({pk for receta in recetas.values() for pk, _ in receta}))
+    disponible = {pk: cantidad for pk, (cantidad, _) in actuales.items()}
+
+    sin_stock = {}
+    movimientos = []
+    ahora = timezone.now()
+    for pedido_id, producto_id in pedidos:
+        receta = recetas.get(producto_id, ())
+        faltantes = {pk: cantidad - disponible[pk] for pk, cantidad in receta if disponible[pk] < cantidad}
+        if faltantes:
+            sin_stock[pedido_id] = faltantes
+            continue
+        for pk, cantidad in receta:
+            disponible[pk] -= cantidad
+            movimientos.append(MovimientoStock(
+                insumo_id=pk, cantidad=-cantidad, saldo=disponible[pk], motivo='reserva',
+                usuario=usuario, pedido_id=pedido_id, fecha=ahora,
+            ))
+
+    _mover({pk: disponible[pk] - cantidad for pk, (cantidad, _) in actuales.items()}, actuales, movimientos)
+    return sin_stock
+
+
+def liberar(pedido_ids, usuario=None):
+    """
+    Devuelve al stock lo que ``pedido_ids`` (ids o un queryset de ids) tienen
+    reservado según el libro. Se llama dentro de ``transaccion_de_reserva``.
+    """
+    from .models import MovimientoStock
+
+    reservado = list(
+        MovimientoStock.objects.filter(pedido__in=pedido_ids, motivo__in=('reserva', 'liberacion'))
+        .values('pedido_id', 'insumo_id').annotate(total=Sum('cantidad'))
+        .filter(total__lt=0).order_by('pedido_id', 'insumo_id')
+    )
+    actuales = _leer(sorted({fila['insumo_id'] for fila in reservado}))
+    disponible = {pk: cantidad for pk, (cantidad, _) in actuales.items()}
+
+    movimientos = []
+    ahora = timezone.now()
+    for fila in reservado:
+        disponible[fila['insumo_id']] -= fila['total']
+        movimientos.append(MovimientoStock(
+            insumo_id=fila['insumo_id'], cantidad=-fila['total'], saldo=disponible[fila['insumo_id']],
+            motivo='liberacion', usuario=usuario, pedido_id=fila['pedido_id'], fecha=ahora,
+        ))
+
+    _mover({pk: disponible[pk] - cantidad for pk, (cantidad, _) in actuales.items()}, actuales, movimientos)
+
+
+def bajo_stock(insumos):
+    """Insumos con menos de ``STOCK_BAJO`` unidades, del más escaso al más abundante (usa ``insumo_cantidad_idx``)"""
+    return insumos.filter(cantidad_disponible__lt=STOCK_BAJO).order_by('cantidad_disponible', 'pk')
@@ -0,0 +1,171 @@
+"""
+Almacenamiento de archivos por contenido.
+
+Cada archivo se guarda con el nombre de su hash SHA-256:
+
+    productos/polera.jpg  ->  productos/3f/3f9a...c1.jpg
+
+Si se sube dos veces la misma imagen, se guarda una sola copia y
+``ArchivoAlmacenado`` cuenta cuántos registros la usan; ``delete`` solo borra
+el archivo del disco cuando ya nadie lo referencia. Como el nombre cambia si
+cambia el contenido, estos archivos se pueden servir con caché inmutable.
+
+Guardar y borrar el mismo archivo a la vez no se pisan: los dos empiezan por
+escribir la fila de ``ArchivoAlmacenado`` (el UPDATE la bloquea en
+PostgreSQL; en SQLite toma el bloqueo de escritura de la base) y revisan o
+borran el archivo dentro de esa misma transacción. Un borrado que llega
+primero termina de borrar antes de que la subida mire si el archivo existe;
+una subida que llega primero deja la cuenta en 2 y el borrado no toca el disco.
+"""
+import hashlib
+import os
+import re
+import secrets
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+PATRON_HASH = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.[A-Za-z0-9]+)?$')
+
+
+def es_nombre_por_contenido(nombre):
+    return bool(PATRON_HASH.search(nombre or ''))
+
+
+def hash_contenido(contenido):
+    sha = hashlib.sha256()
+    if hasattr(contenido, 'seek'):
+        contenido.seek(0)
+    for trozo in contenido.chunks():
+        sha.update(trozo)
+    if hasattr(contenido, 'seek'):
+        contenido.seek(0)
+    return sha.hexdigest()
+
+
+def nombre_por_contenido(nombre, hash_hex):
+    carpeta, original = os.path.split(nombre)
+    _, extension = os.path.splitext(original)
+    return os.path.join(carpeta, hash_hex[:2], hash_hex + extension.lower()).replace(os.sep, '/')
+
+
+@deconstructible
+class AlmacenamientoPorContenido(FileSystemStorage):
+    """``FileSystemStorage`` con nombres por hash y conteo de referencias"""
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo se decide en _save a partir del contenido
+        return name
+
+    def _save(self, name, content):
+        nombre = nombre_por_contenido(name, hash_contenido(content))
+        with transaction.atomic():
+            # Primero la referencia (bloquea la fila): un delete en curso ya no
+            # puede borrar el archivo entre la revisión y la escritura
+            self.agregar_referencia(nombre, content.size)
+            if not self.exists(nombre):
+                self._guardar_contenido(nombre, content)
+        return nombre
+
+    def _guardar_contenido(self, nombre, content):
+        # Se escribe con un nombre temporal y se enlaza con el definitivo: el
+        # archivo aparece completo y, si dos subidas iguales compiten, la
+        # segunda recibe FileExistsError (el contenido es el mismo). Con el
+        # nombre definitivo, FileSystemStorage._save reintentaría con el mismo
+        # nombre para siempre, porque get_available_name no lo cambia.
+        temporal = super()._save(f'{nombre}.{secrets.token_hex(8)}.tmp', content)
+        try:
+            os.link(self.path(temporal), self.path(nombre))
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(self.path(temporal))
+
+    def delete(self, name):
+        if not name:
+            return
+        # El archivo se borra con la fila todavía bloqueada
+        with transaction.atomic():
+            if self.quitar_referencia(name):
+                super().delete(name)
+
+    # -- conteo de referencias --------------------------------------------
+
+    def agregar_referencia(self, nombre, tamano=0, cantidad=1):
+        from .models import ArchivoAlmacenado
+
+        filas = ArchivoAlmacenado.objects.filter(nombre=nombre)
+        if filas.update(referencias=F('referencias') + cantidad):
+            return
+        try:
+            with transaction.atomic():
+                ArchivoAlmacenado.objects.create(nombre=nombre, referencias=cantidad, tamano=tamano or 0)
+        except IntegrityError:
+            # Otro proceso creó la fila al mismo tiempo
+            filas.update(referencias=F('referencias') + cantidad)
+
+    def quitar_referencia(self, nombre):
+        """
+        Descuenta una referencia. Devuelve True si el archivo se puede borrar
+        del disco (nadie más lo usa o no se lleva la cuenta de él).
+        """
+        from .models import ArchivoAlmacenado
+
+        with transaction.atomic():
+            if ArchivoAlmacenado.objects.filter(nombre=nombre, referencias__gt=1).update(
+                referencias=F('referencias') - 1
+            ):
+                return False
+            ArchivoAlmacenado.objects.filter(nombre=nombre).delete()
+        return True
+
+
+almacenamiento_por_contenido = AlmacenamientoPorContenido()
+
+
+# ============================================
+# MANTENCIÓN
+# ============================================
+
+def campos_por_contenido():
+    """``(modelo, campo)`` de todos los archivos que usan este almacenamiento"""
+    from django.apps import apps
+
+    return [
+        (modelo, campo.name)
+        for modelo in apps.get_app_config('tienda').get_models()
+        for campo in modelo._meta.concrete_fields
+        if isinstance(getattr(campo, 'storage', None), AlmacenamientoPorContenido)
+    ]
+
+
+def recontar_referencias(storage=almacenamiento_por_contenido):
+    """
+    Reconstruye ``ArchivoAlmacenado`` a partir de los registros que realmente
+    apuntan a cada archivo. Devuelve ``{nombre: referencias}``.
+    """
+    from collections import Counter
+
+    from .models import ArchivoAlmacenado
+
+    conteo = Counter()
+    for modelo, campo in campos_por_contenido():
+        nombres = modelo._default_manager.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+        conteo.update(nombre for nombre in nombres.values_list(campo, flat=True) if es_nombre_por_contenido(nombre))
+
+    with transaction.atomic():
+        ArchivoAlmacenado.objects.exclude(nombre__in=list(conteo)).delete()
+        existentes = ArchivoAlmacenado.objects.in_bulk(list(conteo), field_name='nombre')
+        for archivo in existentes.values():
+            archivo.referencias = conteo[archivo.nombre]
+        ArchivoAlmacenado.objects.bulk_update(existentes.values(), ['referencias'], batch_size=500)
+        ArchivoAlmacenado.objects.bulk_create([
+            ArchivoAlmacenado(
+                nombre=nombre, referencias=cantidad,
+                tamano=storage.size(nombre) if storage.exists(nombre) else 0,
+            )
+            for nombre, cantidad in conteo.items() if nombre not in existentes
+        ], batch_size=500)
+    return dict(conteo)
@@ -0,0 +1,53 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from tienda import imagenes
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagen_responsiva(archivo, alt='', sizes='100vw', style='', loading='lazy'):
+    """
+    ``<picture>`` con fuentes AVIF/WebP y ``srcset`` en JPEG como respaldo.
+    Si la imagen aún no tiene derivados, se usa el original.
+
+    Uso: {% imagen_responsiva producto.imagen_1 alt=producto.nombre sizes="400px" %}
+    """
+    if not archivo:
+        return ''
+
+    disponibles = imagenes.derivados(archivo)
+    fuentes = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (imagenes.TIPOS_MIME[formato], imagenes.srcset(archivo, formato), sizes)
+            for formato in ('avif', 'webp') if formato in disponibles
+        )
+    )
+    respaldo = imagenes.srcset(archivo, 'jpeg')
+
+    if respaldo:
+        img = format_html(
+            '<img src="{}" srcset="{}" sizes="{}" alt="{}" style="{}" loading="{}" decoding="async">',
+            archivo.url, respaldo, sizes, alt, style, loading
+        )
+    else:
+        img = format_html(
+            '<img src="{}" alt="{}" style="{}" loading="{}" decoding="async">',
+            archivo.url, alt, style, loading
+        )
+    return format_html('<picture>{}{}</picture>', fuentes, img)
+
+
+@register.simple_tag
+def srcset(archivo, formato='webp'):
+    """Valor del atributo ``srcset`` para un formato: "url 200w, url 400w, ..." """
+    return imagenes.srcset(archivo, formato)
+
+
+@register.filter
+def miniatura(archivo, ancho=100):
+    """URL del derivado más chico de al menos ``ancho`` píxeles"""
+    return imagenes.url_miniatura(archivo, int(ancho))
@@ -1,3 +1,1884 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from . import busqueda, cache_paginas, exportacion, idempotencia, importacion, imagenes, instrumentacion, perfilado, presupuestos, reportes, resumen, stock, transiciones
+from .admin import PedidoAdminForm
+from .instantanea import invalidar_catalogo, obtener_instantanea, olvidar_version
+from . import procesamiento
+from .models import (
+    ArchivoAlmacenado, Categoria, ClaveIdempotencia, ImagenReferencia, Insumo, InsumoProducto, MovimientoStock, Pedido, PedidoEvento, PedidoResumenDiario, Producto,
+    VersionCatalogo,
+)
+from .paginacion import PaginadorCursor
+from .renderers import RenderizadorJSONRapido
+from .serializers import InsumoSerializer, PedidoSerializer, SerializadorRapido
+from .storage import almacenamiento_por_contenido, es_nombre_por_contenido
+
+
+def crear_producto(categoria, **kwargs):
+    datos = {
+        'nombre': 'Producto',
+        'descripcion': 'Descripción',
+        'categoria': categoria,
+        'precio_base': 10000,
+    }
+    datos.update(kwargs)
+    return Producto.objects.create(**datos)
+
+
+def crear_pedido(**kwargs):
+    datos = {
+        'nombre_cliente': 'Cliente',
+        'email': 'cliente@example.com',
+        'descripcion_diseno': 'Logo en el pecho',
+    }
+    datos.update(kwargs)
+    return Pedido.objects.create(**datos)
+
+
+def imagen_jpeg(nombre='foto.jpg', tamano=(1000, 800)):
+    """JPEG de prueba con datos EXIF (fabricante de la cámara)"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camara de prueba'
+    buffer = BytesIO()
+    Image.new('RGB', tamano, (200, 30, 30)).save(buffer, format='JPEG', exif=exif)
+    return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaTemporalMixin:
+    """Guarda los archivos subidos en un directorio temporal"""
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajuste = override_settings(
+            MEDIA_ROOT=directorio,
+            PROCESAMIENTO_STAGING_DIR=os.path.join(directorio, 'staging'),
+        )
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+
+class TiendaTestCase(TestCase):
+    """Vacía el caché entre tests (páginas, seguimiento, etc.) y olvida la versión del catálogo leída"""
+
+    def setUp(self):
+        cache.clear()
+        olvidar_version()
+        imagenes._disponibles.clear()
+
+
+class BusquedaCatalogoTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Ropa')
+        cls.polera = crear_producto(
+            cls.categoria, nombre='Polera estampada', descripcion='Algodón 100%, diseño a elección'
+        )
+        cls.taza = crear_producto(
+            cls.categoria, nombre='Taza mágica', descripcion='Cerámica que cambia de color, ideal con poleras'
+        )
+        cls.inactivo = crear_producto(
+            cls.categoria, nombre='Polera antigua', descripcion='Fuera de catálogo', activo=False
+        )
+
+    def test_normaliza_tildes_y_plurales(self):
+        self.assertEqual(busqueda.terminos('Poleras'), busqueda.terminos('polera'))
+        self.assertEqual(busqueda.terminos('diseño'), busqueda.terminos('DISENO'))
+        self.assertEqual(busqueda.terminos('lápices'), busqueda.terminos('lapiz'))
+
+    def test_ordena_por_relevancia(self):
+        # La coincidencia en el nombre pesa más que en la descripción
+        self.assertEqual(busqueda.buscar_ids('poleras'), [self.polera.pk, self.taza.pk])
+        self.assertEqual(busqueda.buscar_ids('ceramica'), [self.taza.pk])
+
+    def test_indice_se_actualiza_al_guardar_y_eliminar(self):
+        self.taza.nombre = 'Tazón mágico'
+        self.taza.save()
+        self.assertEqual(busqueda.buscar_ids('tazon'), [self.taza.pk])
+
+        self.polera.activo = False
+        self.polera.save()
+        self.assertEqual(busqueda.buscar_ids('estampada'), [])
+
+        self.taza.delete()
+        self.assertEqual(busqueda.buscar_ids('tazon'), [])
+
+    def test_vista_catalogo_usa_el_indice(self):
+        respuesta = self.client.get(reverse('tienda:catalogo'), {'q': 'Pólera'})
+        self.assertEqual(list(respuesta.context['productos']), [self.polera, self.taza])
+
+    def test_categoria_se_filtra_antes_del_limite(self):
+        tazas = Categoria.objects.create(nombre='Tazas')
+        otra = crear_producto(tazas, nombre='Taza blanca', descripcion='Ideal para poleras')
+
+        # Con el límite en 1 la taza queda fuera del ranking global, no del de su categoría
+        self.assertEqual(busqueda.buscar_ids('poleras', limite=1), [self.polera.pk])
+        self.assertEqual(busqueda.buscar_ids('poleras', limite=1, categoria_id=tazas.pk), [otra.pk])
+        with mock.patch.object(busqueda.buscar_ids, '__defaults__', (1, None)):
+            respuesta = self.client.get(reverse('tienda:catalogo'), {'q': 'poleras', 'categoria': tazas.pk})
+        self.assertEqual(list(respuesta.context['productos']), [otra])
+
+
+class InstantaneaCatalogoTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ropa = Categoria.objects.create(nombre='Ropa')
+        cls.hogar = Categoria.objects.create(nombre='Hogar')
+        cls.polera = crear_producto(cls.ropa, nombre='Polera')
+        cls.taza = crear_producto(cls.hogar, nombre='Taza')
+        cls.inactivo = crear_producto(cls.hogar, nombre='Cojín', activo=False)
+
+    def test_inicio_y_catalogo_sin_consultas(self):
+        obtener_instantanea()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('tienda:index'))
+            respuesta = self.client.get(reverse('tienda:catalogo'), {'categoria': self.hogar.pk})
+        self.assertEqual(respuesta.context['productos'], [self.taza])
+
+    def test_categoria_invalida_no_falla(self):
+        respuesta = self.client.get(reverse('tienda:catalogo'), {'categoria': 'abc'})
+        self.assertEqual(respuesta.context['productos'], [])
+
+    def test_se_reconstruye_al_cambiar_la_version(self):
+        anterior = obtener_instantanea()
+        self.assertEqual(list(anterior.productos), [self.polera, self.taza])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.inactivo.activo = True
+            self.inactivo.save()
+
+        nueva = obtener_instantanea()
+        self.assertNotEqual(nueva.version, anterior.version)
+        self.assertEqual(nueva.filtrar(self.hogar.pk), [self.taza, self.inactivo])
+
+    def test_otros_workers_ven_la_version_de_la_base(self):
+        anterior = obtener_instantanea()
+        # Otro worker cambió un producto: solo sube la versión en la base
+        Producto.objects.filter(pk=self.inactivo.pk).update(activo=True)
+        VersionCatalogo.objects.update(valor=F('valor') + 1)
+
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_instantanea(), anterior)
+        with override_settings(CATALOGO_VERSION_SEGUNDOS=0):
+            self.assertEqual(obtener_instantanea().filtrar(self.hogar.pk), [self.taza, self.inactivo])
+
+
+class CachePaginasTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ropa = Categoria.objects.create(nombre='Ropa')
+        cls.hogar = Categoria.objects.create(nombre='Hogar')
+        cls.polera = crear_producto(cls.ropa, nombre='Polera')
+        cls.taza = crear_producto(cls.hogar, nombre='Taza')
+
+    def get(self, nombre, *args, **params):
+        return self.client.get(reverse(nombre, args=args), params)
+
+    def test_segunda_visita_sale_del_cache(self):
+        self.assertEqual(self.get('tienda:detalle_producto', self.polera.pk)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            respuesta = self.get('tienda:detalle_producto', self.polera.pk)
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        self.assertContains(respuesta, 'Polera')
+
+    def test_parametros_forman_parte_de_la_clave(self):
+        self.get('tienda:catalogo', categoria=self.ropa.pk)
+        self.assertEqual(self.get('tienda:catalogo', categoria=self.hogar.pk)['X-Cache'], 'MISS')
+        self.assertEqual(self.get('tienda:catalogo', categoria=self.ropa.pk, otro='x')['X-Cache'], 'HIT')
+
+    def test_editar_producto_purga_solo_paginas_afectadas(self):
+        self.get('tienda:detalle_producto', self.polera.pk)
+        self.get('tienda:detalle_producto', self.taza.pk)
+        self.get('tienda:catalogo', categoria=self.ropa.pk)
+        self.get('tienda:catalogo', categoria=self.hogar.pk)
+        self.get('tienda:index')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.polera.nombre = 'Polera oversize'
+            self.polera.save()
+
+        self.assertContains(self.get('tienda:detalle_producto', self.polera.pk), 'Polera oversize')
+        self.assertEqual(self.get('tienda:catalogo', categoria=self.ropa.pk)['X-Cache'], 'MISS')
+        self.assertEqual(self.get('tienda:index')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('tienda:detalle_producto', self.taza.pk)['X-Cache'], 'HIT')
+        self.assertEqual(self.get('tienda:catalogo', categoria=self.hogar.pk)['X-Cache'], 'HIT')
+
+    def test_editar_categoria_purga_sus_paginas_y_los_listados(self):
+        self.get('tienda:detalle_producto', self.polera.pk)
+        self.get('tienda:detalle_producto', self.taza.pk)
+        self.get('tienda:catalogo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ropa.nombre = 'Vestuario'
+            self.ropa.save()
+
+        self.assertContains(self.get('tienda:detalle_producto', self.polera.pk), 'Vestuario')
+        self.assertContains(self.get('tienda:catalogo'), 'Vestuario')
+        self.assertEqual(self.get('tienda:detalle_producto', self.taza.pk)['X-Cache'], 'HIT')
+
+    def test_purgas_por_version_y_durante_el_render(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        purgar_al_renderizar = []
+
+        @cache_paginas.cache_pagina
+        def vista(request):
+            if purgar_al_renderizar:
+                cache_paginas.purgar(*purgar_al_renderizar)
+            return cache_paginas.etiquetar(HttpResponse(request.path), 'producto:1')
+
+        def pedir(ruta):
+            request = RequestFactory().get(ruta)
+            request.user = AnonymousUser()
+            return vista(request)['X-Cache']
+
+        # Dos páginas con la misma etiqueta: la purga invalida las dos
+        self.assertEqual([pedir('/a/'), pedir('/b/'), pedir('/a/'), pedir('/b/')], ['MISS', 'MISS', 'HIT', 'HIT'])
+        cache_paginas.purgar('producto:1')
+        self.assertEqual([pedir('/a/'), pedir('/b/'), pedir('/a/')], ['MISS', 'MISS', 'HIT'])
+
+        # Una purga mientras se renderiza: la página pudo leer datos viejos y no se guarda
+        cache_paginas.purgar('producto:1')
+        purgar_al_renderizar.append('categoria:9')
+        self.assertEqual(pedir('/a/'), 'MISS')
+        purgar_al_renderizar.clear()
+        self.assertEqual([pedir('/a/'), pedir('/a/')], ['MISS', 'HIT'])
+
+    def test_usuarios_autenticados_no_usan_el_cache(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_user('staff'))
+        self.assertNotIn('X-Cache', self.get('tienda:index'))
+
+    def test_funciona_con_cache_en_archivos(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            archivos = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directorio,
+            }}
+            with override_settings(CACHES=archivos):
+                self.get('tienda:detalle_producto', self.taza.pk)
+                self.assertEqual(self.get('tienda:detalle_producto', self.taza.pk)['X-Cache'], 'HIT')
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.taza.save()
+                self.assertEqual(self.get('tienda:detalle_producto', self.taza.pk)['X-Cache'], 'MISS')
+
+
+class PaginacionCursorTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Ropa')
+        precios = [5000, 3000, 3000, 8000, 1000]
+        cls.productos = [
+            crear_producto(cls.categoria, nombre=f'Producto {i}', precio_base=precio)
+            for i, precio in enumerate(precios * 6)
+        ]
+
+    def recorrer(self, **params):
+        vistos = []
+        cursor = None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            respuesta = self.client.get(reverse('tienda:catalogo'), params)
+            vistos.extend(respuesta.context['productos'])
+            cursor = respuesta.context['cursor_siguiente']
+            if not cursor:
+                return vistos
+
+    def test_catalogo_recorre_todas_las_paginas(self):
+        self.assertEqual(self.recorrer(), self.productos)
+
+    def test_catalogo_por_precio_es_estable(self):
+        esperado = sorted(self.productos, key=lambda p: (p.precio_base, p.pk))
+        self.assertEqual(self.recorrer(orden='precio'), esperado)
+
+    def test_queryset_usa_keyset_y_no_offset(self):
+        paginador = PaginadorCursor(Producto, ('precio_base', 'id'), 12)
+        primera = paginador.paginar(Producto.objects.all())
+        with self.assertNumQueries(1) as contexto:
+            segunda = paginador.paginar(Producto.objects.all(), primera.siguiente)
+        sql = contexto.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql)
+        self.assertEqual(len(segunda), 12)
+        self.assertTrue(set(primera.objetos).isdisjoint(segunda.objetos))
+
+    def test_api_pedidos_paginada_por_cursor(self):
+        pedidos = [crear_pedido(nombre_cliente=f'Cliente {i}') for i in range(7)]
+        url = reverse('api-filtro-pedidos')
+
+        respuesta = self.client.get(url, {'tamano': 5}).json()
+        self.assertEqual(len(respuesta['results']), 5)
+        siguiente = self.client.get(respuesta['next']).json()
+        self.assertIsNone(siguiente['next'])
+
+        ids = [p['id'] for p in respuesta['results'] + siguiente['results']]
+        self.assertEqual(ids, [p.pk for p in reversed(pedidos)])
+
+    def test_api_cursor_invalido(self):
+        respuesta = self.client.get(reverse('api-filtro-pedidos'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(respuesta.status_code, 404)
+
+
+class DerivadosImagenTests(MediaTemporalMixin, TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.categoria = Categoria.objects.create(nombre='Ropa')
+
+    def crear_con_imagen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return crear_producto(self.categoria, nombre='Polera', imagen_1=imagen_jpeg())
+
+    def test_genera_anchos_fijos_sin_metadatos(self):
+        producto = self.crear_con_imagen()
+        disponibles = imagenes.derivados(producto.imagen_1)
+
+        self.assertIn('webp', disponibles)
+        self.assertEqual([ancho for ancho, _ in disponibles['jpeg']], [100, 200, 400, 800])
+        for formato in imagenes.formatos_disponibles():
+            nombre = imagenes.nombre_derivado(producto.imagen_1.name, 200, formato)
+            with default_storage.open(nombre) as archivo:
+                derivado = Image.open(archivo)
+                self.assertEqual(derivado.width, 200)
+                self.assertEqual(len(derivado.getexif()), 0)
+
+    def test_plantillas_y_admin_usan_los_derivados(self):
+        producto = self.crear_con_imagen()
+        respuesta = self.client.get(reverse('tienda:detalle_producto', args=[producto.pk]))
+        self.assertContains(respuesta, 'type="image/webp"')
+        self.assertContains(respuesta, '_400w.webp 400w')
+        self.assertTrue(imagenes.url_miniatura(producto.imagen_1).endswith('_100w.webp'))
+
+    def test_sin_derivados_se_usa_el_original(self):
+        producto = crear_producto(self.categoria, nombre='Polera', imagen_1=imagen_jpeg())
+        respuesta = self.client.get(reverse('tienda:detalle_producto', args=[producto.pk]))
+        self.assertContains(respuesta, f'src="{producto.imagen_1.url}"')
+        self.assertNotContains(respuesta, 'srcset')
+
+    def test_sin_derivados_se_recuerda_por_un_rato(self):
+        producto = crear_producto(self.categoria, nombre='Polera', imagen_1=imagen_jpeg())
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            self.assertEqual(imagenes.derivados(producto.imagen_1), {})
+            self.assertEqual(imagenes.derivados(producto.imagen_1), {})
+            self.assertEqual(exists.call_count, 1)
+
+            # Vencido el plazo se vuelve a mirar (por si otro worker los generó)
+            with mock.patch.object(imagenes.time, 'monotonic', return_value=imagenes.time.monotonic() + 61):
+                imagenes.derivados(producto.imagen_1)
+            self.assertEqual(exists.call_count, 2)
+
+    def test_comando_genera_derivados_faltantes(self):
+        producto = crear_producto(self.categoria, nombre='Polera', imagen_1=imagen_jpeg())
+        call_command('generar_derivados', stdout=StringIO())
+        self.assertTrue(imagenes.derivados(producto.imagen_1))
+
+
+class ProcesamientoImagenesReferenciaTests(MediaTemporalMixin, TiendaTestCase):
+    def enviar_pedido(self, **archivos):
+        datos = {
+            'nombre_cliente': 'Ana',
+            'email': 'ana@example.com',
+            'descripcion_diseno': 'Logo de mi empresa',
+        }
+        datos.update(archivos)
+        return self.client.post(reverse('tienda:solicitar_pedido'), datos)
+
+    def test_pedido_se_guarda_antes_de_procesar_las_imagenes(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            respuesta = self.enviar_pedido(
+                imagen_referencia_1=imagen_jpeg('a.jpg'),
+                imagen_referencia_2=imagen_jpeg('b.jpg'),
+            )
+        self.assertRedirects(respuesta, reverse('tienda:pedido_exitoso'))
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.imagenes_pendientes, 2)
+        self.assertFalse(pedido.imagenes_referencia.exists())
+        self.assertEqual(procesamiento.pedidos_en_espera(), [pedido.pk])
+
+        seguimiento = self.client.get(pedido.get_absolute_url())
+        self.assertContains(seguimiento, 'Procesando imágenes de referencia')
+
+    def test_procesamiento_reduce_y_quita_exif(self):
+        with self.settings(PROCESAMIENTO_SINCRONO=True, IMAGEN_REFERENCIA_LADO_MAXIMO=500):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.enviar_pedido(imagen_referencia_1=imagen_jpeg('grande.jpg', (3000, 2000)))
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.imagenes_pendientes, 0)
+        imagen = pedido.imagenes_referencia.get()
+        with imagen.imagen.open() as archivo:
+            procesada = Image.open(archivo)
+            self.assertEqual(procesada.size, (500, 333))
+            self.assertEqual(len(procesada.getexif()), 0)
+        self.assertEqual(imagen.descripcion, 'Imagen de referencia 1 enviada por el cliente')
+        self.assertEqual(procesamiento.pedidos_en_espera(), [])
+
+        seguimiento = self.client.get(pedido.get_absolute_url())
+        self.assertNotContains(seguimiento, 'Procesando imágenes de referencia')
+
+    def test_archivo_que_no_es_imagen_se_descarta(self):
+        falso = SimpleUploadedFile('virus.jpg', b'esto no es una imagen', content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=False):
+            self.enviar_pedido(imagen_referencia_1=falso)
+
+        pedido = Pedido.objects.get()
+        call_command('procesar_imagenes_pendientes', stdout=StringIO())
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.imagenes_pendientes, 0)
+        self.assertFalse(ImagenReferencia.objects.exists())
+
+    def test_pool_y_comando_a_la_vez_procesan_cada_archivo_una_vez(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.enviar_pedido(imagen_referencia_1=imagen_jpeg('a.jpg'), imagen_referencia_2=imagen_jpeg('b.jpg'))
+        pedido = Pedido.objects.get()
+        preparar = procesamiento._preparar_imagen
+        otro = []
+
+        def preparar_mientras_corre_el_comando(ruta):
+            # Mientras el pool procesa el primer archivo, el comando recorre el mismo pedido
+            if not otro:
+                otro.append(None)
+                otro[0] = procesamiento.procesar_pedido(pedido.pk)
+            return preparar(ruta)
+
+        with mock.patch.object(procesamiento, '_preparar_imagen', preparar_mientras_corre_el_comando):
+            procesadas = procesamiento.procesar_pedido(pedido.pk)
+
+        self.assertEqual((procesadas, otro), (1, [1]))
+        self.assertEqual(pedido.imagenes_referencia.count(), 2)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.imagenes_pendientes, 0)
+        self.assertEqual(procesamiento.pedidos_en_espera(), [])
+
+        # Un archivo tomado por un proceso que murió se vuelve a tomar más tarde
+        directorio = procesamiento._directorio_espera(pedido.pk)
+        os.makedirs(directorio)
+        ruta = os.path.join(directorio, '1_abc.jpg.1234abcd' + procesamiento.SUFIJO_TOMADO)
+        with open(ruta, 'wb') as archivo:
+            archivo.write(imagen_jpeg().read())
+        self.assertEqual(procesamiento.procesar_pedido(pedido.pk), 0)
+        os.utime(ruta, (0, 0))
+        self.assertEqual(procesamiento.procesar_pedido(pedido.pk), 1)
+        self.assertEqual(procesamiento.pedidos_en_espera(), [])
+
+
+class AlmacenamientoPorContenidoTests(MediaTemporalMixin, TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.categoria = Categoria.objects.create(nombre='Ropa')
+
+    def test_misma_imagen_se_guarda_una_vez(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            uno = crear_producto(self.categoria, imagen_1=imagen_jpeg('a.jpg'))
+            dos = crear_producto(self.categoria, imagen_1=imagen_jpeg('b.jpg'), imagen_2=imagen_jpeg('c.jpg'))
+
+        self.assertTrue(es_nombre_por_contenido(uno.imagen_1.name))
+        self.assertEqual(uno.imagen_1.name, dos.imagen_1.name)
+        self.assertEqual(dos.imagen_1.name, dos.imagen_2.name)
+        self.assertEqual(ArchivoAlmacenado.objects.get(nombre=uno.imagen_1.name).referencias, 3)
+
+    def test_subidas_iguales_en_paralelo_no_fallan(self):
+        contenido = imagen_jpeg().read()
+        primero = almacenamiento_por_contenido.save('referencias/a.jpg', SimpleUploadedFile('a.jpg', contenido))
+
+        # La otra subida terminó entre el exists() y la escritura
+        with mock.patch.object(type(almacenamiento_por_contenido), 'exists', return_value=False):
+            segundo = almacenamiento_por_contenido.save('referencias/b.jpg', SimpleUploadedFile('b.jpg', contenido))
+
+        self.assertEqual(primero, segundo)
+        self.assertEqual(os.listdir(os.path.dirname(almacenamiento_por_contenido.path(primero))), [os.path.basename(primero)])
+        self.assertEqual(ArchivoAlmacenado.objects.get(nombre=primero).referencias, 2)
+
+    def test_la_referencia_se_toma_antes_de_mirar_el_disco(self):
+        contenido = imagen_jpeg().read()
+        nombre = almacenamiento_por_contenido.save('referencias/a.jpg', SimpleUploadedFile('a.jpg', contenido))
+        exists = FileSystemStorage.exists
+        vistas = []
+
+        def exists_y_contar(storage, nombre):
+            # Lo que vería un delete concurrente al llegar aquí
+            vistas.append(ArchivoAlmacenado.objects.get(nombre=nombre).referencias)
+            return exists(storage, nombre)
+
+        with mock.patch.object(type(almacenamiento_por_contenido), 'exists', exists_y_contar):
+            almacenamiento_por_contenido.save('referencias/b.jpg', SimpleUploadedFile('b.jpg', contenido))
+        # Ya cuenta la subida nueva: un delete del otro registro no borra el archivo
+        self.assertEqual(vistas, [2])
+
+        almacenamiento_por_contenido.delete(nombre)
+        self.assertTrue(almacenamiento_por_contenido.exists(nombre))
+
+    def test_solo_se_borra_cuando_nadie_lo_usa(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            uno = crear_producto(self.categoria, imagen_1=imagen_jpeg())
+            dos = crear_producto(self.categoria, imagen_1=imagen_jpeg())
+        nombre = uno.imagen_1.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uno.delete()
+        self.assertTrue(almacenamiento_por_contenido.exists(nombre))
+        self.assertTrue(imagenes.derivados(dos.imagen_1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dos.delete()
+        self.assertFalse(almacenamiento_por_contenido.exists(nombre))
+        self.assertFalse(default_storage.exists(imagenes.nombre_derivado(nombre, 100, 'jpeg')))
+        self.assertFalse(ArchivoAlmacenado.objects.exists())
+
+    def test_comando_deduplica_archivos_existentes(self):
+        contenido = imagen_jpeg().read()
+        nombres = [default_storage.save(f'productos/copia_{n}.jpg', SimpleUploadedFile('x.jpg', contenido)) for n in range(3)]
+        productos = [crear_producto(self.categoria) for _ in nombres]
+        for producto, nombre in zip(productos, nombres):
+            Producto.objects.filter(pk=producto.pk).update(imagen_1=nombre)
+
+        call_command('deduplicar_media', stdout=StringIO())
+
+        finales = set(Producto.objects.values_list('imagen_1', flat=True))
+        self.assertEqual(len(finales), 1)
+        final = finales.pop()
+        self.assertTrue(es_nombre_por_contenido(final))
+        self.assertEqual(ArchivoAlmacenado.objects.get(nombre=final).referencias, 3)
+        self.assertEqual(default_storage.listdir('productos')[1], [])
+
+    def test_archivos_por_contenido_se_sirven_como_inmutables(self):
+        producto = crear_producto(self.categoria, imagen_1=imagen_jpeg())
+        respuesta = self.client.get(producto.imagen_1.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('immutable', respuesta['Cache-Control'])
+
+
+class PresupuestosTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Ropa')
+        cls.producto = crear_producto(cls.categoria, precio_base=10000)
+
+    def test_formula(self):
+        self.assertEqual(presupuestos.cotizar(None, 'Logo'), 7000)
+        self.assertEqual(presupuestos.cotizar(10000, 'palabra ' * 60, imagenes=2), 13000)
+        self.assertEqual(presupuestos.cotizar(10000, 'palabra ' * 600, imagenes=9), 17000)
+
+    def test_cambio_de_estado_no_recalcula(self):
+        pedido = crear_pedido(producto_referencia=self.producto)
+        self.assertEqual(pedido.presupuesto_estimado, 10000)
+
+        pedido = Pedido.objects.get(pk=pedido.pk)
+        pedido.estado_pedido = 'aprobado'
+        # UPDATE del pedido, INSERT en el historial, el resumen diario (salir de
+        # un grupo y crear el otro, con su savepoint) y la relectura del estado
+        # con bloqueo (savepoint, bloqueo de escritura de SQLite y SELECT);
+        # nada de productos ni imágenes
+        with self.assertNumQueries(11):
+            pedido.save()
+
+        pedido.descripcion_diseno = 'palabra ' * 30
+        pedido.save(update_fields=['descripcion_diseno'])
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.presupuesto_estimado, 11000)
+
+    def test_cambio_de_precio_recotiza_borradores(self):
+        borrador = crear_pedido(producto_referencia=self.producto)
+        aprobado = crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.precio_base = 20000
+            self.producto.save()
+
+        borrador.refresh_from_db()
+        aprobado.refresh_from_db()
+        self.assertEqual(borrador.presupuesto_estimado, 20000)
+        self.assertEqual(aprobado.presupuesto_estimado, 10000)
+
+    def test_cotizar_en_lote_con_consultas_constantes(self):
+        for _ in range(30):
+            crear_pedido(producto_referencia=self.producto)
+        Producto.objects.filter(pk=self.producto.pk).update(precio_base=15000)
+        invalidar_catalogo()
+
+        with self.assertNumQueries(4):
+            # Tabla de precios, lectura del lote, bulk_update y el lote vacío final
+            self.assertEqual(presupuestos.cotizar_pedidos(lote=100), 30)
+        self.assertEqual(set(Pedido.objects.values_list('presupuesto_estimado', flat=True)), {15000})
+
+
+class ImportacionPedidosTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = crear_producto(Categoria.objects.create(nombre='Ropa'), precio_base=10000)
+
+    def test_csv_con_errores_por_fila(self):
+        archivo = BytesIO((
+            'nombre_cliente,email,descripcion_diseno,producto_referencia,plataforma\n'
+            f'Ana,ana@example.com,Logo,{self.producto.pk},instagram\n'
+            'Beto,no-es-email,Logo,,facebook\n'
+            'Carla,carla@example.com,Logo,999999,\n'
+            'Dani,dani@example.com,"Logo\nen dos líneas",,\n'
+        ).encode('utf-8-sig'))
+
+        resultado = importacion.importar_pedidos(archivo, 'csv', {'plataforma': 'whatsapp'})
+
+        self.assertEqual(resultado.creados, 2)
+        self.assertEqual([error['linea'] for error in resultado.errores], [3, 4])
+        self.assertIn('email', resultado.errores[0]['error'])
+        ana = Pedido.objects.get(nombre_cliente='Ana')
+        self.assertEqual((ana.plataforma, ana.presupuesto_estimado), ('instagram', 10000))
+        self.assertEqual(Pedido.objects.get(nombre_cliente='Dani').plataforma, 'whatsapp')
+        self.assertEqual(len(set(Pedido.objects.values_list('token_seguimiento', flat=True))), 2)
+
+    def test_tokens_repetidos_se_regeneran(self):
+        existente = crear_pedido()
+        tokens = iter([existente.token_seguimiento, 'nuevo00001', 'nuevo00001', 'nuevo00002'])
+        archivo = BytesIO(b'{"nombre_cliente": "Ana", "email": "a@example.com", "descripcion_diseno": "Logo"}\n' * 2)
+
+        with mock.patch.object(importacion, '_nuevo_token', lambda: next(tokens)):
+            resultado = importacion.importar_pedidos(archivo, 'jsonl')
+
+        self.assertEqual(resultado.creados, 2)
+        self.assertEqual(
+            set(Pedido.objects.exclude(pk=existente.pk).values_list('token_seguimiento', flat=True)),
+            {'nuevo00001', 'nuevo00002'}
+        )
+
+    def test_filas_que_rechaza_la_base_son_errores_de_fila(self):
+        archivo = BytesIO(b''.join(
+            b'{"nombre_cliente": "%s", "email": "a@example.com", "descripcion_diseno": "Logo"}\n' % nombre
+            for nombre in (b'Ana', b'Malo', b'Beto', b'Carla')
+        ))
+        bulk_create = Pedido.objects.bulk_create
+
+        def rechazar_malo(pedidos, **kwargs):
+            # Por ejemplo, su producto se eliminó después de validar la fila
+            if any(pedido.nombre_cliente == 'Malo' for pedido in pedidos):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return bulk_create(pedidos, **kwargs)
+
+        with mock.patch.object(Pedido.objects, 'bulk_create', rechazar_malo):
+            resultado = importacion.importar_pedidos(archivo, 'jsonl', lote=3)
+
+        self.assertEqual(resultado.creados, 3)
+        self.assertEqual([error['linea'] for error in resultado.errores], [2])
+        self.assertIn('FOREIGN KEY', resultado.errores[0]['error'])
+        self.assertEqual(sorted(Pedido.objects.values_list('nombre_cliente', flat=True)), ['Ana', 'Beto', 'Carla'])
+        self.assertEqual(PedidoResumenDiario.objects.aggregate(total=Sum('cantidad'))['total'], 3)
+
+    def test_tipos_inesperados_son_errores_de_fila(self):
+        archivo = BytesIO(
+            b'{"nombre_cliente": "Ana", "email": "a@example.com", "descripcion_diseno": "Logo", "fecha_requerida": 20240101}\n'
+            b'{"nombre_cliente": "Beto", "email": "b@example.com", "descripcion_diseno": "Logo"}\n'
+        )
+
+        resultado = importacion.importar_pedidos(archivo, 'jsonl')
+
+        self.assertEqual(resultado.creados, 1)
+        self.assertEqual(resultado.errores[0]['linea'], 1)
+        self.assertIn('fecha_requerida', resultado.errores[0]['error'])
+
+    def test_codificacion_invalida_no_inserta_nada(self):
+        filas = ''.join(f'Cliente {i},c{i}@example.com,Logo\n' for i in range(5))
+        archivo = BytesIO(('nombre_cliente,email,descripcion_diseno\n' + filas + 'José,jose@example.com,Logo\n').encode('latin-1'))
+
+        with self.assertRaises(ValidationError):
+            importacion.importar_pedidos(archivo, 'csv', lote=2)
+        self.assertFalse(Pedido.objects.exists())
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        archivo = SimpleUploadedFile('pedidos.csv', archivo.getvalue())
+        respuesta = self.client.post(reverse('api-importar-pedidos'), {'archivo': archivo})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('UTF-8', respuesta.json()['archivo'][0])
+
+    def test_api_solo_para_administradores(self):
+        archivo = SimpleUploadedFile('pedidos.jsonl', b'{"nombre_cliente": "Ana", "email": "a@example.com", "descripcion_diseno": "Logo"}\n{mal}\n')
+        url = reverse('api-importar-pedidos')
+        self.assertEqual(self.client.post(url, {'archivo': archivo}).status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        archivo.seek(0)
+        respuesta = self.client.post(url, {'archivo': archivo, 'plataforma': 'facebook'})
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['creados'], 1)
+        self.assertEqual(respuesta.json()['errores'][0]['linea'], 2)
+        self.assertEqual(Pedido.objects.get().plataforma, 'facebook')
+
+
+class SeguimientoPedidoTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = crear_producto(Categoria.objects.create(nombre='Ropa'))
+        self.pedido = crear_pedido(producto_referencia=self.producto)
+        ImagenReferencia.objects.create(pedido=self.pedido, imagen='referencias/a.jpg')
+        ImagenReferencia.objects.create(pedido=self.pedido, imagen='referencias/b.jpg')
+        self.url = self.pedido.get_absolute_url()
+
+    def test_una_consulta_y_luego_cache(self):
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(self.url)
+        self.assertContains(respuesta, '2 imágenes')
+        self.assertContains(respuesta, 'referencias/b.jpg')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+    def test_cambios_del_pedido_purgan_su_pagina(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.estado_pedido = 'aprobado'
+            self.pedido.save()
+        self.assertContains(self.client.get(self.url), 'Aprobado')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ImagenReferencia.objects.filter(pedido=self.pedido).first().delete()
+        self.assertContains(self.client.get(self.url), '1 imágenes')
+
+    def test_acciones_del_admin_purgan_su_pagina(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:tienda_pedido_changelist'), {
+                'action': 'marcar_pago_como_pagado', '_selected_action': [self.pedido.pk],
+            })
+        self.client.logout()
+        self.assertContains(self.client.get(self.url), 'Pagado')
+
+    def test_tokens_inexistentes_se_recuerdan(self):
+        url = reverse('tienda:seguimiento_pedido', args=['noexiste'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.client.get(reverse('tienda:seguimiento_pedido', args=['x' * 40]))
+
+        # Un pedido nuevo con ese token deja de estar en la lista
+        crear_pedido(token_seguimiento='noexiste')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class TransicionesPedidoTests(TiendaTestCase):
+    def test_transicion_en_lote_valida_y_registra_historial(self):
+        solicitados = [crear_pedido() for _ in range(20)]
+        entregado = crear_pedido(estado_pedido='entregado')
+        aprobado = crear_pedido(estado_pedido='aprobado')
+
+        # Bloqueo de escritura de SQLite, lectura, UPDATE, INSERT del historial
+        # y dos grupos del resumen (más los savepoints)
+        with self.assertNumQueries(8):
+            resultado = transiciones.transicionar(Pedido.objects.all(), 'estado_pedido', 'aprobado', nota='lote')
+
+        self.assertEqual(sorted(resultado.actualizados), sorted(p.pk for p in solicitados))
+        self.assertEqual(resultado.rechazados, {entregado.pk: 'entregado'})
+        self.assertEqual(resultado.omitidos, [aprobado.pk])
+        self.assertEqual(Pedido.objects.filter(estado_pedido='aprobado').count(), 21)
+        self.assertEqual(
+            PedidoEvento.objects.filter(estado_anterior='solicitado', estado_nuevo='aprobado', nota='lote').count(), 20
+        )
+
+    def test_cambio_entre_la_lectura_y_el_update_deshace_todo(self):
+        pedidos = [crear_pedido(), crear_pedido()]
+        restar = resumen.Diferencias.restar
+
+        def restar_y_pagar_otro(diferencias, valores):
+            # Otro proceso cambia el segundo pedido después de que se leyó
+            Pedido.objects.filter(pk=pedidos[1].pk).update(estado_pago='parcial')
+            restar(diferencias, valores)
+
+        with mock.patch.object(resumen.Diferencias, 'restar', restar_y_pagar_otro):
+            with self.assertRaises(transiciones.TransicionConcurrente):
+                transiciones.transicionar(Pedido.objects.all(), 'estado_pago', 'pagado')
+
+        self.assertEqual(list(Pedido.objects.values_list('estado_pago', flat=True)), ['pendiente', 'pendiente'])
+        self.assertFalse(PedidoEvento.objects.exists())
+
+    def test_api_valida_la_transicion(self):
+        staff = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(staff)
+        finalizado = crear_pedido(estado_pedido='finalizado')
+        url = reverse('pedido-detail', args=[finalizado.pk])
+
+        respuesta = self.client.patch(url, {'estado_pedido': 'solicitado'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('estado_pedido', respuesta.json())
+        self.assertEqual(Pedido.objects.get(pk=finalizado.pk).estado_pedido, 'finalizado')
+
+        respuesta = self.client.patch(url, {'estado_pago': 'parcial'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            list(PedidoEvento.objects.values_list('campo', 'estado_anterior', 'estado_nuevo', 'usuario')),
+            [('estado_pago', 'pendiente', 'parcial', staff.pk)]
+        )
+
+    def test_cambio_individual_queda_en_el_historial(self):
+        pedido = crear_pedido()
+        self.assertFalse(pedido.eventos.exists())
+
+        pedido.estado_pago = 'parcial'
+        pedido.save()
+        pedido.estado_pago = 'pagado'
+        pedido.save()
+
+        self.assertEqual(
+            list(pedido.eventos.values_list('estado_anterior', 'estado_nuevo')),
+            [('pendiente', 'parcial'), ('parcial', 'pagado')]
+        )
+        with self.assertRaises(ValueError):
+            pedido.eventos.first().delete()
+
+    def test_accion_del_admin_informa_rechazados(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        pedidos = [crear_pedido(), crear_pedido(estado_pedido='cancelado')]
+        self.client.force_login(admin)
+        respuesta = self.client.post(reverse('admin:tienda_pedido_changelist'), {
+            'action': 'marcar_como_en_proceso', '_selected_action': [p.pk for p in pedidos],
+        }, follow=True)
+
+        self.assertContains(respuesta, '0 pedidos en proceso.')
+        self.assertContains(respuesta, '2 pedidos no se pueden pasar a')
+        self.assertFalse(PedidoEvento.objects.exists())
+
+    def test_formulario_y_lista_editable_validan_la_transicion(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        cancelado = crear_pedido(estado_pedido='cancelado')
+        pendiente = crear_pedido()
+
+        respuesta = self.client.post(reverse('admin:tienda_pedido_changelist'), {
+            'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2, 'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000,
+            'form-0-id': cancelado.pk, 'form-0-estado_pedido': 'finalizado', 'form-0-estado_pago': 'pendiente',
+            'form-1-id': pendiente.pk, 'form-1-estado_pedido': 'solicitado', 'form-1-estado_pago': 'parcial',
+            '_save': 'Guardar',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'No se puede pasar de')
+        self.assertEqual(Pedido.objects.get(pk=cancelado.pk).estado_pedido, 'cancelado')
+        self.assertFalse(PedidoEvento.objects.exists())
+
+        datos = {**Pedido.objects.filter(pk=cancelado.pk).values().get(), 'estado_pedido': 'finalizado'}
+        self.assertIn('estado_pedido', PedidoAdminForm(datos, instance=Pedido.objects.get(pk=cancelado.pk)).errors)
+        datos = {**Pedido.objects.filter(pk=pendiente.pk).values().get(), 'estado_pago': 'parcial'}
+        self.assertNotIn('estado_pago', PedidoAdminForm(datos, instance=Pedido.objects.get(pk=pendiente.pk)).errors)
+
+
+class ResumenDiarioTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = crear_producto(Categoria.objects.create(nombre='Poleras'))
+
+    def filas(self):
+        return sorted(
+            (fila.fecha, fila.estado_pedido, fila.plataforma, fila.producto_id, fila.cantidad, fila.total_aprobado)
+            for fila in PedidoResumenDiario.objects.filter(cantidad__gt=0)
+        )
+
+    def assertIgualAReconstruido(self):
+        incremental = self.filas()
+        resumen.reconstruir()
+        self.assertEqual(incremental, self.filas())
+
+    def test_guardar_y_eliminar_actualizan_el_resumen(self):
+        pedido = crear_pedido(producto_referencia=self.producto)
+        crear_pedido(plataforma='instagram')
+        pedido.estado_pedido = 'aprobado'
+        pedido.presupuesto_aprobado = 15000
+        pedido.save()
+
+        fila = PedidoResumenDiario.objects.get(estado_pedido='aprobado')
+        self.assertEqual((fila.cantidad, fila.total_aprobado, fila.producto_id), (1, 15000, self.producto.pk))
+        self.assertIgualAReconstruido()
+
+        pedido.delete()
+        self.assertFalse(PedidoResumenDiario.objects.filter(estado_pedido='aprobado', cantidad__gt=0).exists())
+        self.assertIgualAReconstruido()
+
+    def test_importacion_y_transiciones_actualizan_el_resumen(self):
+        contenido = (
+            'nombre_cliente,email,descripcion_diseno,plataforma,producto_referencia\n'
+            + ''.join(f'Cliente {i},c{i}@example.com,Logo,whatsapp,{self.producto.pk}\n' for i in range(30))
+        )
+        importacion.importar_pedidos(BytesIO(contenido.encode()), 'csv', lote=7)
+        transiciones.transicionar(Pedido.objects.filter(pk__in=Pedido.objects.order_by('pk')[:10].values('pk')),
+                                  'estado_pedido', 'aprobado')
+
+        cantidades = dict(PedidoResumenDiario.objects.values_list('estado_pedido').annotate(total=Sum('cantidad')))
+        self.assertEqual(cantidades, {'solicitado': 20, 'aprobado': 10})
+        self.assertIgualAReconstruido()
+
+    def test_eliminar_producto_pasa_sus_pedidos_a_sin_producto(self):
+        crear_pedido(producto_referencia=self.producto)
+        self.producto.delete()
+        self.assertEqual(self.filas()[0][3], None)
+        self.assertIgualAReconstruido()
+
+    def test_filas_creadas_a_la_vez_se_suman_en_una(self):
+        pedido = crear_pedido()
+        valores = Pedido.objects.filter(pk=pedido.pk).values(
+            'fecha_creacion', 'estado_pedido', 'plataforma', 'producto_referencia_id', 'presupuesto_aprobado'
+        ).get()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PedidoResumenDiario.objects.create(
+                fecha=resumen.clave(valores)[0], estado_pedido='solicitado', plataforma='sitio_web', cantidad=1,
+            )
+
+        # Otro pedido crea la fila justo después de que este no la encontrara
+        sumar = resumen._sumar
+        intentos = []
+
+        def sumar_tarde(fila, cantidad, total):
+            intentos.append(cantidad)
+            return 0 if len(intentos) == 1 else sumar(fila, cantidad, total)
+
+        diferencias = resumen.Diferencias()
+        diferencias.sumar(valores)
+        with mock.patch.object(resumen, '_sumar', sumar_tarde):
+            diferencias.aplicar()
+
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(list(PedidoResumenDiario.objects.values_list('cantidad', flat=True)), [2])
+
+    def test_reporte_lee_el_resumen_con_fechas_inclusive(self):
+        usuario = User.objects.create_user('vendedor', password='clave')
+        self.client.force_login(usuario)
+        pedido = crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado', presupuesto_aprobado=20000)
+        crear_pedido(producto_referencia=self.producto)
+        hoy = timezone.localdate(pedido.fecha_creacion).isoformat()
+
+        # Sesión, usuario, los agregados condicionales y el top de productos
+        with self.assertNumQueries(4):
+            respuesta = self.client.get(reverse('tienda:reporte'), {'fecha_inicio': hoy, 'fecha_fin': hoy})
+
+        self.assertEqual(respuesta.context['total_pedidos_filtrados'], 2)
+        self.assertEqual(respuesta.context['total_valor_aprobado'], 20000)
+        self.assertEqual(list(respuesta.context['productos_solicitados']),
+                         [{'producto': self.producto.pk, 'producto_referencia__nombre': 'Producto', 'conteo': 2}])
+
+
+class ReportesTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = crear_producto(Categoria.objects.create(nombre='Poleras'))
+        crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado', presupuesto_aprobado=20000)
+        crear_pedido(producto_referencia=self.producto, plataforma='instagram')
+        crear_pedido(plataforma='instagram', estado_pedido='cancelado')
+
+    def test_cifras_en_dos_consultas(self):
+        with self.assertNumQueries(2):
+            reporte = reportes.calcular_reporte(PedidoResumenDiario.objects.all())
+
+        self.assertEqual(reporte['total_pedidos'], 3)
+        self.assertEqual(reporte['total_aprobado'], 20000)
+        self.assertEqual(reporte['por_plataforma'], [
+            {'plataforma': 'instagram', 'conteo': 2}, {'plataforma': 'sitio_web', 'conteo': 1},
+        ])
+        self.assertEqual(len(reporte['por_estado']), 3)
+        self.assertEqual(reporte['productos'][0]['conteo'], 2)
+
+    def test_graficos_respetan_el_filtro(self):
+        self.client.force_login(User.objects.create_user('vendedor', password='clave'))
+        respuesta = self.client.get(reverse('tienda:reporte'), {'plataforma': 'instagram'})
+
+        self.assertEqual(respuesta.context['pedidos_por_plataforma'], [{'plataforma': 'instagram', 'conteo': 2}])
+        self.assertEqual(
+            sorted(fila['estado_pedido'] for fila in respuesta.context['pedidos_por_estado']),
+            ['cancelado', 'solicitado'],
+        )
+
+    def test_api_del_reporte(self):
+        url = reverse('api-reporte-pedidos')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('vendedor', password='clave'))
+        self.assertEqual(self.client.get(url, {'estado': 'inexistente'}).status_code, 400)
+        datos = self.client.get(url, {'estado': ['aprobado', 'cancelado']}).json()
+        self.assertEqual(datos['total_pedidos'], 2)
+        self.assertEqual(datos['total_aprobado'], 20000)
+
+
+class ExportacionPedidosTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        producto = crear_producto(Categoria.objects.create(nombre='Poleras'), nombre='Polera, "básica"')
+        crear_pedido(producto_referencia=producto, plataforma='instagram')
+        crear_pedido(nombre_cliente='Otra', estado_pedido='aprobado')
+        crear_pedido(nombre_cliente='Cancelada', estado_pedido='cancelado')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        self.url = reverse('api-exportar-pedidos')
+
+    def leer_csv(self, contenido):
+        return list(csv.reader(StringIO(contenido.decode('utf-8-sig'))))
+
+    def test_csv_filtrado_en_streaming(self):
+        respuesta = self.client.get(self.url, {'estado_pedido': 'solicitado,aprobado'})
+        self.assertTrue(respuesta.streaming)
+        self.assertIn('attachment; filename="pedidos.csv"', respuesta['Content-Disposition'])
+
+        filas = self.leer_csv(b''.join(respuesta.streaming_content))
+        self.assertEqual(filas[0][:3], ['ID', 'Fecha de creación', 'Cliente'])
+        self.assertEqual([fila[2] for fila in filas[1:]], ['Cliente', 'Otra'])
+        self.assertEqual(filas[1][7], 'Polera, "básica"')
+
+        filas = self.leer_csv(b''.join(self.client.get(self.url, {'plataforma': 'instagram'}).streaming_content))
+        self.assertEqual(len(filas), 2)
+
+    def test_gzip_y_xlsx(self):
+        respuesta = self.client.get(self.url, {'gzip': '1', 'estado': 'cancelado'})
+        self.assertEqual(respuesta['Content-Type'], 'application/gzip')
+        filas = self.leer_csv(gzip.decompress(b''.join(respuesta.streaming_content)))
+        self.assertEqual([fila[2] for fila in filas[1:]], ['Cancelada'])
+
+        respuesta = self.client.get(self.url, {'formato': 'xlsx'})
+        libro = zipfile.ZipFile(BytesIO(b''.join(respuesta.streaming_content)))
+        self.assertIn('xl/worksheets/sheet1.xml', libro.namelist())
+
+    def test_csv_no_exporta_formulas(self):
+        crear_pedido(nombre_cliente='=HYPERLINK("http://x")', descripcion_diseno='@SUMA(1)', estado_pedido='finalizado')
+        filas = self.leer_csv(b''.join(self.client.get(self.url, {'estado_pedido': 'finalizado'}).streaming_content))
+        self.assertEqual(filas[1][2], '\'=HYPERLINK("http://x")')
+        self.assertEqual(filas[1][8], "'@SUMA(1)")
+        self.assertEqual(filas[1][12], '7000.00')
+
+        # Teléfonos y números negativos no se tocan
+        self.assertEqual(
+            [exportacion.neutralizar_formula(valor) for valor in ('+56 9 1234 5678', '-15', '(2) 2345-6789', '-1+cmd|x', '+A1')],
+            ['+56 9 1234 5678', '-15', '(2) 2345-6789', "'-1+cmd|x", "'+A1"]
+        )
+
+    def test_xlsx_sigue_en_otra_hoja_al_llegar_al_limite(self):
+        with mock.patch.object(exportacion, 'FILAS_POR_HOJA', 2):
+            respuesta = self.client.get(self.url, {'formato': 'xlsx'})
+            libro = zipfile.ZipFile(BytesIO(b''.join(respuesta.streaming_content)))
+        hojas = sorted(nombre for nombre in libro.namelist() if nombre.startswith('xl/worksheets/sheet'))
+        self.assertEqual(hojas, ['xl/worksheets/sheet1.xml', 'xl/worksheets/sheet2.xml'])
+        self.assertEqual(libro.read('xl/worksheets/sheet2.xml').count(b'<row '), 2)
+
+    @override_settings(XLSX_MAXIMO_FILAS=2)
+    def test_xlsx_limitado_a_maximo_filas(self):
+        respuesta = self.client.get(self.url, {'formato': 'xlsx'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('formato=csv', respuesta.json()['formato'][0])
+
+        self.assertEqual(self.client.get(self.url, {'formato': 'xlsx', 'estado': 'cancelado'}).status_code, 200)
+        self.assertEqual(len(self.leer_csv(b''.join(self.client.get(self.url).streaming_content))), 4)
+
+    def test_parametros_invalidos_y_permisos(self):
+        self.assertEqual(self.client.get(self.url, {'formato': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'estado': 'inexistente'}).status_code, 400)
+        with mock.patch.dict('sys.modules', {'xlsxwriter': None}):
+            self.assertEqual(self.client.get(self.url, {'formato': 'xlsx'}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class MetricasPedidosTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('vendedor', password='clave'))
+        self.url = reverse('api-metricas-pedidos')
+
+    def crear_en(self, fecha, **kwargs):
+        pedido = crear_pedido(**kwargs)
+        momento = timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(12)))
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=momento)
+        resumen.reconstruir()
+        return pedido
+
+    def test_meses_por_plataforma_cerrados_en_cache(self):
+        self.crear_en(datetime.date(2024, 1, 10), plataforma='instagram')
+        self.crear_en(datetime.date(2024, 1, 31), plataforma='instagram', estado_pedido='aprobado',
+                      presupuesto_aprobado=5000)
+        self.crear_en(datetime.date(2024, 3, 2), plataforma='whatsapp')
+
+        with self.assertNumQueries(3):  # sesión, usuario y la consulta agrupada
+            respuesta = self.client.get(self.url, {
+                'periodo': 'mes', 'por': 'plataforma', 'fecha_inicio': '2024-01-15', 'fecha_fin': '2024-03-10',
+            })
+        datos = respuesta.json()
+        self.assertEqual((datos['desde'], datos['hasta']), ('2024-01-01', '2024-03-31'))
+        self.assertEqual(datos['resultados'], [
+            {'inicio': '2024-01-01', 'plataforma': 'instagram', 'cantidad': 2, 'total_aprobado': 5000.0, 'cerrado': True},
+            {'inicio': '2024-03-01', 'plataforma': 'whatsapp', 'cantidad': 1, 'total_aprobado': 0.0, 'cerrado': True},
+        ])
+        self.assertIn('max-age=86400', respuesta['Cache-Control'])
+
+    def test_periodo_en_curso_y_semanas(self):
+        hoy = timezone.localdate()
+        self.crear_en(hoy)
+        self.crear_en(hoy - datetime.timedelta(days=hoy.weekday()))
+
+        respuesta = self.client.get(self.url, {'periodo': 'semana'})
+        resultados = respuesta.json()['resultados']
+        self.assertEqual(resultados, [{
+            'inicio': (hoy - datetime.timedelta(days=hoy.weekday())).isoformat(),
+            'cantidad': 2, 'total_aprobado': 0.0, 'cerrado': False,
+        }])
+        self.assertIn('max-age=60', respuesta['Cache-Control'])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'periodo': 'hora'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'por': 'email'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'fecha_inicio': 'ayer'}).status_code, 400)
+
+
+class FiltroPedidosApiTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('api-filtro-pedidos')
+        self.hoy = timezone.localdate()
+        self.pedidos = {}
+        for nombre, dias, plataforma, estado in [
+            ('antes', 3, 'facebook', 'solicitado'),
+            ('inicio', 2, 'instagram', 'aprobado'),
+            ('fin', 1, 'whatsapp', 'cancelado'),
+            ('hoy', 0, 'instagram', 'solicitado'),
+        ]:
+            pedido = crear_pedido(nombre_cliente=nombre, plataforma=plataforma, estado_pedido=estado)
+            # Último minuto del día para comprobar que el día final entra completo
+            momento = datetime.datetime.combine(self.hoy - datetime.timedelta(days=dias), datetime.time(23, 59))
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=timezone.make_aware(momento))
+            self.pedidos[nombre] = pedido
+
+    def nombres(self, **params):
+        respuesta = self.client.get(self.url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['nombre_cliente'] for fila in respuesta.json()['results']]
+
+    def test_rango_de_fechas_incluye_el_dia_final(self):
+        desde = (self.hoy - datetime.timedelta(days=2)).isoformat()
+        hasta = (self.hoy - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.nombres(fecha_inicio=desde, fecha_fin=hasta), ['fin', 'inicio'])
+        self.assertEqual(self.nombres(fecha_fin=hasta), ['fin', 'inicio', 'antes'])
+
+    def test_rango_compara_la_columna_sin_funciones(self):
+        with self.assertNumQueries(1) as contexto:
+            self.client.get(self.url, {'fecha_inicio': self.hoy.isoformat(), 'fecha_fin': self.hoy.isoformat()})
+        sql = contexto.captured_queries[0]['sql']
+        self.assertIn('"tienda_pedido"."fecha_creacion" >=', sql)
+        self.assertIn('"tienda_pedido"."fecha_creacion" <', sql)
+        self.assertNotIn('cast_date', sql.lower())
+
+    def test_filtros_de_varios_valores(self):
+        self.assertEqual(self.nombres(estado_pedido='aprobado,cancelado'), ['fin', 'inicio'])
+        self.assertEqual(self.nombres(plataforma=['facebook', 'whatsapp']), ['fin', 'antes'])
+        self.assertEqual(self.nombres(plataforma='instagram', estado_pedido='solicitado'), ['hoy'])
+        self.assertEqual(self.client.get(self.url, {'estado_pedido': 'perdido'}).status_code, 400)
+
+    def test_pedidos_de_un_cliente(self):
+        Pedido.objects.filter(pk__in=[self.pedidos['antes'].pk, self.pedidos['hoy'].pk]).update(email='ana@example.com')
+        self.assertEqual(self.nombres(email='ana@example.com'), ['hoy', 'antes'])
+        self.assertEqual(self.nombres(email='nadie@example.com'), [])
+
+    def test_proyeccion_de_campos(self):
+        with self.assertNumQueries(1) as contexto:
+            respuesta = self.client.get(self.url, {'fields': 'id,estado_pedido', 'limite': 2})
+        datos = respuesta.json()
+        self.assertEqual(datos['results'][0], {'id': self.pedidos['hoy'].pk, 'estado_pedido': 'solicitado'})
+        self.assertEqual(len(datos['results']), 2)
+        self.assertNotIn('descripcion_diseno', contexto.captured_queries[0]['sql'])
+
+        siguiente = self.client.get(datos['next']).json()
+        self.assertEqual([fila['id'] for fila in siguiente['results']],
+                         [self.pedidos['inicio'].pk, self.pedidos['antes'].pk])
+        self.assertEqual(self.client.get(self.url, {'fields': 'id,clave'}).status_code, 400)
+
+
+class SerializacionRapidaTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        producto = crear_producto(Categoria.objects.create(nombre='Poleras'))
+        crear_pedido(producto_referencia=producto, presupuesto_aprobado='15000.5',
+                     descripcion_diseno='Diseño «único» \u2028 con emoji 🎨', fecha_requerida=datetime.date(2026, 1, 5))
+        crear_pedido(nombre_cliente='Sin producto', plataforma='whatsapp', estado_pago='parcial')
+        Insumo.objects.create(nombre='Hilo', tipo='Bordado', cantidad_disponible=0, unidad='metros', color='Rojo')
+
+    def assertMismosBytes(self, serializer_class, queryset):
+        esperado = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        serializador = SerializadorRapido(serializer_class())
+        filas = serializador.serializar(serializador.consulta(queryset))
+        self.assertEqual(JSONRenderer().render(filas), esperado)
+        self.assertEqual(RenderizadorJSONRapido().render(filas), esperado)
+
+    def test_mismos_bytes_que_el_model_serializer(self):
+        self.assertMismosBytes(PedidoSerializer, Pedido.objects.order_by('id'))
+        self.assertMismosBytes(InsumoSerializer, Insumo.objects.order_by('id'))
+        with timezone.override('America/Santiago'):
+            self.assertMismosBytes(PedidoSerializer, Pedido.objects.order_by('id'))
+
+    def test_endpoints_responden_igual(self):
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(reverse('insumo-list'))
+        self.assertEqual(
+            respuesta.content, JSONRenderer().render(InsumoSerializer(Insumo.objects.all(), many=True).data)
+        )
+
+        datos = self.client.get(reverse('api-filtro-pedidos')).json()['results']
+        esperado = PedidoSerializer(Pedido.objects.order_by('-fecha_creacion', '-id'), many=True).data
+        self.assertEqual(datos, json.loads(JSONRenderer().render(esperado)))
+
+    def test_campos_no_soportados(self):
+        class ConCalculado(PedidoSerializer):
+            resumen = serializers.SerializerMethodField()
+
+        with self.assertRaises(ValueError):
+            SerializadorRapido(ConCalculado())
+
+
+class AjusteStockTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(self.admin)
+        self.url = reverse('insumo-ajustar')
+
+    def crear_insumos(self, cantidad, stock=10):
+        Insumo.objects.bulk_create([
+            Insumo(nombre=f'Insumo {i}', tipo='Tela', cantidad_disponible=stock) for i in range(cantidad)
+        ])
+        return list(Insumo.objects.order_by('id'))
+
+    def test_reposicion_masiva_en_pocas_sentencias(self):
+        insumos = self.crear_insumos(200)
+        ajustes = [{'insumo': insumo.pk, 'cantidad': 5} for insumo in insumos]
+        ajustes.append({'insumo': insumos[0].pk, 'cantidad': -3})
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(self.url, {'ajustes': ajustes, 'motivo': 'reposicion'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        # Lectura, dos UPDATE (grupos de 150) y los INSERT del libro, más sesión y savepoints
+        escrituras = [q for q in consultas.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.assertLessEqual(len(escrituras), 5)
+
+        self.assertEqual(Insumo.objects.get(pk=insumos[0].pk).cantidad_disponible, 12)
+        self.assertEqual(Insumo.objects.filter(cantidad_disponible=15, version=1).count(), 199)
+        movimiento = MovimientoStock.objects.get(insumo=insumos[0])
+        self.assertEqual((movimiento.cantidad, movimiento.saldo, movimiento.motivo, movimiento.usuario),
+                         (2, 12, 'reposicion', self.admin))
+
+    def test_rechaza_todo_si_falta_stock_o_cambio_la_version(self):
+        a, b = self.crear_insumos(2)
+        respuesta = self.client.post(self.url, {'ajustes': [
+            {'insumo': a.pk, 'cantidad': 5}, {'insumo': b.pk, 'cantidad': -11},
+        ]}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn(str(b.pk), respuesta.json()['errores'])
+
+        stock.ajustar_stock([{'insumo': a.pk, 'cantidad': 1}])
+        respuesta = self.client.post(self.url, {'ajustes': [
+            {'insumo': a.pk, 'cantidad': 5, 'version': 0}, {'insumo': b.pk, 'cantidad': 1},
+        ]}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 409)
+
+        self.assertEqual(list(Insumo.objects.order_by('id').values_list('cantidad_disponible', 'version')),
+                         [(11, 1), (10, 0)])
+        self.assertEqual(MovimientoStock.objects.count(), 1)
+
+    def test_api_de_insumos_no_sobrescribe_el_stock(self):
+        respuesta = self.client.post(reverse('insumo-list'), {'nombre': 'Tela', 'tipo': 'Tela', 'cantidad_disponible': 10, 'version': 7})
+        self.assertEqual(respuesta.status_code, 201)
+        insumo = Insumo.objects.get()
+        self.assertEqual(insumo.version, 0)
+        self.assertEqual(list(insumo.movimientos.values_list('motivo', 'cantidad', 'saldo')), [('inicial', 10, 10)])
+
+        url = reverse('insumo-detail', args=[insumo.pk])
+        respuesta = self.client.patch(url, {'cantidad_disponible': 99, 'color': 'Rojo'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['cantidad_disponible'], 10)
+        insumo.refresh_from_db()
+        self.assertEqual((insumo.cantidad_disponible, insumo.version, insumo.color), (10, 0, 'Rojo'))
+        self.assertEqual(insumo.movimientos.count(), 1)
+
+    def test_admin_aplica_la_edicion_como_variacion(self):
+        insumo = self.crear_insumos(1)[0]
+        # Otro usuario repone 10 mientras el admin tiene la lista abierta (con 10)
+        stock.ajustar_stock([{'insumo': insumo.pk, 'cantidad': 10}])
+
+        self.client.post(reverse('admin:tienda_insumo_changelist'), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000,
+            'form-0-id': insumo.pk, 'form-0-marca': '',
+            'form-0-cantidad_disponible': 15, 'initial-form-0-cantidad_disponible': 10,
+            '_save': 'Guardar',
+        })
+        self.assertEqual(Insumo.objects.get(pk=insumo.pk).cantidad_disponible, 25)
+        self.assertEqual(list(insumo.movimientos.values_list('cantidad', 'saldo')), [(10, 20), (5, 25)])
+
+
+class ReservaInsumosTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.producto = crear_producto(Categoria.objects.create(nombre='Remeras'))
+        self.tela = Insumo.objects.create(nombre='Tela', tipo='Tela', cantidad_disponible=5)
+        self.tinta = Insumo.objects.create(nombre='Tinta', tipo='Tinta', cantidad_disponible=20)
+        InsumoProducto.objects.create(producto=self.producto, insumo=self.tela, cantidad=2)
+        InsumoProducto.objects.create(producto=self.producto, insumo=self.tinta, cantidad=1)
+
+    def stock(self):
+        return list(Insumo.objects.order_by('id').values_list('cantidad_disponible', flat=True))
+
+    def test_transicion_reserva_hasta_agotar_el_stock(self):
+        pedidos = [crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado') for _ in range(3)]
+        resultado = transiciones.transicionar(Pedido.objects.all(), 'estado_pedido', 'en_proceso')
+
+        self.assertEqual(resultado.actualizados, [pedidos[0].pk, pedidos[1].pk])
+        self.assertEqual(resultado.sin_stock, {pedidos[2].pk: {self.tela.pk: 1}})
+        self.assertEqual(Pedido.objects.get(pk=pedidos[2].pk).estado_pedido, 'aprobado')
+        self.assertEqual(self.stock(), [1, 18])
+        self.assertEqual(MovimientoStock.objects.filter(motivo='reserva', pedido=pedidos[0]).count(), 2)
+
+        # Cancelar desde en_proceso devuelve lo reservado
+        transiciones.transicionar(Pedido.objects.filter(pk=pedidos[0].pk), 'estado_pedido', 'cancelado')
+        self.assertEqual(self.stock(), [3, 19])
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(motivo='liberacion').values_list('insumo_id', 'cantidad', 'saldo')),
+            [(self.tela.pk, 2, 3), (self.tinta.pk, 1, 19)]
+        )
+
+    def test_guardar_de_a_uno_reserva_y_devuelve(self):
+        pedido = crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado')
+        pedido.estado_pedido = 'en_proceso'
+        pedido.save()
+        self.assertEqual(self.stock(), [3, 19])
+
+        # Salir de en_proceso (por ejemplo desde el shell) también devuelve
+        pedido.estado_pedido = 'aprobado'
+        pedido.save()
+        self.assertEqual(self.stock(), [5, 20])
+
+        Insumo.objects.filter(pk=self.tela.pk).update(cantidad_disponible=1)
+        pedido.estado_pedido = 'en_proceso'
+        with self.assertRaises(stock.StockInsuficiente) as error:
+            pedido.save()
+        self.assertEqual(error.exception.faltantes, {self.tela.pk: 1})
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).estado_pedido, 'aprobado')
+
+    def test_copias_desactualizadas_usan_el_estado_de_la_bd(self):
+        self.tela.cantidad_disponible = 10
+        self.tela.save()
+        pedido = crear_pedido(producto_referencia=self.producto, estado_pedido='aprobado')
+        primera, segunda = Pedido.objects.get(pk=pedido.pk), Pedido.objects.get(pk=pedido.pk)
+
+        primera.estado_pedido = 'en_proceso'
+        primera.save()
+        segunda.estado_pedido = 'en_proceso'
+        segunda.save()
+        self.assertEqual(self.stock(), [8, 19])
+        self.assertEqual(MovimientoStock.objects.filter(motivo='reserva').count(), 2)
+        self.assertEqual(pedido.eventos.count(), 1)
+
+        # Una copia cargada en proceso no salta la reserva si otro ya lo canceló
+        tercera = Pedido.objects.get(pk=pedido.pk)
+        primera.estado_pedido = 'cancelado'
+        primera.save()
+        self.assertEqual(self.stock(), [10, 20])
+        tercera.estado_pedido = 'realizado'
+        tercera.save()
+        self.assertEqual(self.stock(), [8, 19])
+
+    def test_bajo_stock_ordenado_por_escasez(self):
+        Insumo.objects.create(nombre='Hilo', tipo='Hilo', cantidad_disponible=0)
+        respuesta = self.client.get(reverse('insumo-bajo-stock'))
+        self.assertEqual([insumo['nombre'] for insumo in respuesta.json()], ['Hilo', 'Tela'])
+
+        with CaptureQueriesContext(connection) as consultas:
+            list(stock.bajo_stock(Insumo.objects.all()))
+        self.assertIn('"cantidad_disponible" < 10', consultas.captured_queries[0]['sql'])
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    def test_aprobaciones_en_paralelo_no_sobrevenden(self):
+        producto = crear_producto(Categoria.objects.create(nombre='Tazas'))
+        insumo = Insumo.objects.create(nombre='Taza blanca', tipo='Cerámica', cantidad_disponible=10)
+        InsumoProducto.objects.create(producto=producto, insumo=insumo, cantidad=1)
+        pedidos = [crear_pedido(producto_referencia=producto, estado_pedido='aprobado') for _ in range(25)]
+
+        inicio = threading.Barrier(len(pedidos))
+        errores = []
+
+        def aprobar(pedido_id):
+            try:
+                inicio.wait()
+                transiciones.transicionar(Pedido.objects.filter(pk=pedido_id), 'estado_pedido', 'en_proceso')
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=aprobar, args=(pedido.pk,)) for pedido in pedidos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(Insumo.objects.get(pk=insumo.pk).cantidad_disponible, 0)
+        self.assertEqual(Pedido.objects.filter(estado_pedido='en_proceso').count(), 10)
+        self.assertEqual(MovimientoStock.objects.filter(motivo='reserva').count(), 10)
+        self.assertEqual(list(MovimientoStock.objects.order_by('saldo').values_list('saldo', flat=True)), list(range(10)))
+
+
+class EnvioIdempotenteTests(TiendaTestCase):
+    datos = {'nombre_cliente': 'Ana', 'email': 'ana@example.com', 'descripcion_diseno': 'Logo'}
+
+    def inserciones_de_pedidos(self, consultas):
+        return [q for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "tienda_pedido"')]
+
+    def test_formulario_reenviado_no_duplica_el_pedido(self):
+        url = reverse('tienda:solicitar_pedido')
+        clave = self.client.get(url).context['form']['clave_envio'].value()
+        self.assertTrue(clave)
+
+        # Un envío inválido libera la clave para corregir y reenviar
+        respuesta = self.client.post(url, {'clave_envio': clave, 'nombre_cliente': 'Ana'})
+        self.assertEqual(respuesta.status_code, 200)
+
+        respuesta = self.client.post(url, {**self.datos, 'clave_envio': clave})
+        self.assertRedirects(respuesta, reverse('tienda:pedido_exitoso'))
+        pedido = Pedido.objects.get()
+
+        # El reintento (desde otra sesión) vuelve al mismo pedido sin escribir
+        self.client.logout()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(url, {**self.datos, 'clave_envio': clave})
+        self.assertRedirects(respuesta, reverse('tienda:pedido_exitoso'))
+        self.assertEqual(self.inserciones_de_pedidos(consultas), [])
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(self.client.session['token_seguimiento'], pedido.token_seguimiento)
+
+    def test_api_repite_la_respuesta_original(self):
+        url = reverse('pedido-list')
+        primera = self.client.post(url, self.datos, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(primera.status_code, 201)
+
+        with CaptureQueriesContext(connection) as consultas:
+            repetida = self.client.post(url, self.datos, content_type='application/json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(self.inserciones_de_pedidos(consultas), [])
+        self.assertEqual(Pedido.objects.get().token_seguimiento, primera.json()['token_seguimiento'])
+
+        otra = self.client.post(url, {**self.datos, 'nombre_cliente': 'Otra'}, content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(otra.status_code, 422)
+
+        idempotencia.iniciar('api', 'en-curso', idempotencia.huella(self.datos))
+        respuesta = self.client.post(url, self.datos, content_type='application/json', HTTP_IDEMPOTENCY_KEY='en-curso')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_redireccion_sin_pedido_nuevo_no_guarda_el_anterior(self):
+        @idempotencia.formulario_idempotente
+        def vista(request):
+            return redirect('tienda:pedido_exitoso')
+
+        # La sesión tiene un pedido de un envío anterior; este no crea ninguno
+        request = RequestFactory().post('/', {'clave_envio': 'clave-1'})
+        request.session = {'ultimo_pedido_id': 1, 'token_seguimiento': 'anterior'}
+        self.assertEqual(vista(request).status_code, 302)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+    def test_claves_en_la_base_y_purga_de_vencidas(self):
+        idempotencia.iniciar('api', 'k1')
+        idempotencia.completar('api', 'k1', {'pedido_id': 1})
+        # Vaciar el caché (o llegar a otro worker) no olvida la clave
+        cache.clear()
+        self.assertEqual(idempotencia.iniciar('api', 'k1'), {'pedido_id': 1})
+
+        idempotencia.iniciar('api', 'k2')
+        with self.assertRaises(idempotencia.EnCurso):
+            idempotencia.iniciar('api', 'k2')
+
+        # Un envío lento sigue en curso minutos después: el reintento no lo pisa
+        ClaveIdempotencia.objects.filter(registro__isnull=True).update(expira=F('expira') - datetime.timedelta(minutes=5))
+        with self.assertRaises(idempotencia.EnCurso):
+            idempotencia.iniciar('api', 'k2')
+
+        # Pasado el timeout de las peticiones la marca vence y la clave se puede volver a usar
+        ClaveIdempotencia.objects.filter(registro__isnull=True).update(expira=timezone.now())
+        self.assertIsNone(idempotencia.iniciar('api', 'k2'))
+
+        ClaveIdempotencia.objects.update(expira=timezone.now())
+        call_command('purgar_idempotencia', stdout=StringIO())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+
+class InstrumentacionTests(TiendaTestCase):
+    def valor(self, nombre, **etiquetas):
+        return instrumentacion.REGISTRY.get_sample_value(nombre, etiquetas) or 0
+
+    def test_mide_latencia_consultas_y_plantillas_por_vista(self):
+        crear_producto(Categoria.objects.create(nombre='Ropa'))
+        peticiones = self.valor('tienda_peticion_segundos_count', vista='tienda:catalogo', metodo='GET')
+        consultas = self.valor('tienda_peticion_consultas_sum', vista='tienda:catalogo')
+        renders = self.valor('tienda_plantilla_segundos_count', plantilla='tienda/catalogo.html')
+
+        self.client.get(reverse('tienda:catalogo'))
+
+        self.assertEqual(self.valor('tienda_peticion_segundos_count', vista='tienda:catalogo', metodo='GET'), peticiones + 1)
+        self.assertGreater(self.valor('tienda_peticion_consultas_sum', vista='tienda:catalogo'), consultas)
+        # Solo la plantilla de más afuera (no base.html ni los include)
+        self.assertEqual(self.valor('tienda_plantilla_segundos_count', plantilla='tienda/catalogo.html'), renders + 1)
+
+    def test_detecta_la_misma_consulta_repetida(self):
+        productos = [crear_producto(Categoria.objects.create(nombre=f'C{i}')) for i in range(12)]
+
+        def vista_n_mas_uno(request):
+            for producto in Producto.objects.filter(pk__in=[p.pk for p in productos]):
+                producto.categoria.nombre
+            return HttpResponse()
+
+        antes = self.valor('tienda_n_mas_uno_total', vista=instrumentacion.SIN_RUTA)
+        with self.assertLogs('tienda.instrumentacion', 'WARNING') as logs:
+            instrumentacion.MetricasMiddleware(vista_n_mas_uno)(RequestFactory().get('/x/'))
+        self.assertEqual(self.valor('tienda_n_mas_uno_total', vista=instrumentacion.SIN_RUTA), antes + 1)
+        self.assertIn('12 veces', logs.output[0])
+
+        self.assertEqual(
+            instrumentacion.forma('SELECT 1 FROM t WHERE id IN (%s, %s, %s)'),
+            instrumentacion.forma('SELECT 1 FROM t WHERE id IN (%s)'),
+        )
+
+    def test_endpoint_metrics_protegido(self):
+        url = reverse('metricas-prometheus')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICAS_TOKEN='secreto'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+            respuesta = self.client.get(url, HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn(b'tienda_peticion_segundos_bucket', respuesta.content)
+
+
+class PerfiladoTests(TiendaTestCase):
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajuste = override_settings(PERFILADO_DIR=directorio, PERFILADO_MUESTREO=False, PERFILADO_MAXIMO=2)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.url = reverse('tienda:catalogo')
+
+    def test_solo_staff_o_cabecera_firmada(self):
+        self.assertNotIn('X-Perfil', self.client.get(self.url, {'perfilar': 1}))
+        self.assertNotIn('X-Perfil', self.client.get(self.url, HTTP_X_PERFILAR='inventada'))
+        self.assertEqual(perfilado.listar(), [])
+
+        respuesta = self.client.get(self.url, HTTP_X_PERFILAR=perfilado.firmar())
+        self.assertEqual(respuesta.status_code, 200)
+        nombre = respuesta['X-Perfil']
+        estadisticas = pstats.Stats(os.path.join(perfilado.directorio(), nombre))
+        self.assertTrue(any(archivo.endswith('cache_paginas.py') for archivo, _, _ in estadisticas.stats))
+
+    def test_listado_en_el_admin(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        for _ in range(3):
+            self.assertIn('X-Perfil', self.client.get(self.url, {'perfilar': 1}))
+
+        # Se conservan los PERFILADO_MAXIMO más recientes
+        self.assertEqual(len(perfilado.listar()), 2)
+        pagina = self.client.get(reverse('perfiles'))
+        self.assertContains(pagina, '<td>tienda-catalogo</td>', count=2)
+        self.assertEqual(self.client.get(reverse('descargar-perfil', args=[perfilado.listar()[0]['nombre']])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('descargar-perfil', args=['..%2Fsettings.py'])).status_code, 404)
+
+
+class BenchTiendaTests(TiendaTestCase):
+    def test_genera_la_tienda_y_mide_todos_los_escenarios(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generar_tienda_falsa', pedidos=300, productos=40, categorias=3, insumos=10, lote=100, stdout=StringIO())
+        self.assertEqual(Pedido.objects.count(), 300)
+        self.assertEqual(Producto.objects.count(), 40)
+        self.assertTrue(ImagenReferencia.objects.exists())
+        self.assertTrue(InsumoProducto.objects.exists())
+        self.assertEqual(PedidoResumenDiario.objects.aggregate(total=Sum('cantidad'))['total'], 300)
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        salida = os.path.join(directorio, 'bench.json')
+        # Las peticiones se confirman una a una: sus tareas on_commit corren
+        with self.captureOnCommitCallbacks(execute=True) as tareas:
+            call_command('bench_tienda', repeticiones=3, calentamiento=0, salida=salida, stdout=StringIO())
+        self.assertTrue(tareas)
+
+        with open(salida) as archivo:
+            informe = json.load(archivo)
+        self.assertEqual(informe['volumen']['pedidos'], 300)
+        self.assertIn('catalogo_busqueda', informe['escenarios'])
+        for nombre, datos in informe['escenarios'].items():
+            self.assertLessEqual(datos['p50_ms'], datos['p95_ms'], nombre)
+            self.assertTrue(all(estado < 400 for estado in datos['estados_http']), nombre)
+        # Los pedidos enviados durante la medición y el usuario de prueba se borran
+        self.assertEqual(Pedido.objects.count(), 300)
+        self.assertEqual(PedidoResumenDiario.objects.aggregate(total=Sum('cantidad'))['total'], 300)
+        self.assertFalse(User.objects.filter(username='bench_tienda').exists())
+
+    def test_bench_indices_compara_y_deja_los_indices(self):
+        for i in range(30):
+            crear_pedido(email=f'cliente{i % 3}@example.com', estado_pedido=['solicitado', 'finalizado'][i % 2])
+        salida = StringIO()
+        call_command('bench_indices', repeticiones=1, stdout=salida)
+        self.assertIn('api_cliente', salida.getvalue())
+        self.assertIn('pedido_email_idx', salida.getvalue())
+
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, Pedido._meta.db_table)
+        self.assertTrue({indice.name for indice in Pedido._meta.indexes} <= set(indices))
+
+
+# ============================================
+# CONSULTAS POR VISTA
+# ============================================
+
+# Consultas SQL esperadas por petición (página en frío: sin caché de páginas
+# ni instantánea del catálogo). Los datos de ConsultasPorVistaTests tienen
+# varias filas en cada relación, así que un N+1 cambia la cuenta. Si un
+# cambio agrega o quita consultas a propósito, se actualiza el número aquí.
+CONSULTAS_POR_VISTA = {
+    # Tienda (tienda/urls.py)
+    'index': 2,
+    'catalogo': 2,
+    'catalogo_categoria': 2,
+    'catalogo_busqueda': 3,
+    'detalle_producto': 1,
+    'solicitar_pedido': 2,
+    'pedido_exitoso': 3,
+    'seguimiento_pedido': 1,
+    'reporte': 4,
+    # API
+    'api_insumos': 3,
+    'api_insumo': 3,
+    'api_insumos_bajo_stock': 3,
+    'api_pedido': 3,
+    'api_filtro_pedidos': 3,
+    'api_pedidos_cliente': 3,
+    'api_exportar_pedidos': 3,
+    'api_reporte_pedidos': 4,
+    'api_metricas_pedidos': 3,
+    'perfiles': 2,
+    # Admin
+    'admin_categoria': 5,
+    'admin_producto': 6,
+    'admin_insumo': 7,
+    'admin_movimientostock': 7,
+    'admin_pedido': 4,
+    'admin_pedido_finalizados': 4,
+    'admin_pedido_en_curso': 4,
+    'admin_imagenreferencia': 5,
+    'admin_producto_cambio': 6,
+    'admin_pedido_cambio': 6,
+}
+
+# Rutas sin escenario: solo aceptan POST o necesitan un archivo
+RUTAS_SIN_ESCENARIO = {'api-importar-pedidos', 'insumo-ajustar', 'pedido-list', 'api-root', 'descargar-perfil', 'media'}
+
+# Tablas que crecen con el uso: una consulta de una vista caliente no puede recorrerlas enteras
+TABLAS_GRANDES = {
+    'tienda_pedido', 'tienda_imagenreferencia', 'tienda_pedidoevento', 'tienda_movimientostock',
+    'tienda_producto', 'tienda_insumoproducto', 'tienda_pedidoresumendiario', 'tienda_insumo',
+}
+# Escenarios cuyas consultas se revisan con EXPLAIN
+VISTAS_CALIENTES = {
+    'detalle_producto', 'seguimiento_pedido', 'reporte', 'api_insumo', 'api_insumos_bajo_stock', 'api_pedido',
+    'api_filtro_pedidos', 'api_pedidos_cliente', 'api_reporte_pedidos', 'api_metricas_pedidos',
+    'admin_pedido_finalizados', 'admin_pedido_en_curso',
+}
+
+
+class _Consultas:
+    """``execute_wrapper`` que guarda el SQL con sus parámetros (para repetirlo con EXPLAIN)"""
+
+    def __init__(self):
+        self.ejecutadas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.ejecutadas.append((sql, params, many))
+        return execute(sql, params, many, context)
+
+
+def recorridos_completos(sql, params):
+    """Tablas de TABLAS_GRANDES que el plan de la consulta recorre enteras"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            detalles = [fila[-1] for fila in cursor.fetchall()]
+            patron = r'^SCAN (\w+)'
+        elif connection.vendor == 'postgresql':
+            # Sin seq scan "barato": si aun así aparece, no hay índice que sirva
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}', params)
+                detalles = [fila[0] for fila in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            patron = r'Seq Scan on (\w+)'
+        else:
+            return set()
+    tablas = {coincidencia[1] for detalle in detalles if (coincidencia := re.search(patron, detalle.strip()))}
+    return tablas & TABLAS_GRANDES
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'sin_cache': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    CACHE_PAGINAS_ALIAS='sin_cache',
+)
+class ConsultasPorVistaTests(TiendaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'clave')
+        cls.productos = []
+        for i in range(3):
+            categoria = Categoria.objects.create(nombre=f'Categoría {i}')
+            cls.productos += [
+                crear_producto(categoria, nombre=f'Polera {i}-{j}', imagen_1=f'productos/{i}-{j}.jpg')
+                for j in range(4)
+            ]
+        cls.categoria = categoria
+        insumos = [Insumo.objects.create(nombre=f'Tela {i}', tipo='Tela', cantidad_disponible=i * 4) for i in range(5)]
+        for producto in cls.productos:
+            InsumoProducto.objects.create(producto=producto, insumo=insumos[producto.pk % 5], cantidad=1)
+        stock.ajustar_stock([{'insumo': insumo.pk, 'cantidad': 100} for insumo in insumos], 'reposicion')
+
+        cls.pedidos = []
+        for i, producto in enumerate(cls.productos[:6]):
+            pedido = crear_pedido(nombre_cliente=f'Cliente {i}', producto_referencia=producto)
+            for j in range(2):
+                ImagenReferencia.objects.create(pedido=pedido, imagen=f'referencias/{i}-{j}.jpg')
+            pedido._usuario_cambio = cls.staff
+            pedido.estado_pedido = 'aprobado'
+            pedido.save()
+            pedido.estado_pedido = 'en_proceso'
+            pedido.save()
+            cls.pedidos.append(pedido)
+        cls.insumo = insumos[0]
+        resumen.reconstruir()
+
+    def setUp(self):
+        super().setUp()
+        self.anonimo = Client()
+        self.admin = Client()
+        self.admin.force_login(self.staff)
+
+    def escenarios(self):
+        """``{nombre: (cliente, url, parámetros)}``"""
+        pedido = self.pedidos[0]
+        producto = self.productos[0]
+        hace_un_mes = (timezone.localdate() - datetime.timedelta(days=30)).isoformat()
+        # Quien acaba de enviar un pedido tiene sesión; el resto de los visitantes, no
+        comprador = Client()
+        sesion = comprador.session
+        sesion.update({'ultimo_pedido_id': pedido.pk, 'token_seguimiento': pedido.token_seguimiento})
+        sesion.save()
+        return {
+            'index': (self.anonimo, reverse('tienda:index'), {}),
+            'catalogo': (self.anonimo, reverse('tienda:catalogo'), {}),
+            'catalogo_categoria': (self.anonimo, reverse('tienda:catalogo'), {'categoria': self.categoria.pk}),
+            'catalogo_busqueda': (self.anonimo, reverse('tienda:catalogo'), {'q': 'polera'}),
+            'detalle_producto': (self.anonimo, reverse('tienda:detalle_producto', args=[producto.pk]), {}),
+            'solicitar_pedido': (self.anonimo, reverse('tienda:solicitar_pedido'), {'producto': producto.pk}),
+            'pedido_exitoso': (comprador, reverse('tienda:pedido_exitoso'), {}),
+            'seguimiento_pedido': (self.anonimo, reverse('tienda:seguimiento_pedido', args=[pedido.token_seguimiento]), {}),
+            'reporte': (self.admin, reverse('tienda:reporte'), {'fecha_inicio': hace_un_mes}),
+            'api_insumos': (self.admin, reverse('insumo-list'), {}),
+            'api_insumo': (self.admin, reverse('insumo-detail', args=[self.insumo.pk]), {}),
+            'api_insumos_bajo_stock': (self.admin, reverse('insumo-bajo-stock'), {}),
+            'api_pedido': (self.admin, reverse('pedido-detail', args=[pedido.pk]), {}),
+            'api_filtro_pedidos': (self.admin, reverse('api-filtro-pedidos'), {'fecha_inicio': hace_un_mes, 'estado_pedido': 'en_proceso'}),
+            'api_pedidos_cliente': (self.admin, reverse('api-filtro-pedidos'), {'email': pedido.email}),
+            'api_exportar_pedidos': (self.admin, reverse('api-exportar-pedidos'), {}),
+            'api_reporte_pedidos': (self.admin, reverse('api-reporte-pedidos'), {'fecha_inicio': hace_un_mes}),
+            'api_metricas_pedidos': (self.admin, reverse('api-metricas-pedidos'), {'periodo': 'semana', 'fecha_inicio': hace_un_mes}),
+            'perfiles': (self.admin, reverse('perfiles'), {}),
+            'admin_categoria': (self.admin, reverse('admin:tienda_categoria_changelist'), {}),
+            'admin_producto': (self.admin, reverse('admin:tienda_producto_changelist'), {}),
+            'admin_insumo': (self.admin, reverse('admin:tienda_insumo_changelist'), {}),
+            'admin_movimientostock': (self.admin, reverse('admin:tienda_movimientostock_changelist'), {}),
+            'admin_pedido': (self.admin, reverse('admin:tienda_pedido_changelist'), {}),
+            'admin_pedido_finalizados': (self.admin, reverse('admin:tienda_pedido_changelist'), {'estado_pedido__exact': 'finalizado'}),
+            'admin_pedido_en_curso': (self.admin, reverse('admin:tienda_pedido_changelist'), {'en_curso': 'si'}),
+            'admin_imagenreferencia': (self.admin, reverse('admin:tienda_imagenreferencia_changelist'), {}),
+            'admin_producto_cambio': (self.admin, reverse('admin:tienda_producto_change', args=[producto.pk]), {}),
+            'admin_pedido_cambio': (self.admin, reverse('admin:tienda_pedido_change', args=[pedido.pk]), {}),
+        }
+
+    def medir(self, cliente, url, parametros):
+        cache.clear()
+        invalidar_catalogo()
+        consultas = _Consultas()
+        with connection.execute_wrapper(consultas):
+            respuesta = cliente.get(url, parametros)
+            if respuesta.streaming:
+                # Las respuestas por streaming consultan mientras se envían
+                b''.join(respuesta.streaming_content)
+        self.assertLess(respuesta.status_code, 400, url)
+        return consultas.ejecutadas
+
+    def test_cantidad_de_consultas_por_vista(self):
+        escenarios = self.escenarios()
+        self.assertEqual(set(escenarios), set(CONSULTAS_POR_VISTA))
+        for nombre, (cliente, url, parametros) in escenarios.items():
+            with self.subTest(nombre):
+                # Una primera petición para que la sesión y los contenttypes ya estén creados
+                self.medir(cliente, url, parametros)
+                ejecutadas = self.medir(cliente, url, parametros)
+                self.assertEqual(
+                    len(ejecutadas), CONSULTAS_POR_VISTA[nombre],
+                    '\n'.join(f'{i}. {sql}' for i, (sql, _, _) in enumerate(ejecutadas, 1)),
+                )
+
+    def test_todas_las_rutas_tienen_escenario(self):
+        from tienda_personalizados.urls import router
+        from tienda.urls import urlpatterns
+
+        escenarios = self.escenarios()
+        rutas = {patron.name for patron in [*urlpatterns, *router.urls]} - RUTAS_SIN_ESCENARIO
+        medidas = {resolve(urlsplit(url).path).url_name for _, url, _ in escenarios.values()}
+        self.assertFalse(rutas - medidas, 'Agrega un escenario (y su cantidad de consultas) para estas rutas')
+        registrados = {f'admin_{modelo._meta.model_name}' for modelo in admin.site._registry if modelo._meta.app_label == 'tienda'}
+        self.assertFalse(registrados - set(escenarios))
+
+    def test_vistas_calientes_no_recorren_tablas_enteras(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('EXPLAIN solo se interpreta en SQLite y PostgreSQL')
+        escenarios = self.escenarios()
+        for nombre in sorted(VISTAS_CALIENTES):
+            cliente, url, parametros = escenarios[nombre]
+            self.medir(cliente, url, parametros)
+            for sql, params, many in self.medir(cliente, url, parametros):
+                if many or not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                with self.subTest(nombre, sql=sql[:200]):
+                    self.assertEqual(recorridos_completos(sql, params), set())
 
-# Create your tests here.
@@ -0,0 +1,154 @@
+"""
+Transiciones de estado de los pedidos.
+
+``transicionar`` cambia el estado (del pedido o del pago) de un queryset
+completo en pocas sentencias, sin importar cuántos pedidos tenga:
+
+1. una consulta lee el estado actual de cada pedido (con bloqueo de filas en
+   PostgreSQL, con el bloqueo de escritura de la base en SQLite; ver
+   ``stock.transaccion_de_reserva``) y separa los que pueden pasar al estado
+   nuevo;
+2. un UPDATE por estado de origen cambia exactamente esos pedidos;
+3. ``bulk_create`` agrega las filas del historial (``PedidoEvento``) y el
+   resumen diario se ajusta con una escritura por grupo afectado.
+
+Los pedidos que ya están en el estado destino se omiten y los que no pueden
+llegar a él desde su estado actual se informan como rechazados.
+
+Al pasar a ``en_proceso`` cada pedido reserva los insumos de su producto;
+los que no tienen stock suficiente quedan en su estado (``sin_stock``). Al
+cancelarlos desde ``en_proceso`` se devuelve lo reservado (ver tienda/stock.py).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import resumen, stock
+from .seguimiento import invalidar_seguimiento
+
+TRANSICIONES = {
+    'estado_pedido': {
+        'solicitado': {'aprobado', 'cancelado'},
+        'aprobado': {'en_proceso', 'cancelado'},
+        'en_proceso': {'realizado', 'cancelado'},
+        'realizado': {'entregado'},
+        'entregado': {'finalizado'},
+        'finalizado': set(),
+        'cancelado': set(),
+    },
+    'estado_pago': {
+        'pendiente': {'parcial', 'pagado'},
+        'parcial': {'pagado'},
+        'pagado': set(),
+    },
+}
+
+
+class TransicionConcurrente(Exception):
+    """Un pedido cambió de estado entre la lectura y el UPDATE (no debería pasar con el bloqueo)"""
+
+
+class ResultadoTransicion:
+    def __init__(self, destino):
+        self.destino = destino
+        self.actualizados = []   # ids
+        self.omitidos = []       # ya estaban en el destino
+        self.rechazados = {}     # id -> estado actual
+        self.sin_stock = {}      # id -> {insumo_id: faltante}
+
+    def __len__(self):
+        return len(self.actualizados)
+
+
+def permitida(campo, origen, destino):
+    return destino in TRANSICIONES[campo].get(origen, ())
+
+
+def origenes_permitidos(campo, destino):
+    return [origen for origen, destinos in TRANSICIONES[campo].items() if destino in destinos]
+
+
+def transicionar(queryset, campo, destino, usuario=None, nota=''):
+    """
+    Lleva los pedidos de ``queryset`` al estado ``destino`` de ``campo``
+    ('estado_pedido' o 'estado_pago'). Devuelve un ``ResultadoTransicion``.
+    """
+    from .models import Pedido, PedidoEvento
+
+    if campo not in TRANSICIONES:
+        raise ValueError(f"Campo de estado desconocido: {campo}")
+    if destino not in TRANSICIONES[campo]:
+        raise ValueError(f"Estado desconocido para {campo}: {destino}")
+
+    resultado = ResultadoTransicion(destino)
+    mueve_stock = campo == 'estado_pedido' and any(
+        stock.movimiento_por_cambio(origen, destino) for origen in origenes_permitidos(campo, destino)
+    )
+    # También para estado_pago: en SQLite es lo que bloquea hasta confirmar
+    with stock.transaccion_de_reserva():
+        actuales = (
+            Pedido.objects.filter(pk__in=queryset.values('pk'))
+            .select_for_update()
+            .order_by('pk')
+            .values('pk', campo, *Pedido.CAMPOS_RESUMEN)
+        )
+        candidatos = []
+        for fila in actuales:
+            pk, origen = fila['pk'], fila[campo]
+            if origen == destino:
+                resultado.omitidos.append(pk)
+            elif permitida(campo, origen, destino):
+                candidatos.append(fila)
+            else:
+                resultado.rechazados[pk] = origen
+
+        if mueve_stock:
+            reservas = [
+                (fila['pk'], fila['producto_referencia_id']) for fila in candidatos
+                if stock.movimiento_por_cambio(fila[campo], destino) == 'reserva'
+            ]
+            if reservas:
+                resultado.sin_stock = stock.reservar(reservas, usuario=usuario)
+                candidatos = [fila for fila in candidatos if fila['pk'] not in resultado.sin_stock]
+            stock.liberar([
+                fila['pk'] for fila in candidatos
+                if stock.movimiento_por_cambio(fila[campo], destino) == 'liberacion'
+            ], usuario=usuario)
+
+        if not candidatos:
+            return resultado
+
+        cambios = []
+        por_origen = defaultdict(list)
+        diferencias = resumen.Diferencias()
+        for fila in candidatos:
+            cambios.append((fila['pk'], fila[campo]))
+            por_origen[fila[campo]].append(fila['pk'])
+            diferencias.restar(fila)
+            diferencias.sumar({**fila, campo: destino})
+
+        # Solo los pedidos leídos, y solo si siguen en el estado que se leyó:
+        # el historial y el resumen se calcularon con ese estado
+        ahora = timezone.now()
+        for origen, pks in por_origen.items():
+            actualizados = Pedido.objects.filter(pk__in=pks, **{campo: origen}).update(
+                **{campo: destino, 'fecha_actualizacion': ahora}
+            )
+            if actualizados != len(pks):
+                raise TransicionConcurrente(
+                    f"{len(pks) - actualizados} pedidos dejaron de estar en '{origen}' durante la transición"
+                )
+
+        PedidoEvento.objects.bulk_create([
+            PedidoEvento(
+                pedido_id=pk, campo=campo, estado_anterior=origen, estado_nuevo=destino,
+                usuario=usuario, nota=nota, fecha=ahora,
+            )
+            for pk, origen in cambios
+        ], batch_size=1000)
+        diferencias.aplicar()
+
+        resultado.actualizados = [pk for pk, _ in cambios]
+        transaction.on_commit(lambda: invalidar_seguimiento(*resultado.actualizados))
+    return resultado
@@ -5,13 +5,47 @@ from django.views.generic.edit import CreateView
 from django.urls import reverse_lazy
 from django.db.models import Q, Count, Sum
 from django.contrib import messages
-from .serializers import InsumoSerializer, PedidoSerializer
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.conf import settings
+from .serializers import AjustesStockSerializer, InsumoSerializer, PedidoSerializer, SerializadorRapido
+from .renderers import RenderizadorJSONRapido
 from .models import Insumo, Pedido, Producto
 from rest_framework import status ,request
 from rest_framework.response import Response #se añadio el response para que funcione el filtro 
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework import viewsets, mixins, generics
-from .filters import PedidoFilter
+from .filters import PedidoApiFilter, PedidoFilter
+from .instantanea import obtener_instantanea
+from .cache_paginas import cache_pagina, etiquetar
+from .paginacion import CursorInvalido, PaginacionPedidos, PaginadorCursor
+from .storage import es_nombre_por_contenido
+from . import exportacion, idempotencia, importacion, instrumentacion, metricas, perfilado, reportes, seguimiento, stock
+
+PRODUCTOS_POR_PAGINA = 12
+
+# Órdenes disponibles para el catálogo (siempre terminan en una columna única)
+ORDENES_CATALOGO = {
+    'id': ('id',),
+    'precio': ('precio_base', 'id'),
+}
+
+
+def paginar_catalogo(productos, request):
+    """Pagina por cursor una lista de productos de la instantánea"""
+    orden = ORDENES_CATALOGO.get(request.GET.get('orden'), ORDENES_CATALOGO['id'])
+    paginador = PaginadorCursor(Producto, orden, PRODUCTOS_POR_PAGINA)
+    try:
+        return paginador.paginar(productos, request.GET.get('cursor'))
+    except CursorInvalido:
+        return paginador.paginar(productos)
 
 from .models import Producto, Categoria, Pedido
 from .forms import SolicitudPedidoForm
@@ -20,51 +54,65 @@ from .forms import SolicitudPedidoForm
 # VISTAS BASADAS EN FUNCIONES
 # ============================================
 
+@cache_pagina
 def index(request):
     """Vista de inicio con productos destacados y categorías"""
-    productos_destacados = Producto.objects.filter(activo=True)[:6]
-    categorias = Categoria.objects.all()
-    return render(request, 'tienda/index.html', {
-        'productos_destacados': productos_destacados,
-        'categorias': categorias
+    instantanea = obtener_instantanea()
+    response = render(request, 'tienda/index.html', {
+        'productos_destacados': instantanea.destacados(6),
+        'categorias': instantanea.categorias
     })
+    return etiquetar(response, 'catalogo', 'categorias')
 
+@cache_pagina
 def catalogo(request):
     """Vista de catálogo con filtros y búsqueda"""
-    productos = Producto.objects.filter(activo=True)
+    instantanea = obtener_instantanea()
     categoria_id = request.GET.get('categoria')
     busqueda = request.GET.get('q')
     
-    if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
+    orden = request.GET.get('orden') if request.GET.get('orden') in ORDENES_CATALOGO else None
+    productos = instantanea.filtrar(categoria_id, ORDENES_CATALOGO[orden or 'id'])
+    cursor_siguiente = None
     
     if busqueda:
-        productos = productos.filter(
-            Q(nombre__icontains=busqueda) | 
-            Q(descripcion__icontains=busqueda)
-        )
+        # Búsqueda con índice de texto completo, ordenada por relevancia
+        # (el índice ya limita la cantidad de resultados, después de filtrar la categoría)
+        productos = instantanea.buscar(busqueda, productos, categoria_id)
+    else:
+        pagina = paginar_catalogo(productos, request)
+        productos = pagina.objetos
+        cursor_siguiente = pagina.siguiente
     
-    categorias = Categoria.objects.all()
-    return render(request, 'tienda/catalogo.html', {
+    response = render(request, 'tienda/catalogo.html', {
         'productos': productos,
-        'categorias': categorias,
+        'categorias': instantanea.categorias,
         'categoria_actual': categoria_id,
-        'busqueda': busqueda
+        'busqueda': busqueda,
+        'orden': orden,
+        'cursor_siguiente': cursor_siguiente,
+        'es_primera_pagina': not request.GET.get('cursor'),
     })
+    # El listado filtrado solo depende de su categoría; el completo, de todo el catálogo
+    listado = f'categoria:{categoria_id}' if categoria_id else 'catalogo'
+    return etiquetar(response, listado, 'categorias')
 
+@cache_pagina
 def detalle_producto(request, pk):
     """Vista de detalle de producto"""
-    producto = get_object_or_404(Producto, pk=pk, activo=True)
-    return render(request, 'tienda/detalle_producto.html', {'producto': producto})
+    # La plantilla muestra la categoría
+    producto = get_object_or_404(Producto.objects.select_related('categoria'), pk=pk, activo=True)
+    response = render(request, 'tienda/detalle_producto.html', {'producto': producto})
+    return etiquetar(response, f'producto:{producto.pk}', f'categoria:{producto.categoria_id}')
 
+@idempotencia.formulario_idempotente
 def solicitar_pedido(request):
     """Vista para solicitar pedido (versión basada en función)"""
     if request.method == 'POST':
         form = SolicitudPedidoForm(request.POST, request.FILES)
         if form.is_valid():
             pedido = form.save()
-            request.session['ultimo_pedido_id'] = pedido.id
-            request.session['token_seguimiento'] = str(pedido.token_seguimiento)
+            idempotencia.pedido_creado(request, pedido)
             
             messages.success(request, '¡Pedido enviado con éxito!')
             return redirect('tienda:pedido_exitoso')
@@ -109,14 +157,36 @@ def pedido_exitoso(request):
         messages.error(request, 'No se encontró el pedido.')
         return redirect('tienda:index')
 
+@cache_pagina
 def seguimiento_pedido(request, token):
-    """Vista de seguimiento de pedido"""
-    pedido = get_object_or_404(Pedido, token_seguimiento=token)
-    imagenes_referencia = pedido.imagenes_referencia.all()
-    return render(request, 'tienda/seguimiento_pedido.html', {
+    """Vista de seguimiento de pedido (cacheada por token; ver tienda/seguimiento.py)"""
+    if seguimiento.token_invalido(token):
+        raise Http404("Pedido no encontrado")
+    pedido, imagenes = seguimiento.cargar_pedido(token)
+    if pedido is None:
+        seguimiento.recordar_token_invalido(token)
+        raise Http404("Pedido no encontrado")
+
+    response = render(request, 'tienda/seguimiento_pedido.html', {
         'pedido': pedido,
-        'imagenes_referencia': imagenes_referencia
+        'imagenes_referencia': imagenes,
     })
+    return etiquetar(response, seguimiento.etiqueta(pedido.pk))
+
+def servir_media(request, path):
+    """
+    Sirve MEDIA_ROOT (desarrollo o despliegues sin servidor de estáticos).
+    Los archivos nombrados por su hash, y sus derivados, nunca cambian de
+    contenido: se marcan como inmutables con caché de un año.
+    """
+    from django.views.static import serve
+
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if es_nombre_por_contenido(path.split('_', 1)[0] if path.startswith('derivados/') else path):
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_INMUTABLE_SEGUNDOS}, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 # ============================================
 # VISTAS BASADAS EN CLASES (para mayor flexibilidad)
@@ -129,11 +199,11 @@ class IndexView(ListView):
     context_object_name = 'productos_destacados'
     
     def get_queryset(self):
-        return Producto.objects.filter(activo=True)[:6]
+        return obtener_instantanea().destacados(6)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categorias'] = Categoria.objects.all()
+        context['categorias'] = obtener_instantanea().categorias
         return context
 
 class CatalogoView(ListView):
@@ -141,24 +211,30 @@ class CatalogoView(ListView):
     model = Producto
     template_name = 'tienda/catalogo.html'
     context_object_name = 'productos'
-    paginate_by = 12
+    paginate_by = PRODUCTOS_POR_PAGINA
     
     def get_queryset(self):
-        queryset = Producto.objects.filter(activo=True)
-        categoria_id = self.request.GET.get('categoria')
-        if categoria_id:
-            queryset = queryset.filter(categoria_id=categoria_id)
-        return queryset
+        orden = ORDENES_CATALOGO.get(self.request.GET.get('orden'), ORDENES_CATALOGO['id'])
+        return obtener_instantanea().filtrar(self.request.GET.get('categoria'), orden)
+    
+    def paginate_queryset(self, queryset, page_size):
+        # Paginación por cursor en vez de ?page=N
+        pagina = paginar_catalogo(queryset, self.request)
+        return (None, pagina, pagina.objetos, pagina.siguiente is not None)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categorias'] = Categoria.objects.all()
+        context['categorias'] = obtener_instantanea().categorias
         context['categoria_actual'] = self.request.GET.get('categoria')
+        context['orden'] = self.request.GET.get('orden')
+        context['cursor_siguiente'] = context['page_obj'].siguiente
+        context['es_primera_pagina'] = not self.request.GET.get('cursor')
         return context
 
 class DetalleProductoView(DetailView):
     """Vista de detalle de producto basada en clase"""
     model = Producto
+    queryset = Producto.objects.select_related('categoria')
     template_name = 'tienda/detalle_producto.html'
     context_object_name = 'producto'
 
@@ -169,6 +245,10 @@ class SolicitarPedidoView(CreateView):
     template_name = 'tienda/solicitar_pedido.html'
     success_url = reverse_lazy('tienda:pedido_exitoso')
     
+    @method_decorator(idempotencia.formulario_idempotente)
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+    
     def get_initial(self):
         initial = super().get_initial()
         producto_id = self.request.GET.get('producto')
@@ -183,8 +263,7 @@ class SolicitarPedidoView(CreateView):
     def form_valid(self, form):
         response = super().form_valid(form)
         # Guardar el ID del pedido en la sesión para mostrarlo en la página de éxito
-        self.request.session['ultimo_pedido_id'] = self.object.id
-        self.request.session['token_seguimiento'] = str(self.object.token_seguimiento)
+        idempotencia.pedido_creado(self.request, self.object)
         
         # Agregar mensaje de éxito
         messages.success(self.request, '¡Pedido enviado con éxito!')
@@ -196,10 +275,49 @@ class SolicitarPedidoView(CreateView):
         return super().form_invalid(form)
 
 
-class InsumoViewSet(viewsets.ModelViewSet):
+class LecturaRapidaMixin:
+    """El listado sale de .values() con SerializadorRapido: mismo JSON, sin instanciar modelos"""
+    renderer_classes = [RenderizadorJSONRapido, BrowsableAPIRenderer]
+
+    def list(self, request, *args, **kwargs):
+        serializador = SerializadorRapido(self.get_serializer())
+        filas = serializador.consulta(self.filter_queryset(self.get_queryset()))
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(serializador.serializar(pagina))
+        return Response(serializador.serializar(filas))
+
+
+class InsumoViewSet(LecturaRapidaMixin, viewsets.ModelViewSet):
     queryset = Insumo.objects.all()
     serializer_class = InsumoSerializer
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def ajustar(self, request):
+        """Variaciones de stock en lote. Ruta: POST /api/insumos/ajustar/
+        {"ajustes": [{"insumo": 1, "cantidad": 50, "version": 3}, ...], "motivo": "reposicion", "nota": "..."}
+        Se aplican todas o ninguna: 409 si algún insumo cambió de versión, 400 si alguno quedaría con stock negativo"""
+        datos = AjustesStockSerializer(data=request.data)
+        datos.is_valid(raise_exception=True)
+        try:
+            resultado = stock.ajustar_stock(
+                datos.validated_data['ajustes'], datos.validated_data['motivo'],
+                usuario=request.user, nota=datos.validated_data['nota'],
+            )
+        except stock.AjusteRechazado as e:
+            codigo = status.HTTP_409_CONFLICT if e.conflicto else status.HTTP_400_BAD_REQUEST
+            return Response({'errores': {str(pk): mensaje for pk, mensaje in e.errores.items()}}, status=codigo)
+        return Response({'insumos': [
+            {'id': pk, 'cantidad_disponible': cantidad, 'version': version}
+            for pk, (cantidad, version) in resultado.items()
+        ]})
+
+    @action(detail=False)
+    def bajo_stock(self, request):
+        """Insumos con menos de stock.STOCK_BAJO unidades, del más escaso al más abundante. Ruta: GET /api/insumos/bajo_stock/"""
+        serializador = SerializadorRapido(self.get_serializer())
+        return Response(serializador.serializar(serializador.consulta(stock.bajo_stock(self.get_queryset()))))
+
 
 class PedidoViewSet(
     mixins.CreateModelMixin,
@@ -210,38 +328,116 @@ class PedidoViewSet(
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
 
+    def create(self, request, *args, **kwargs):
+        """Con la cabecera Idempotency-Key, un reintento devuelve la respuesta original
+        (con su token_seguimiento) sin crear otro pedido: 409 si el primero sigue en curso,
+        422 si la clave ya se usó con otros datos"""
+        clave = request.META.get(idempotencia.CABECERA)
+        if clave is None:
+            return super().create(request, *args, **kwargs)
+        if not idempotencia.clave_valida(clave):
+            return Response({'detail': 'Idempotency-Key inválida.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        huella = idempotencia.huella(request.data)
+        try:
+            registro = idempotencia.iniciar('api', clave, huella)
+        except idempotencia.EnCurso:
+            return Response({'detail': 'Hay un envío en curso con esta Idempotency-Key.'}, status=status.HTTP_409_CONFLICT)
+        except idempotencia.ClaveReutilizada:
+            return Response({'detail': 'La Idempotency-Key ya se usó con otros datos.'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if registro is not None:
+            return Response(registro['datos'], status=registro['estado'], headers={'Idempotent-Replayed': 'true'})
+
+        completado = False
+        try:
+            respuesta = super().create(request, *args, **kwargs)
+            if status.is_success(respuesta.status_code):
+                idempotencia.completar('api', clave, {'estado': respuesta.status_code, 'datos': respuesta.data}, huella)
+                completado = True
+            return respuesta
+        finally:
+            if not completado:
+                idempotencia.cancelar('api', clave)
+
 @api_view(['GET'])
+@renderer_classes([RenderizadorJSONRapido, BrowsableAPIRenderer])
 def filtro_pedidos(request):
-    """API que se usa para filtrar los pedidos por rango de fechas, estado y limite de resultado Ruta: /api/pedidos/filtrar/?fecha_inicio=...&fecha_fin=...&estado=...&limite=..."""
-#los diferentes criterios del filtro
-    pedidos = Pedido.objects.all()
-    fecha_inicio = request.GET.get('fecha_inicio')
-    fecha_fin = request.GET.get('fecha_fin')
-    estados_str = request.GET.get('estado_pedido')
-    limite = request.GET.get('limite')
+    """API que se usa para filtrar los pedidos. Ruta: /api/pedidos/filtrar/?fecha_inicio=...&fecha_fin=...&estado_pedido=...&plataforma=...&estado_pago=...&email=...&fields=...
+    Las fechas (AAAA-MM-DD) incluyen el día final; estado_pedido, plataforma y estado_pago aceptan varios valores (repetidos o separados por comas).
+    Siempre responde paginado por cursor, del más reciente al más antiguo: {"next": url, "results": [...]}, con ?tamano=N (o ?limite=N, máximo 1000).
+    Con ?fields=id,estado_pedido,... solo se leen y devuelven esas columnas"""
+    filtro = PedidoApiFilter(request.GET, queryset=Pedido.objects.all())
+    if not filtro.is_valid():
+        return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+    pedidos = filtro.qs
 
-#filtrar por rango de fechas (usando fecha_creacion)
-    if fecha_inicio and fecha_fin:
-       pedidos = pedidos.filter(fecha_creacion_date_range=[fecha_inicio, fecha_fin])
+#proyeccion de columnas (?fields=...)
+    campos = None
+    if request.GET.get('fields'):
+        campos = [campo.strip() for campo in request.GET['fields'].split(',') if campo.strip()]
+        desconocidos = set(campos) - set(PedidoSerializer().fields)
+        if desconocidos:
+            return Response({'fields': [f'Campos desconocidos: {", ".join(sorted(desconocidos))}.']}, status=status.HTTP_400_BAD_REQUEST)
 
-#filtrar por estados (acepta multiples estados separados por comas)
-    if estados_str:
-       estados_list = [e.strip() for e in estados_str.split(',')]
-       pedidos = pedidos.filter(estado_pedido__in=estados_list)
+#paginacion por cursor (?cursor=...&tamano=...): orden estable por fecha e id
+#las filas se leen con .values() (solo las columnas pedidas y las del orden) y se serializan sin instanciar modelos
+    serializador = SerializadorRapido(PedidoSerializer(campos=campos))
+    paginacion = PaginacionPedidos()
+    pagina = paginacion.paginate_queryset(serializador.consulta(pedidos, 'id', 'fecha_creacion'), request)
+    return paginacion.get_paginated_response(serializador.serializar(pagina))
 
-#Limitar resultados de busqueda
+#ejemplos de filtros
+#filtro de tamaño de pagina: http://127.0.0.1:8000/api/pedidos/filtrar/?tamano=2
+#filtro de estado: http://127.0.0.1:8000/api/pedidos/filtrar/?estado_pedido=finalizado,entregado
+#proyeccion: http://127.0.0.1:8000/api/pedidos/filtrar/?fecha_inicio=2025-01-01&fecha_fin=2025-01-31&fields=id,estado_pedido
 
-    if limite and limite.isdigit():
-        pedidos = pedidos[:int(limite)]
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def importar_pedidos(request):
+    """Importa pedidos desde un CSV/JSONL. Ruta: POST /api/pedidos/importar/
+    Campos: archivo (obligatorio), formato (csv|jsonl, por defecto según la extensión) y plataforma (para las filas que no la traen).
+    Responde {"creados": N, "total_errores": M, "errores": [{"linea": 3, "error": "..."}]}"""
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({'archivo': ['Debe adjuntar un archivo CSV o JSONL.']}, status=status.HTTP_400_BAD_REQUEST)
 
+    formato = request.data.get('formato') or importacion.detectar_formato(archivo.name)
+    if formato not in importacion.FORMATOS:
+        return Response({'formato': [f'Use uno de: {", ".join(importacion.FORMATOS)}.']}, status=status.HTTP_400_BAD_REQUEST)
 
-#seralizar y retornar usando PedidoSealizer
-    serializer = PedidoSerializer(pedidos, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    plataforma = request.data.get('plataforma')
+    valores = {'plataforma': plataforma} if plataforma else {}
+    try:
+        resultado = importacion.importar_pedidos(archivo, formato, valores)
+    except ValidationError as e:
+        return Response({'archivo': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(resultado.como_dict(), status=status.HTTP_201_CREATED if resultado.creados else status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportar_pedidos(request):
+    """Exporta los pedidos filtrados. Ruta: /api/pedidos/exportar/?formato=csv|xlsx&gzip=1&fecha_inicio=...&fecha_fin=...&estado=...&plataforma=...&estado_pedido=a,b
+    Acepta los filtros de PedidoFilter y de filtro_pedidos. El CSV se envía a medida que se lee; el XLSX se arma
+    completo antes del primer byte y admite hasta XLSX_MAXIMO_FILAS pedidos (más: 400, use CSV)"""
+    pedidos, errores = exportacion.filtrar_pedidos(request.GET)
+    if errores:
+        return Response(errores, status=status.HTTP_400_BAD_REQUEST)
+
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        return Response({'formato': [f'Use uno de: {", ".join(exportacion.FORMATOS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        trozos, tipo, nombre = exportacion.exportar(pedidos, formato, gzip=request.GET.get('gzip') in ('1', 'true'))
+    except (exportacion.XlsxNoDisponible, exportacion.XlsxDemasiadoGrande) as e:
+        return Response({'formato': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+    respuesta = StreamingHttpResponse(trozos, content_type=tipo)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
 
-#ejemplos de filtros
-#filtro de limite(o cantidad): http://127.0.0.1:8000/api/pedidos/filtrar/?limite=2
-#filtro de estado: http://127.0.0.1:8000/api/pedidos/filtrar/?estado_pedido=finalizado
 
 class ReporteView(LoginRequiredMixin, TemplateView):
     template_name = 'reporte/reportebase.html'
@@ -250,33 +446,85 @@ class ReporteView(LoginRequiredMixin, TemplateView):
         
         context = super().get_context_data(**kwargs)
         
-        filtro = PedidoFilter(self.request.GET, queryset=Pedido.objects.all())
-        pedidos_filtrados = filtro.qs
-
-        pedidos_por_estado = list(Pedido.objects.values('estado_pedido').annotate(
-            conteo=Count('id')
-        ).order_by('-conteo')
-        )
-
-        pedidos_por_plataforma = list(Pedido.objects.values('plataforma').annotate(
-            conteo=Count('id'))
-        )
-
-        productos_solicitados = pedidos_filtrados.values(
-        'producto_referencia__nombre'
-        ).annotate(
-        conteo=Count('producto_referencia')
-        ).exclude(producto_referencia__nombre__isnull=True).order_by('-conteo')[:5]
-
-        total_aprobado = pedidos_filtrados.filter(estado_pedido='aprobado').aggregate(
-           total=Sum('presupuesto_aprobado')
-           )['total'] or 0
+        # El formulario de filtros sigue siendo el de PedidoFilter, pero las
+        # cifras salen del resumen diario ya filtrado (tienda/reportes.py)
+        filtro = PedidoFilter(self.request.GET, queryset=Pedido.objects.none())
+        reporte = reportes.calcular_reporte(reportes.filtrar(filtro))
         
         context['filtro'] = filtro
-        context['pedidos_por_estado'] = pedidos_por_estado
-        context['pedidos_por_plataforma'] = pedidos_por_plataforma
-        context['productos_solicitados'] = productos_solicitados
-        context['total_pedidos_filtrados'] = pedidos_filtrados.count()
-        context['total_valor_aprobado'] = total_aprobado
+        context['pedidos_por_estado'] = reporte['por_estado']
+        context['pedidos_por_plataforma'] = reporte['por_plataforma']
+        context['productos_solicitados'] = reporte['productos']
+        context['total_pedidos_filtrados'] = reporte['total_pedidos']
+        context['total_valor_aprobado'] = reporte['total_aprobado']
     
         return context
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reporte_pedidos(request):
+    """Cifras del reporte en JSON. Ruta: /api/pedidos/reporte/?fecha_inicio=...&fecha_fin=...&estado=...&plataforma=...
+    Acepta los mismos filtros que la página del reporte (fechas inclusive, estado repetible)"""
+    filtro = PedidoFilter(request.GET, queryset=Pedido.objects.none())
+    if filtro.is_bound and not filtro.form.is_valid():
+        return Response(filtro.form.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(reportes.calcular_reporte(reportes.filtrar(filtro)))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metricas_pedidos(request):
+    """Pedidos y valor aprobado por periodo. Ruta: /api/metricas/pedidos/?periodo=dia|semana|mes&por=plataforma|estado_pedido&fecha_inicio=...&fecha_fin=...
+    Acepta además los filtros del reporte (estado, plataforma). Si todos los periodos ya terminaron, la respuesta se puede guardar en caché más tiempo"""
+    periodo = request.GET.get('periodo', 'dia')
+    por = request.GET.get('por') or None
+    if periodo not in metricas.PERIODOS:
+        return Response({'periodo': [f'Use uno de: {", ".join(metricas.PERIODOS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+    if por is not None and por not in metricas.DIMENSIONES:
+        return Response({'por': [f'Use uno de: {", ".join(metricas.DIMENSIONES)}.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    filtro = PedidoFilter(request.GET, queryset=Pedido.objects.none())
+    if not filtro.form.is_valid():
+        return Response(filtro.form.errors, status=status.HTTP_400_BAD_REQUEST)
+    datos = filtro.form.cleaned_data
+
+    resultado = metricas.series(
+        reportes.filtrar(filtro, fechas=False), periodo, por,
+        desde=datos.get('fecha_inicio'), hasta=datos.get('fecha_fin'),
+    )
+    respuesta = Response(resultado)
+    segundos = settings.METRICAS_CACHE_CERRADOS_SEGUNDOS if resultado['cerrado'] else settings.METRICAS_CACHE_ABIERTOS_SEGUNDOS
+    patch_cache_control(respuesta, private=True, max_age=segundos)
+    return respuesta
+
+
+def metricas_prometheus(request):
+    """Métricas de Prometheus (latencia, consultas y plantillas por vista). Ruta: /metrics
+    Con METRICAS_TOKEN se pide la cabecera Authorization: Bearer <token>; sin él, solo el staff"""
+    token = settings.METRICAS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not request.user.is_staff:
+        return HttpResponseForbidden()
+    contenido, tipo = instrumentacion.exportar()
+    return HttpResponse(contenido, content_type=tipo)
+
+
+@staff_member_required
+def perfiles(request):
+    """Perfiles guardados por PerfiladoMiddleware, del más reciente al más antiguo. Ruta: /admin/perfiles/"""
+    return render(request, 'admin/perfiles.html', {
+        'title': 'Perfiles de peticiones',
+        'perfiles': perfilado.listar(),
+        'cabecera': perfilado.firmar(),
+    })
+
+
+@staff_member_required
+def descargar_perfil(request, nombre):
+    ruta = perfilado.ruta(nombre)
+    if ruta is None:
+        raise Http404("Perfil no encontrado")
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)
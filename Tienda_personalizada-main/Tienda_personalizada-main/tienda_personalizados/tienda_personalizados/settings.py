@@ -41,12 +41,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para medir la petición completa (ver tienda/instrumentacion.py)
+    'tienda.instrumentacion.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tienda.perfilado.PerfiladoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +88,73 @@ if DATABASES ['default'].get('ENGINE') and DATABASES['default']['ENGINE'].starts
     DATABASES['default']['OPTIONS']= {'sslmode': 'require'}
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con DJANGO_CACHE_DIR se usa un cache en archivos, compartido por todos los
+# workers de gunicorn del servidor. Sin el, cada worker tiene su propio cache
+# en memoria: las purgas del cache de paginas y del seguimiento (al editar un
+# producto o un pedido) solo llegan al worker que hizo el cambio y los demas
+# siguen sirviendo su copia hasta CACHE_PAGINAS_SEGUNDOS. Con varios workers
+# conviene definir DJANGO_CACHE_DIR (o un backend compartido como Redis).
+
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# La version del catalogo (instantanea en memoria y tabla de precios) vive en
+# la base, compartida por todos los workers; cada worker la vuelve a leer como
+# mucho cada CATALOGO_VERSION_SEGUNDOS, el retraso maximo con que ve un cambio
+CATALOGO_VERSION_SEGUNDOS = 5
+
+# Cache de paginas completas de la tienda (inicio, catalogo, detalle, seguimiento)
+CACHE_PAGINAS_ALIAS = 'default'
+CACHE_PAGINAS_SEGUNDOS = 600
+
+# Tokens de seguimiento inexistentes: se recuerdan para no consultar la BD
+SEGUIMIENTO_TOKEN_INVALIDO_SEGUNDOS = 60
+
+# API de métricas: tiempo en caché (del navegador) cuando todos los periodos
+# pedidos ya terminaron y cuando incluyen el periodo en curso
+METRICAS_CACHE_CERRADOS_SEGUNDOS = 60 * 60 * 24
+METRICAS_CACHE_ABIERTOS_SEGUNDOS = 60
+
+# Exportación de pedidos: el XLSX se arma completo antes de enviar el primer
+# byte, así que se limita para no pasar el timeout; para más pedidos, CSV
+XLSX_MAXIMO_FILAS = 100000
+
+# Claves de idempotencia de la creación de pedidos (formulario y API). Se
+# guardan en la base (ClaveIdempotencia), compartidas por todos los workers;
+# las vencidas se borran con `manage.py purgar_idempotencia`
+IDEMPOTENCIA_SEGUNDOS = 60 * 60 * 24
+# Marca de un envío en curso: debe durar más que el timeout de gunicorn y del
+# proxy, para que un reintento no la reemplace mientras el primero sigue vivo
+IDEMPOTENCIA_EN_CURSO_SEGUNDOS = 60 * 10
+
+# Métricas de Prometheus en /metrics. Con METRICAS_TOKEN se exige la cabecera
+# "Authorization: Bearer <token>"; sin él, solo las ve el staff
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+# Veces que una misma consulta puede repetirse en una petición antes de contarla como N+1
+METRICAS_N_MAS_UNO_UMBRAL = 10
+METRICAS_PLANTILLAS = True
+
+# Perfilado de peticiones sueltas (staff con ?perfilar=1 o cabecera X-Perfilar
+# firmada; ver tienda/perfilado.py). Los perfiles se listan en /admin/perfiles/
+PERFILADO_ACTIVO = True
+PERFILADO_DIR = os.environ.get('PERFILADO_DIR', os.path.join(BASE_DIR, 'perfiles'))
+PERFILADO_MAXIMO = 50
+PERFILADO_FIRMA_SEGUNDOS = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -138,3 +208,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Las imágenes se guardan con el hash de su contenido (tienda/storage.py), así
+# que se pueden servir con caché inmutable. En producción lo ideal es que el
+# servidor web sirva MEDIA_ROOT con esas mismas cabeceras.
+SERVIR_MEDIA = DEBUG
+MEDIA_CACHE_INMUTABLE_SEGUNDOS = 60 * 60 * 24 * 365
+
+# Imagenes de referencia de los pedidos: se dejan en espera fuera de MEDIA_ROOT
+# y un pool de hilos las valida, reduce y guarda (ver tienda/procesamiento.py)
+PROCESAMIENTO_STAGING_DIR = os.environ.get('PROCESAMIENTO_STAGING_DIR', os.path.join(BASE_DIR, 'staging'))
+PROCESAMIENTO_WORKERS = 2
+PROCESAMIENTO_SINCRONO = False
+# Un archivo tomado por un proceso que no lo termino se vuelve a procesar despues de este tiempo
+PROCESAMIENTO_ABANDONADO_SEGUNDOS = 600
+IMAGEN_REFERENCIA_LADO_MAXIMO = 2048
+
+# Imagenes sin derivados (subidas antiguas, conversiones fallidas): cada worker
+# recuerda por este tiempo que no los tienen, en vez de consultar el storage en cada render
+DERIVADOS_AUSENTES_SEGUNDOS = 60
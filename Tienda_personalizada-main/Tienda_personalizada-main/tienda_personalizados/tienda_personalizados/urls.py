@@ -1,10 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
 # Importamos las vistas y viewsets necesarias para la API ademas del defaultrouter
-from tienda.views import InsumoViewSet, PedidoViewSet, filtro_pedidos
+from tienda.views import InsumoViewSet, PedidoViewSet, descargar_perfil, exportar_pedidos, filtro_pedidos, importar_pedidos, metricas_pedidos, metricas_prometheus, perfiles, reporte_pedidos, servir_media
 from rest_framework.routers import DefaultRouter
 
 # Configuración del Router para que la API funcione
@@ -13,12 +13,20 @@ router.register(r'insumos', InsumoViewSet, basename='insumo')
 router.register(r'pedidos', PedidoViewSet, basename='pedido')
 
 urlpatterns = [
+    # Antes del admin para que sus rutas no las tomen
+    path('admin/perfiles/', perfiles, name='perfiles'),
+    path('admin/perfiles/<str:nombre>', descargar_perfil, name='descargar-perfil'),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
+    path('metrics', metricas_prometheus, name='metricas-prometheus'),
 
     # 1. Rutas de la API
     # Primero ee mapeo el filtro para que no cause conflictos con el resto de las api
     path('api/pedidos/filtrar/', filtro_pedidos, name='api-filtro-pedidos'),
+    path('api/pedidos/importar/', importar_pedidos, name='api-importar-pedidos'),
+    path('api/pedidos/exportar/', exportar_pedidos, name='api-exportar-pedidos'),
+    path('api/pedidos/reporte/', reporte_pedidos, name='api-reporte-pedidos'),
+    path('api/metricas/pedidos/', metricas_pedidos, name='api-metricas-pedidos'),
     
     # Luego asociamos todas las rutas con la API (insumos, pedidos, etc.)
     path('api/', include(router.urls)),
@@ -28,6 +36,12 @@ urlpatterns = [
     path('', include('tienda.urls', namespace='tienda')),
 ]
 
+if settings.SERVIR_MEDIA:
+    # Archivos subidos, con caché inmutable para los nombrados por contenido
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), servir_media, name='media'),
+    ]
+
 #if settings.DEBUG:
     #urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 